@@ -0,0 +1,137 @@
+"""
+Offline comparison of the standard splitter and parent-child chunking (Config.CHUNKING_MODE).
+Ingests the same synthetic corpus with both modes and reports index size, ingest time, retrieval latency
+and hit precision: the share of returned passages that come from the page the query asks about
+(every synthetic page starts with a unique part number, which the queries mention).
+
+Usage:
+    python -m benchmarks.bench_chunking --size 5000 --queries 200
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_pipeline import RESULTS_DIR, _configure, _git_commit, _latency_summary
+from src.fake_models import FakeEmbeddings
+from benchmarks.synthetic_corpus import generate_corpus
+from configs.config import Config
+
+
+def _dir_size(path: Path) -> int:
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    # SQLite files count together with their -wal and -shm sidecars.
+    return sum(f.stat().st_size for f in path.parent.glob(f"{path.name}*") if f.is_file())
+
+
+def _page_queries(vm, n: int, seed: int = 7):
+    """Samples (query, source, page) triples from the stored pages."""
+    rng = random.Random(seed)
+    pages = set()
+    data = vm.vector_store.get(include=["metadatas"])
+    for meta in data["metadatas"]:
+        pages.add((meta["source"], meta["page"]))
+    pages = sorted(pages)
+    samples = []
+    for _ in range(n):
+        source, page = rng.choice(pages)
+        doc_index = int(source.split("_")[1].split(".")[0])
+        samples.append((f"What does PN-{doc_index:05d}-{page:04d} describe?", source, page))
+    return samples
+
+
+def bench_mode(mode: str, args, work_dir: Path, corpus_dir: Path) -> dict:
+    from src.vector_store import VectorStoreManager
+
+    _configure(work_dir)
+    Config.CHUNKING_MODE = mode
+    Config.VECTOR_BACKEND = args.backend
+    Config.RETRIEVAL_MODE = "similarity"
+    paths = sorted(corpus_dir.glob("*.pdf"))
+    vm = VectorStoreManager(embeddings=FakeEmbeddings(size=args.dim), embedding_model_name="benchmark-fake")
+
+    start = time.perf_counter()
+    state, msg = vm.add_pdfs(paths, workers=args.workers)
+    ingest_s = time.perf_counter() - start
+    print(f"[{mode}] {msg}")
+
+    data = vm.vector_store.get(include=["documents", "metadatas"])
+    stored_text = sum(len(text or "") for text in data["documents"])
+    stored_metadata = sum(len(json.dumps(meta)) for meta in data["metadatas"])
+    vector_path = Config.LOCAL_INDEX_PATH if args.backend == "local" else Config.CHROMA_DB_PATH
+    result = {
+        "mode": mode,
+        "ingest": {"state": state, "seconds": round(ingest_s, 3)},
+        "index": {
+            "embedded_chunks": vm.vector_store.count(),
+            "parent_passages": vm.docstore.count(),
+            "vector_text_chars": stored_text,
+            "vector_metadata_chars": stored_metadata,
+            "docstore_compressed_bytes": vm.docstore.size_bytes(),
+            "vector_store_bytes": _dir_size(vector_path),
+            "keyword_index_bytes": _dir_size(Config.KEYWORD_INDEX_PATH),
+            "docstore_bytes": _dir_size(Config.PARENT_DOCSTORE_PATH),
+        },
+    }
+
+    for rerank in (False, True):
+        Config.RERANK_ENABLED = rerank
+        retriever = vm.get_retriever()
+        latencies, precision, context_chars = [], [], []
+        for query, source, page in _page_queries(vm, args.queries):
+            start = time.perf_counter()
+            docs = retriever.invoke(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits = sum(1 for doc in docs if doc.metadata.get("source") == source and doc.metadata.get("page") == page)
+            precision.append(hits / len(docs) if docs else 0.0)
+            context_chars.append(sum(len(doc.page_content) for doc in docs))
+        result["rerank" if rerank else "similarity"] = {
+            "latency": _latency_summary(latencies),
+            "precision": round(sum(precision) / len(precision), 4),
+            "context_chars": round(sum(context_chars) / len(context_chars), 1),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Standard vs parent-child chunking, offline with fake embeddings.")
+    parser.add_argument("--size", type=int, default=2000, help="Corpus size in standard chunks")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per retrieval run")
+    parser.add_argument("--workers", type=int, default=None, help="Ingest worker processes")
+    parser.add_argument("--backend", default=Config.VECTOR_BACKEND, choices=["chroma", "local"])
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension of the fake embedder")
+    parser.add_argument("--output", default=None, help="Result file (default benchmarks/results/chunking-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    base_dir = Path(tempfile.mkdtemp(prefix="raggy_bench_chunking_"))
+    try:
+        generate_corpus(base_dir / "corpus", args.size)
+        report = {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+            "results": [bench_mode(mode, args, base_dir / mode, base_dir / "corpus")
+                        for mode in ("standard", "parent_child")],
+        }
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    for result in report["results"]:
+        index = result["index"]
+        print(f"{result['mode']:>12}: {index['embedded_chunks']} embedded chunks, "
+              f"{index['vector_store_bytes'] / 1e6:.1f} MB vector store, "
+              f"similarity p50 {result['similarity']['latency']['p50_ms']} ms, "
+              f"precision {result['similarity']['precision']}")
+    output = Path(args.output) if args.output else RESULTS_DIR / f"chunking-{commit[:10]}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
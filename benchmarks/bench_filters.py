@@ -0,0 +1,120 @@
+"""
+Offline benchmark of scoped retrieval (src/retrieval_filter.py): latency of the vector search, the keyword search
+and the complete hybrid retriever without a filter and with filters of decreasing selectivity, plus the share of
+results from the page the query asks about. Query embeddings are computed before timing, so the vector numbers
+are pure index time. The vector search is timed twice per query: "vector_first" includes resolving a new scope,
+"vector" is the next question in the same scope, as in a chat that keeps its document selection.
+
+Usage:
+    python -m benchmarks.bench_filters --size 20000 --backend local
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_chunking import _page_queries
+from benchmarks.bench_pipeline import RESULTS_DIR, _configure, _git_commit, _latency_summary
+from src.fake_models import FakeEmbeddings
+from benchmarks.synthetic_corpus import generate_corpus
+from configs.config import Config
+from src.retrieval_filter import build_filter
+
+
+def _scopes(source: str, page: int, sources: list, rng: random.Random) -> dict:
+    """Filters of one query, from the whole corpus down to a few pages of the document it asks about."""
+    others = rng.sample([name for name in sources if name != source], min(9, len(sources) - 1))
+    return {
+        "global": None,
+        "ingested today": build_filter(ingested_after=time.strftime("%Y-%m-%d")),
+        "10 documents": build_filter(sources=[source, *others]),
+        "1 document": build_filter(sources=source),
+        "1 document, 3 pages": build_filter(sources=source, pages=(page, page + 2)),
+    }
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Global vs scoped retrieval, offline with fake embeddings.")
+    parser.add_argument("--size", type=int, default=20000, help="Corpus size in chunks")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per scope")
+    parser.add_argument("--workers", type=int, default=None, help="Ingest worker processes")
+    parser.add_argument("--backend", default=Config.VECTOR_BACKEND, choices=["chroma", "local"])
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension of the fake embedder")
+    parser.add_argument("--output", default=None, help="Result file (default benchmarks/results/filters-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    base_dir = Path(tempfile.mkdtemp(prefix="raggy_bench_filters_"))
+    try:
+        from src.vector_store import VectorStoreManager
+        _configure(base_dir)
+        Config.VECTOR_BACKEND = args.backend
+        Config.RETRIEVAL_MODE = "hybrid"
+        Config.RERANK_ENABLED = False
+        embeddings = FakeEmbeddings(size=args.dim)
+        paths, _ = generate_corpus(base_dir / "corpus", args.size)
+        vm = VectorStoreManager(embeddings=embeddings, embedding_model_name="benchmark-fake")
+        state, msg = vm.add_pdfs(paths, workers=args.workers)
+        print(msg)
+        sources = vm.list_pdfs()
+        retriever = vm.get_retriever()
+        rng = random.Random(11)
+
+        samples = {}
+        for query, source, page in _page_queries(vm, args.queries):
+            embedding = embeddings.embed_query(query)
+            for scope, where in _scopes(source, page + 1, sources, rng).items():
+                stats = samples.setdefault(scope, {"vector_first": [], "vector": [], "keyword": [], "retriever": [],
+                                                   "precision": []})
+                _, first_ms = _timed(vm.vector_store.similarity_search_by_vector, embedding, k=Config.RETRIEVAL_K,
+                                     filter=where)
+                _, vector_ms = _timed(vm.vector_store.similarity_search_by_vector, embedding, k=Config.RETRIEVAL_K,
+                                      filter=where)
+                _, keyword_ms = _timed(vm.keyword_index.search, query, k=Config.RETRIEVAL_K, filter=where)
+                docs, retriever_ms = _timed(retriever.invoke, query, filter=where)
+                hits = sum(1 for doc in docs if doc.metadata.get("source") == source and doc.metadata.get("page") == page)
+                stats["vector_first"].append(first_ms)
+                stats["vector"].append(vector_ms)
+                stats["keyword"].append(keyword_ms)
+                stats["retriever"].append(retriever_ms)
+                stats["precision"].append(hits / len(docs) if docs else 0.0)
+
+        results = {
+            scope: {
+                **{stage: _latency_summary(stats[stage]) for stage in ("vector_first", "vector", "keyword", "retriever")},
+                "precision": round(sum(stats["precision"]) / len(stats["precision"]), 4),
+            }
+            for scope, stats in samples.items()
+        }
+        report = {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+            "corpus": {"documents": len(sources), "chunks": vm.vector_store.count(), "ingest_state": state},
+            "results": results,
+        }
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    for scope, result in results.items():
+        print(f"{scope:>20}: vector p50 {result['vector_first']['p50_ms']:7.2f} ms first, "
+              f"{result['vector']['p50_ms']:7.2f} ms next, "
+              f"keyword p50 {result['keyword']['p50_ms']:7.2f} ms, "
+              f"hybrid p50 {result['retriever']['p50_ms']:7.2f} ms, precision {result['precision']}")
+    output = Path(args.output) if args.output else RESULTS_DIR / f"filters-{commit[:10]}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
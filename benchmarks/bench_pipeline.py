@@ -0,0 +1,210 @@
+"""
+Offline benchmark of the RAGgy pipeline.
+Runs the real VectorStoreManager and RAGgy_Engine against the local fake models in src/fake_models.py on
+synthetic PDF corpora and writes the results as JSON, so runs can be compared across commits.
+
+Usage:
+    python -m benchmarks.bench_pipeline --sizes 10,1000,100000 --concurrency 1,8,32
+"""
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from src.fake_models import FakeChatModel, FakeEmbeddings
+from benchmarks.synthetic_corpus import generate_corpus
+from configs.config import Config
+from src.instrumentation import Instrumentation
+
+RESULTS_DIR = Config.ROOT_DIR / "benchmarks" / "results"
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=Config.ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def _peak_rss_mb() -> dict:
+    """Peak resident set size of this process and of all finished child processes (ingest workers)."""
+    # ru_maxrss is reported in KiB on Linux and in bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def _latency_summary(samples_ms: List[float]) -> dict:
+    if not samples_ms:
+        return {"n": 0}
+    values = np.asarray(samples_ms)
+    return {
+        "n": len(samples_ms),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def _configure(work_dir: Path):
+    """Points every persistent store at a fresh directory and disables the answer cache."""
+    Config.PDF_DIRECTORY = work_dir / "raw"
+    Config.CHROMA_DB_PATH = work_dir / "chroma_db"
+    Config.LOCAL_INDEX_PATH = work_dir / "local_index"
+    Config.REGISTRY_DB_PATH = work_dir / "document_registry.sqlite3"
+    Config.KEYWORD_INDEX_PATH = work_dir / "keyword_index.sqlite3"
+    Config.PARENT_DOCSTORE_PATH = work_dir / "parent_docstore.sqlite3"
+    Config.ANSWER_CACHE_PATH = work_dir / "answer_cache.sqlite3"
+    Config.EMBEDDING_CACHE_PATH = work_dir / "embedding_cache.sqlite3"
+    Config.ANSWER_CACHE_ENABLED = False
+    Config.TRACE_LOG_PATH = None
+    Config.METRICS_PORT = None
+
+
+async def _run_queries(engine, queries: List[str], concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(query: str):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await engine.aask(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not isinstance(response, dict):
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    elapsed = time.perf_counter() - start
+    return {"concurrency": concurrency, "requests": len(queries), "errors": errors,
+            "qps": round(len(queries) / elapsed, 2), "latency": _latency_summary(latencies)}
+
+
+def bench_size(target_chunks: int, args, work_dir: Path) -> dict:
+    # Imported here so that Config is already pointed at the benchmark directory.
+    from src.raggy_engine import RAGgy_Engine
+    from src.vector_store import VectorStoreManager
+
+    _configure(work_dir)
+    Config.VECTOR_BACKEND = args.backend
+    result = {"target_chunks": target_chunks}
+
+    start = time.perf_counter()
+    paths, queries = generate_corpus(work_dir / "corpus", target_chunks)
+    result["corpus"] = {"files": len(paths), "generate_s": round(time.perf_counter() - start, 3)}
+
+    instrumentation = Instrumentation()
+    embeddings = FakeEmbeddings(size=args.dim, call_latency_ms=args.embed_call_ms,
+                                per_text_latency_ms=args.embed_text_ms)
+    llm = FakeChatModel(answer_tokens=args.answer_tokens, first_token_latency_ms=args.llm_first_token_ms,
+                        token_latency_ms=args.llm_token_ms)
+    vm = VectorStoreManager(instrumentation=instrumentation, embeddings=embeddings,
+                            embedding_model_name="benchmark-fake")
+
+    start = time.perf_counter()
+    state, msg = vm.add_pdfs(paths, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    chunks = vm.vector_store.count()
+    if state != 0:
+        print(f"Ingest reported errors: {msg}")
+    result["ingest"] = {"state": state, "seconds": round(elapsed, 3), "chunks": chunks,
+                        "chunks_per_s": round(chunks / elapsed, 2), "files_per_s": round(len(paths) / elapsed, 2)}
+    print(f"[{target_chunks}] {msg}")
+
+    list_samples = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        vm.list_pdfs()
+        list_samples.append((time.perf_counter() - start) * 1000)
+    result["list_pdfs"] = _latency_summary(list_samples)
+
+    # Repeat the query set until there are enough samples for stable tail percentiles.
+    query_set = [queries[i % len(queries)] for i in range(max(args.queries, len(queries)))][:args.queries]
+    retriever = vm.get_retriever()
+    retrieval_samples = []
+    for query in query_set:
+        start = time.perf_counter()
+        retriever.invoke(query)
+        retrieval_samples.append((time.perf_counter() - start) * 1000)
+    result["retrieval"] = {"mode": Config.RETRIEVAL_MODE, "backend": Config.VECTOR_BACKEND,
+                           **_latency_summary(retrieval_samples)}
+
+    engine = RAGgy_Engine(vm, instrumentation=instrumentation, llm=llm)
+    result["end_to_end"] = [asyncio.run(_run_queries(engine, query_set, concurrency))
+                            for concurrency in args.concurrency]
+
+    delete_samples = []
+    for path in paths[:args.deletes]:
+        start = time.perf_counter()
+        vm.delete_pdf(path.name)
+        delete_samples.append((time.perf_counter() - start) * 1000)
+    result["delete_pdf"] = _latency_summary(delete_samples)
+
+    result["stages"] = instrumentation.registry.snapshot()["histograms"]
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline RAGgy pipeline benchmark with local fake models.")
+    parser.add_argument("--sizes", default="10,1000", help="Comma separated corpus sizes in chunks, e.g. 10,1000,100000")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma separated concurrency levels for the QPS run")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per retrieval and QPS run")
+    parser.add_argument("--repeats", type=int, default=50, help="Repetitions of the list_pdfs measurement")
+    parser.add_argument("--deletes", type=int, default=5, help="Number of documents to delete")
+    parser.add_argument("--workers", type=int, default=None, help="Ingest worker processes (default Config.INGEST_WORKERS)")
+    parser.add_argument("--backend", default=Config.VECTOR_BACKEND, choices=["chroma", "local"],
+                        help="Vector backend (Config.VECTOR_BACKEND)")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension of the fake embedder")
+    parser.add_argument("--embed-call-ms", type=float, default=50.0, help="Simulated latency per embedding call")
+    parser.add_argument("--embed-text-ms", type=float, default=0.5, help="Simulated latency per embedded text")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300.0, help="Simulated time to first token")
+    parser.add_argument("--llm-token-ms", type=float, default=5.0, help="Simulated latency per generated token")
+    parser.add_argument("--answer-tokens", type=int, default=40, help="Tokens per generated answer")
+    parser.add_argument("--output", default=None, help="Result file (default benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated corpora and stores")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "keep")},
+        "results": [],
+    }
+    base_dir = Path(tempfile.mkdtemp(prefix="raggy_bench_"))
+    for size in sizes:
+        report["results"].append(bench_size(size, args, base_dir / f"size_{size}"))
+    if not args.keep:
+        shutil.rmtree(base_dir, ignore_errors=True)
+    else:
+        print(f"Benchmark data kept in {base_dir}")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit[:10]}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Offline benchmark of conversation sessions (src/conversation.py): per-turn latency, prompt tokens and history tokens
+of one long conversation, grouped by turn, plus the share of follow-ups answered from the chunks of the previous turn.
+Modes:
+- "stateless": every question on its own, as before sessions,
+- "bounded": a session with the configured SESSION_HISTORY_TOKENS and rolling summary,
+- "unbounded": a session that keeps the full history verbatim, for comparison.
+The conversation cycles through a new question, "Tell me more.", a topic follow-up and a question about the next page.
+
+Usage:
+    python -m benchmarks.bench_sessions --turns 100
+"""
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_chunking import _page_queries
+from benchmarks.bench_pipeline import RESULTS_DIR, _configure, _git_commit, _latency_summary
+from src.fake_models import FakeChatModel, FakeEmbeddings
+from benchmarks.synthetic_corpus import generate_corpus
+from configs.config import Config
+
+MODES = ("stateless", "bounded", "unbounded")
+
+
+def _conversation(vm, turns: int) -> list:
+    questions = []
+    for query, source, page in _page_queries(vm, (turns + 3) // 4):
+        doc_index = int(source.split("_")[1].split(".")[0])
+        questions += [query, "Tell me more.", "What about the calibration procedure?",
+                      f"And PN-{doc_index:05d}-{page + 1:04d}?"]
+    return questions[:turns]
+
+
+def bench_mode(mode: str, vm, questions: list, args) -> dict:
+    from src.raggy_engine import RAGgy_Engine
+
+    Config.SESSION_HISTORY_TOKENS = 10 ** 9 if mode == "unbounded" else args.history_tokens
+    engine = RAGgy_Engine(vm, llm=FakeChatModel(answer_tokens=args.answer_tokens))
+    session_id = None if mode == "stateless" else f"bench-{mode}"
+    per_turn = []
+    for question in questions:
+        trace = {}
+        for chunk in engine.stream(question, session_id=session_id):
+            if "trace" in chunk:
+                trace = chunk["trace"]
+        attributes = trace["attributes"]
+        per_turn.append({"ms": trace["total_ms"], "prompt_tokens": attributes.get("prompt_tokens") or 0,
+                         "history_tokens": attributes.get("history_tokens") or 0,
+                         "reused": bool(attributes.get("session_docs_reused"))})
+
+    groups = {}
+    for start in range(0, len(per_turn), args.group):
+        turns = per_turn[start:start + args.group]
+        groups[f"{start + 1}-{start + len(turns)}"] = {
+            "latency": _latency_summary([turn["ms"] for turn in turns]),
+            "prompt_tokens": round(statistics.mean(turn["prompt_tokens"] for turn in turns), 1),
+            "history_tokens": round(statistics.mean(turn["history_tokens"] for turn in turns), 1),
+        }
+    follow_ups = per_turn[1:] if session_id else []
+    return {
+        "groups": groups,
+        "docs_reused": round(sum(turn["reused"] for turn in follow_ups) / len(follow_ups), 3) if follow_ups else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and prompt size of long conversations, offline.")
+    parser.add_argument("--turns", type=int, default=100, help="Questions in the conversation")
+    parser.add_argument("--group", type=int, default=20, help="Turns per reported group")
+    parser.add_argument("--size", type=int, default=2000, help="Corpus size in chunks")
+    parser.add_argument("--answer-tokens", type=int, default=120, help="Tokens of every fake answer")
+    parser.add_argument("--history-tokens", type=int, default=Config.SESSION_HISTORY_TOKENS,
+                        help="SESSION_HISTORY_TOKENS of the bounded mode")
+    parser.add_argument("--output", default=None, help="Result file (default benchmarks/results/sessions-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    base_dir = Path(tempfile.mkdtemp(prefix="raggy_bench_sessions_"))
+    try:
+        from src.vector_store import VectorStoreManager
+        _configure(base_dir)
+        paths, _ = generate_corpus(base_dir / "corpus", args.size)
+        vm = VectorStoreManager(embeddings=FakeEmbeddings(), embedding_model_name="benchmark-fake")
+        print(vm.add_pdfs(paths)[1])
+        questions = _conversation(vm, args.turns)
+        results = {mode: bench_mode(mode, vm, questions, args) for mode in MODES}
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    for mode, result in results.items():
+        print(f"{mode} (follow-ups answered from the previous chunks: {result['docs_reused']:.0%})")
+        for turns, group in result["groups"].items():
+            print(f"  turns {turns:>8}: p50 {group['latency']['p50_ms']:7.2f} ms, "
+                  f"prompt {group['prompt_tokens']:8.1f} tokens, history {group['history_tokens']:8.1f} tokens")
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"sessions-{commit[:10]}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Startup benchmark of the entry points: wall time and loaded modules of fresh interpreter processes,
+from module imports up to complete CLI commands. The CLI runs against a small synthetic corpus with the
+offline fake models, so "ask" includes model and chain setup but no network time.
+
+Usage:
+    python -m benchmarks.bench_startup --repeats 5
+"""
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_pipeline import RESULTS_DIR, _git_commit
+from configs.config import Config
+
+# Run in every child process before the measured code, points all stores at the benchmark directory.
+_SETUP = """
+from pathlib import Path
+from configs.config import Config
+work_dir = Path({work_dir!r})
+Config.PDF_DIRECTORY = work_dir / "raw"
+Config.CHROMA_DB_PATH = work_dir / "chroma_db"
+Config.LOCAL_INDEX_PATH = work_dir / "local_index"
+Config.REGISTRY_DB_PATH = work_dir / "document_registry.sqlite3"
+Config.KEYWORD_INDEX_PATH = work_dir / "keyword_index.sqlite3"
+Config.PARENT_DOCSTORE_PATH = work_dir / "parent_docstore.sqlite3"
+Config.EMBEDDING_CACHE_PATH = work_dir / "embedding_cache.sqlite3"
+Config.INGEST_QUEUE_PATH = work_dir / "ingest_jobs.sqlite3"
+Config.LLM_PROVIDER = "fake"
+Config.EMBEDDING_PROVIDER = "fake"
+Config.ANSWER_CACHE_ENABLED = False
+"""
+_CLI = "import sys, raggy_cli\nsys.argv = ['raggy_cli.py'] + {argv!r}\nraggy_cli.main()"
+_MODULE_COUNT = "\nimport sys as _sys\n_sys.stderr.write('\\n@@modules=%d\\n' % len(_sys.modules))"
+
+CASES = {
+    "import configs.config": "import configs.config",
+    "import src.vector_store": "import src.vector_store",
+    "import src.raggy_engine": "import src.raggy_engine",
+    "cli list": _CLI.format(argv=["list"]),
+    "cli delete (missing file)": _CLI.format(argv=["delete", "missing.pdf"]),
+    "cli ask": _CLI.format(argv=["ask", "What does PN-00000-0001 describe?"]),
+}
+
+
+def _run_case(code: str, work_dir: Path) -> tuple:
+    """:return: (wall milliseconds, loaded modules) of one fresh interpreter."""
+    script = _SETUP.format(work_dir=str(work_dir)) + code + _MODULE_COUNT
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-c", script], cwd=Config.ROOT_DIR, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if process.returncode not in (0, 1):
+        raise RuntimeError(process.stderr[-2000:])
+    modules = int(process.stderr.rsplit("@@modules=", 1)[1].split()[0])
+    return wall_ms, modules
+
+
+def _prepare(work_dir: Path, chunks: int):
+    """Ingests a small corpus with the fake embedder, so list and ask have something to work on."""
+    script = _SETUP.format(work_dir=str(work_dir)) + (
+        "from benchmarks.synthetic_corpus import generate_corpus\n"
+        "from src.vector_store import VectorStoreManager\n"
+        f"paths, _ = generate_corpus(work_dir / 'corpus', {chunks})\n"
+        "print(VectorStoreManager().add_pdfs(paths)[1])\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=Config.ROOT_DIR, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time of the RAGgy entry points.")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh processes per case")
+    parser.add_argument("--chunks", type=int, default=2000, help="Size of the benchmark corpus in chunks")
+    parser.add_argument("--output", default=None, help="Result file (default benchmarks/results/startup-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    work_dir = Path(tempfile.mkdtemp(prefix="raggy_bench_startup_"))
+    try:
+        _prepare(work_dir, args.chunks)
+        # Interpreter start and the setup alone are the floor every case pays.
+        cases = {"interpreter + config": "pass", **CASES}
+        results = {}
+        for name, code in cases.items():
+            _run_case(code, work_dir)  # Warms the OS file cache and the bytecode cache
+            runs = [_run_case(code, work_dir) for _ in range(args.repeats)]
+            wall = [wall_ms for wall_ms, _ in runs]
+            results[name] = {"median_ms": round(statistics.median(wall), 1), "min_ms": round(min(wall), 1),
+                             "max_ms": round(max(wall), 1), "modules": runs[-1][1]}
+            print(f"{name:>28}: {results[name]['median_ms']:8.1f} ms median, {results[name]['modules']:5d} modules")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"startup-{commit[:10]}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Generates synthetic PDF corpora of a target chunk count without any PDF library.
+Every page contains pseudo-random sentences from a fixed vocabulary plus a unique part number,
+so keyword and vector retrieval have something to find.
+"""
+import random
+from pathlib import Path
+from typing import List, Tuple, Union
+
+from configs.config import Config
+
+_VOCABULARY = (
+    "neuron synapse cortex signal voltage channel protocol experiment sample control dataset model "
+    "pressure valve pump sensor calibration safety spill ventilation procedure report analysis result "
+    "method measurement frequency amplitude latency throughput index vector query document retrieval"
+).split()
+
+# Characters per page line and lines per page that fit on a Letter page in 10pt Helvetica.
+_LINE_CHARS = 90
+_LINES_PER_PAGE = 60
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Union[str, Path], pages: List[str]):
+    """Writes a minimal valid PDF with one text page per entry of pages."""
+    font_id = 3 + 2 * len(pages)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(len(pages)))}] "
+        f"/Count {len(pages)} >>".encode(),
+    ]
+    for i, text in enumerate(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>".encode()
+        )
+        lines = [text[j:j + _LINE_CHARS] for j in range(0, len(text), _LINE_CHARS)]
+        stream = ("BT /F1 10 Tf 20 770 Td 12 TL " + " ".join(f"({_escape(line)}) Tj T*" for line in lines)
+                  + " ET").encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF".encode()
+    Path(path).write_bytes(bytes(out))
+
+
+def _page_text(rng: random.Random, doc_index: int, page_index: int, chars: int) -> str:
+    words = [f"PN-{doc_index:05d}-{page_index:04d}"]
+    length = len(words[0])
+    while length < chars:
+        word = rng.choice(_VOCABULARY)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def generate_corpus(directory: Union[str, Path], target_chunks: int, pages_per_doc: int = 20,
+                    seed: int = 42) -> Tuple[List[Path], List[str]]:
+    """
+    Writes PDFs into directory whose split yields roughly target_chunks chunks.
+    :return: Tuple (PDF paths, sample queries that mention part numbers and vocabulary words).
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    page_chars = _LINE_CHARS * _LINES_PER_PAGE
+    stride = Config.CHUNK_SIZE - Config.CHUNK_OVERLAP
+    chunks_per_page = max(1, (page_chars - Config.CHUNK_OVERLAP) // stride)
+    total_pages = max(1, -(-target_chunks // chunks_per_page))
+    # Small corpora get one short page per chunk so the target is met exactly.
+    if target_chunks < chunks_per_page * pages_per_doc:
+        page_chars = stride
+        total_pages = target_chunks
+
+    paths, queries = [], []
+    page_index = doc_index = 0
+    while page_index < total_pages:
+        n_pages = min(pages_per_doc, total_pages - page_index)
+        pages = [_page_text(rng, doc_index, p, page_chars) for p in range(n_pages)]
+        path = directory / f"synthetic_{doc_index:05d}.pdf"
+        write_pdf(path, pages)
+        paths.append(path)
+        queries.append(f"What does PN-{doc_index:05d}-0000 say about {rng.choice(_VOCABULARY)}?")
+        page_index += n_pages
+        doc_index += 1
+    return paths, queries
@@ -1,26 +1,138 @@
 import os
-from dotenv import load_dotenv
 from pathlib import Path
+from typing import Optional
 
-load_dotenv()
 
 class Config:
-    GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+    GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")  # .env is read by load_env() once a Google model is needed
     CHUNK_SIZE = 1000
     CHUNK_OVERLAP = 200
+    CHUNKING_MODE = "standard"  # "standard" or "parent_child" (small chunks are embedded, their parents are answered from)
+    CHILD_CHUNK_SIZE = 200
+    CHILD_CHUNK_OVERLAP = 0
+    PARENT_CHUNK_OVERLAP = 0  # Parents (CHUNK_SIZE) are stored once, overlap would only duplicate text
+    CHILD_FETCH_MULTIPLIER = 4  # Child hits fetched per returned parent passage
     EMBEDDING_MODEL = "models/text-embedding-004"
     LLM_MODEL = "gemini-3-flash-preview"
+    LLM_PROVIDER = "google"  # "google", "local" (llama.cpp on the CPU) or "fake" (offline benchmark model)
+    EMBEDDING_PROVIDER = "google"  # "google", "local" (sentence-transformers on the CPU) or "fake"
+    JUDGE_PROVIDER = "google"  # Evaluation judge, "google" or "local" (the local chat model and embedder)
+    LOCAL_EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"  # Changing the embedder needs a fresh vector store
+    LOCAL_EMBEDDING_BATCH_SIZE = 64
+    LOCAL_EMBEDDING_DEVICE = "cpu"
+    LOCAL_LLM_CONTEXT_TOKENS = 4096
+    LOCAL_LLM_BATCH_TOKENS = 512  # Prompt tokens evaluated per llama.cpp batch
+    LOCAL_LLM_THREADS = None  # None = llama.cpp default
+    LOCAL_LLM_MAX_TOKENS = 512
     DATASETGEN_EMBEDDING_MODEL = "models/text-embedding-004"
     DATASETGEN_LLM_MODEL = "gemini-3-flash-preview"
     JUDGE_EMBEDDING_MODEL = "models/text-embedding-004"
     JUDGE_LLM_MODEL = "gemini-3-flash-preview"
+    EVAL_MAX_CONCURRENT_SAMPLES = 4
+    EVAL_MAX_CONCURRENT_CALLS = 8  # Pipeline and judge calls in flight during an evaluation
+    EVAL_REQUESTS_PER_MINUTE = 60  # Shared by all pipeline and judge calls of an evaluation
+    RETRIEVAL_MODE = "similarity"  # "similarity", "keyword" or "hybrid"
+    RETRIEVAL_K = 5
+    HYBRID_FETCH_K = 20
+    HYBRID_VECTOR_WEIGHT = 1.0
+    HYBRID_KEYWORD_WEIGHT = 1.0
+    RRF_K = 60
+    QUERY_EXPANSION_ENABLED = False  # Also retrieve with LLM rewrites of vague queries, fused with RRF
+    QUERY_EXPANSION_VARIANTS = 3  # Rewrites written by one LLM call
+    QUERY_EXPANSION_MIN_TERMS = 5  # Queries with this many content words, an identifier or a quoted phrase skip the LLM
+    QUERY_EXPANSION_ORIGINAL_WEIGHT = 2.0  # RRF weight of the original query, every rewrite weighs 1
+    QUERY_EXPANSION_TIMEOUT_SECONDS = 5  # Slower rewrites are not waited for, the original query is used alone
+    QUERY_REWRITE_CACHE_MAX_ENTRIES = 10_000
+    RERANK_ENABLED = False  # Over-fetch, dedupe and MMR-diversify before taking RETRIEVAL_K chunks
+    RERANK_FETCH_K = 50
+    MMR_LAMBDA = 0.7  # 1 = pure relevance, 0 = pure diversity
+    DEDUPE_THRESHOLD = 0.5  # Share of repeated word 5-grams at which a chunk counts as a duplicate
+    RERANKER = None  # None, "lexical" or a cross-encoder model, e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    CONTEXT_TOKEN_BUDGET = 2000  # Estimated tokens of retrieved context per request
+    VECTOR_BACKEND = "chroma"  # "chroma" or "local" (memory-mapped IVF index)
+    LOCAL_INDEX_QUANTIZATION = "int8"  # "int8" or "float32", fixed when the index is created
+    LOCAL_INDEX_NLIST = None  # IVF lists, None = 4 * sqrt(chunks) at training time
+    LOCAL_INDEX_NPROBE = 8  # Lists scanned per query, higher = better recall, slower
+    LOCAL_INDEX_TRAIN_MIN = 10_000  # Exact search below this many chunks
+    SCOPED_SEARCH_MAX_CHUNKS = 5000  # Chroma: filtered scopes up to this size are searched exactly on cached embeddings
+    SCOPED_SEARCH_CACHE_SCOPES = 4  # Chroma: scopes whose embeddings are kept (768-d: 15 MB per 5000 chunks)
     ROOT_DIR = Path(__file__).resolve().parent.parent
     PDF_DIRECTORY = ROOT_DIR / "data" / "raw"
     CHROMA_DB_PATH = ROOT_DIR /"data" / "chroma_db"
+    LOCAL_INDEX_PATH = ROOT_DIR / "data" / "local_index"
+    LOCAL_LLM_MODEL_PATH = ROOT_DIR / "models" / "qwen2.5-1.5b-instruct-q4_k_m.gguf"
+    REGISTRY_DB_PATH = ROOT_DIR / "data" / "document_registry.sqlite3"
+    KEYWORD_INDEX_PATH = ROOT_DIR / "data" / "keyword_index.sqlite3"
+    PARENT_DOCSTORE_PATH = ROOT_DIR / "data" / "parent_docstore.sqlite3"
+    ANSWER_CACHE_PATH = ROOT_DIR / "data" / "answer_cache.sqlite3"
+    QUERY_REWRITE_CACHE_PATH = ROOT_DIR / "data" / "query_rewrite_cache.sqlite3"
+    INGEST_QUEUE_PATH = ROOT_DIR / "data" / "ingest_jobs.sqlite3"
+    EVAL_JUDGE_CACHE_PATH = ROOT_DIR / "data" / "eval_judge_cache.sqlite3"
+    EVAL_RESULTS_DIRECTORY = ROOT_DIR / "evaluation" / "results"
+    UPLOAD_DIRECTORY = ROOT_DIR / "data" / "uploads"
+    TRACE_LOG_PATH = None  # e.g. ROOT_DIR / "data" / "traces.jsonl" to log every request trace
+    METRICS_PORT = None  # e.g. 9464 to serve Prometheus metrics on http://127.0.0.1:9464/metrics
+    EMBEDDING_CACHE_PATH = ROOT_DIR / "data" / "embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+    ANSWER_CACHE_ENABLED = True
+    ANSWER_CACHE_TTL_SECONDS = 24 * 60 * 60
+    ANSWER_CACHE_MAX_ENTRIES = 5000
+    ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95  # None disables the semantic tier
+    SESSION_MAX_SESSIONS = 1000  # Conversations kept in memory, the least recently used are evicted beyond
+    SESSION_IDLE_TTL_SECONDS = 2 * 60 * 60
+    SESSION_HISTORY_TOKENS = 800  # Recent turns sent verbatim, older turns are folded into the summary
+    SESSION_SUMMARY_TOKENS = 200  # Rolling summary of the older turns
+    SESSION_REUSE_MIN_COVERAGE = 0.8  # Share of a follow-up's content words in the previous chunks to reuse them
+    BATCH_MAX_CONCURRENCY = 8
+    BATCH_MAX_RETRIES = 5
+    INGEST_WORKERS = os.cpu_count() or 1
+    INGEST_COMMIT_BATCH_SIZE = 2000
+    INGEST_WINDOW_PAGES = 25  # Pages per window when streaming a single PDF
+    INGEST_QUEUE_WORKERS = 2  # Background ingestion threads of the job queue
+    INGEST_QUEUE_LEASE_SECONDS = 60  # A running job whose process stops renewing its lease is queued again after this
+    EMBEDDING_BATCH_SIZE = 100
+    EMBEDDING_MAX_CONCURRENCY = 4
+    EMBEDDING_MAX_RETRIES = 5
+    HTTP_MAX_CONNECTIONS = 64  # Shared pool for all Gemini embedding and generation calls of the process
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = 32
+    HTTP_KEEPALIVE_EXPIRY_SECONDS = 60
+    HTTP_TIMEOUT_SECONDS = 120
+    VECTOR_SEARCH_WORKERS = 8  # Threads for blocking vector/keyword searches of the async path
+    ASYNC_INGEST_WORKERS = 2  # Threads behind aadd_pdf, aupsert_pdf and adelete_pdf
+    API_MAX_INFLIGHT = 32  # Pipelines the HTTP service runs at once
+    API_MAX_QUEUE = 128  # Requests waiting for a pipeline slot, beyond that the service answers 429
+    API_QUEUE_TIMEOUT_SECONDS = 30
+    API_RATE_LIMIT_PER_MINUTE = 60  # Per client (peer address, or X-Client-Id with API_TRUST_CLIENT_ID_HEADER)
+    API_RATE_LIMIT_BURST = 20
+    API_MAX_UPLOAD_MB = 512
+    API_TRUST_CLIENT_ID_HEADER = False  # Only behind a trusted proxy that sets X-Client-Id for every request
+
+    _env_loaded = False
+
+    @classmethod
+    def load_env(cls):
+        """Loads the .env file once, commands that need no API key never import python-dotenv."""
+        if cls._env_loaded:
+            return
+        cls._env_loaded = True
+        from dotenv import load_dotenv
+        load_dotenv()
+        cls.GOOGLE_API_KEY = cls.GOOGLE_API_KEY or os.getenv("GOOGLE_API_KEY")
 
     @classmethod
-    def validate(cls):
+    def require_api_key(cls):
+        cls.load_env()
         if not cls.GOOGLE_API_KEY:
             raise ValueError("GOOGLE_API_KEY not found in environment variables")
+
+    @classmethod
+    def validate(cls, require_api_key: Optional[bool] = None):
+        """
+        :param require_api_key: None requires GOOGLE_API_KEY if the chat model or the embedder is a Google model.
+        """
+        if require_api_key is None:
+            require_api_key = "google" in (cls.LLM_PROVIDER, cls.EMBEDDING_PROVIDER)
+        if require_api_key:
+            cls.require_api_key()
         os.makedirs(cls.PDF_DIRECTORY, exist_ok=True)
         os.makedirs(cls.CHROMA_DB_PATH, exist_ok=True)
\ No newline at end of file
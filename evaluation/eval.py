@@ -1,38 +1,60 @@
-import json
-import pandas as pd
+"""
+RAGAS evaluation of the RAG pipeline.
+  python -m evaluation.eval [--data evaluation/eval_data.json] [--run-name baseline] [--fresh]
+
+Samples run concurrently, the five metrics of a sample run concurrently, and all pipeline and judge calls
+share one rate limiter (Config.EVAL_REQUESTS_PER_MINUTE, EVAL_MAX_CONCURRENT_CALLS).
+Judge responses are cached in Config.EVAL_JUDGE_CACHE_PATH, so re-runs only score prompts that changed.
+Every finished sample is appended to evaluation/results/<run>.jsonl, an interrupted run with the same name
+resumes with the missing samples. The report puts quality scores next to the pipeline latency of every sample.
+"""
+import argparse
 import asyncio
+import hashlib
+import json
+import time
 from pathlib import Path
-from ragas import experiment, Dataset
-from ragas.dataset_schema import SingleTurnSample
-from ragas.llms import llm_factory
-from ragas.embeddings import GoogleEmbeddings
+
+import numpy as np
+import pandas as pd
 from ragas.metrics.collections import (Faithfulness, AnswerRelevancy, ContextPrecision, ContextRecall, AnswerCorrectness)
-from google import genai
 from src.raggy_engine import RAGgy_Engine
 from configs.config import Config
+from src.rate_limit import AsyncRateLimiter
 from src.vector_store import VectorStoreManager
-'''
-TESTED ONLY WITH ONE EXAMPLE -> DATASET GENERATION HITS API LIMITS -> Set Up local LLM
-'''
+from evaluation.judge_cache import JudgeCache, wrap_judge_embeddings, wrap_judge_llm
+from evaluation.judge_models import create_judge
+
+METRICS = ("faithfulness", "answer_relevancy", "context_precision", "context_recall", "answer_correctness")
+
+
+def _sample_id(index: int, row: dict) -> str:
+    # The index keeps duplicated questions apart, the hash notices edited rows.
+    digest = hashlib.sha256(f"{row['user_input']}\x00{row.get('label', '')}".encode("utf-8")).hexdigest()
+    return f"{index}-{digest[:12]}"
+
+
 class RAGEvaluator:
-    def __init__(self, rag_engine: RAGgy_Engine):
+    def __init__(self, rag_engine: RAGgy_Engine, judge_llm=None, judge_embeddings=None):
+        """
+        :param judge_llm: Optional ragas InstructorLLM instead of the Config.JUDGE_PROVIDER judge
+        (judge_embeddings likewise).
+        """
         self.rag_engine = rag_engine
-        Config.validate()
-        google_client = genai.Client(api_key=Config.GOOGLE_API_KEY)
-        self.judge_llm = llm_factory(
-            model=Config.JUDGE_LLM_MODEL,
-            client=google_client,
-            provider="google",
-            temperature=0,
-            max_tokens=None,
-            timeout=None,
-            max_retries=3,
-            google_api_key=Config.GOOGLE_API_KEY
-        )
-        self.judge_embeddings = GoogleEmbeddings(
-            model=Config.JUDGE_EMBEDDING_MODEL,  # Use the newer 004 model
-            client=google_client
-        )
+        Config.validate(require_api_key=(judge_llm is None or judge_embeddings is None)
+                        and Config.JUDGE_PROVIDER == "google")
+        self.limiter = AsyncRateLimiter(Config.EVAL_REQUESTS_PER_MINUTE, Config.EVAL_MAX_CONCURRENT_CALLS)
+        self.judge_cache = JudgeCache(Config.EVAL_JUDGE_CACHE_PATH)
+        llm_name, embedding_name = type(judge_llm).__name__, type(judge_embeddings).__name__
+        if judge_llm is None or judge_embeddings is None:
+            default_llm, default_llm_name, default_embeddings, default_embedding_name = create_judge()
+            if judge_llm is None:
+                judge_llm, llm_name = default_llm, default_llm_name
+            if judge_embeddings is None:
+                judge_embeddings, embedding_name = default_embeddings, default_embedding_name
+        self.judge_llm = wrap_judge_llm(judge_llm, llm_name, self.judge_cache, self.limiter)
+        self.judge_embeddings = wrap_judge_embeddings(judge_embeddings, embedding_name,
+                                                      self.judge_cache, self.limiter)
         self.faithfulness_scorer = Faithfulness(llm=self.judge_llm)
         self.answer_relevancy_scorer = AnswerRelevancy(llm=self.judge_llm, embeddings=self.judge_embeddings)
         self.context_precision_scorer = ContextPrecision(llm=self.judge_llm)
@@ -45,63 +67,151 @@ class RAGEvaluator:
         print(f"Loaded {len(data)} test cases from {data_path}")
         return data
 
-    async def run(self, data_path: str):
+    @staticmethod
+    def load_checkpoint(results_path: Path) -> dict:
+        """Returns the finished samples of a previous run by sample ID. Failed samples are run again."""
+        done = {}
+        if results_path.exists():
+            with open(results_path, 'r', encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Last line of an interrupted write
+                    if not record.get("error"):
+                        done[record["sample_id"]] = record
+        return done
+
+    async def _run_pipeline(self, query: str) -> dict:
+        """Runs the RAG pipeline once and records its latency breakdown."""
+        docs, tokens, trace = [], [], {}
+        start = time.perf_counter()
+        async with self.limiter:
+            async for chunk in self.rag_engine.astream(query):
+                if "docs" in chunk:
+                    docs = chunk["docs"]
+                elif "answer" in chunk:
+                    tokens.append(chunk["answer"])
+                elif "trace" in chunk:
+                    trace = chunk["trace"]
+        if trace.get("error"):
+            raise RuntimeError(trace["error"])
+        stages = {}
+        for stage in trace.get("stages", []):
+            stages[stage["stage"]] = round(stages.get(stage["stage"], 0.0) + stage["ms"], 3)
+        return {
+            "response": "".join(tokens),
+            "retrieved_contexts": [doc.page_content for doc in docs],
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "stages_ms": stages,
+        }
+
+    async def _score(self, sample: dict) -> dict:
+        """Scores one answered sample with all metrics at once."""
+        user_input, response = sample["user_input"], sample["response"]
+        contexts, reference = sample["retrieved_contexts"], sample["label"]
+        calls = {
+            "faithfulness": self.faithfulness_scorer.ascore(
+                user_input=user_input, response=response, retrieved_contexts=contexts),
+            "answer_relevancy": self.answer_relevancy_scorer.ascore(user_input=user_input, response=response),
+            "context_precision": self.context_precision_scorer.ascore(
+                user_input=user_input, retrieved_contexts=contexts, reference=reference),
+            "context_recall": self.context_recall_scorer.ascore(
+                user_input=user_input, retrieved_contexts=contexts, reference=reference),
+            "answer_correctness": self.answer_correctness_scorer.ascore(
+                user_input=user_input, response=response, reference=reference),
+        }
+        results = await asyncio.gather(*calls.values(), return_exceptions=True)
+        scores, errors = {}, []
+        for name, result in zip(calls, results):
+            if isinstance(result, Exception):
+                scores[name] = None
+                errors.append(f"{name}: {result}")
+            else:
+                scores[name] = float(result.value) if result.value is not None else None
+        return {"scores": scores, "error": "; ".join(errors) or None}
+
+    async def _evaluate_sample(self, sample_id: str, row: dict) -> dict:
+        record = {"sample_id": sample_id, "user_input": row["user_input"], "label": row["label"]}
+        try:
+            record.update(await self._run_pipeline(row["user_input"]))
+            record.update(await self._score(record))
+        except Exception as e:
+            record["error"] = str(e)
+        return record
+
+    async def run(self, data_path: str, run_name: str = "default", fresh: bool = False,
+                  max_concurrency: int = None) -> pd.DataFrame:
+        """
+        Evaluates every sample of the dataset that the run has not finished yet.
+        :return: DataFrame with one row per sample (scores, latency, error).
+        """
         raw_data = self.load_data(data_path)
-        dataset = Dataset(
-            name="RAG_eval_code_debug_dataset",
-            backend="local/csv",
-            root_dir="."
-        )
-        for row in raw_data:
-            dataset.append(row)
-        @experiment()
-        async def evaluate(sample):
-            print("TEST!")
-            result = await self.rag_engine.aask(sample['user_input'])
-            print(result)
-            sample['response'] = result['answer']
-            sample['retrieved_context'] = [doc.page_contect for doc in result['docs']]
-
-            faithfulness = await self.faithfulness_scorer.ascore(
-                user_input=sample['user_input'],
-                response=sample['response'],
-                retrieved_contexts = sample['retrieved_context']
-            )
-            answer_relevancy = await self.answer_relevancy_scorer.ascore(
-                user_input=sample['user_input'],
-                response=sample['response']
-            )
-            context_precision = await self.context_precision_scorer.ascore(
-                user_input=sample['user_input'],
-                retrieved_contexts=sample['retrieved_context'],
-                reference=sample['label']
-            )
-            context_recall = await self.context_recall_scorer.ascore(
-                user_input=sample['user_input'],
-                retrieved_contexts=sample['retrieved_context'],
-                reference=sample['label']
-            )
-            answer_correctness = await self.answer_correctness_scorer.ascore(
-                user_input=sample['user_input'],
-                response=sample['response'],
-                reference=sample['label']
-            )
-            return {
-                "faithfulness": faithfulness,
-                "answer_relevancy": answer_relevancy,
-                "context_precisiion": context_precision,
-                "conext_recall": context_recall,
-                "answer_correctness": answer_correctness
-            }
-        res = await evaluate.arun(dataset,
-                                  name="Initial_test_v1")
-        return res
+        Config.EVAL_RESULTS_DIRECTORY.mkdir(parents=True, exist_ok=True)
+        results_path = Config.EVAL_RESULTS_DIRECTORY / f"{run_name}.jsonl"
+        if fresh and results_path.exists():
+            results_path.unlink()
+        done = self.load_checkpoint(results_path)
+        samples = [(_sample_id(i, row), row) for i, row in enumerate(raw_data)]
+        todo = [(sample_id, row) for sample_id, row in samples if sample_id not in done]
+        print(f"Run '{run_name}': {len(samples) - len(todo)} samples done, {len(todo)} to evaluate.")
+
+        semaphore = asyncio.Semaphore(max_concurrency or Config.EVAL_MAX_CONCURRENT_SAMPLES)
+        finished = 0
+        with open(results_path, 'a', encoding="utf-8") as out:
+            async def evaluate(sample_id: str, row: dict):
+                nonlocal finished
+                async with semaphore:
+                    record = await self._evaluate_sample(sample_id, row)
+                # Checkpoint: one line per finished sample, flushed right away.
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                finished += 1
+                status = f"error: {record['error']}" if record.get("error") else f"{record['latency_ms']} ms"
+                print(f"[{finished}/{len(todo)}] {row['user_input'][:60]} ({status})")
+                if not record.get("error"):
+                    done[sample_id] = record
+
+            await asyncio.gather(*(evaluate(sample_id, row) for sample_id, row in todo))
+
+        records = [done[sample_id] for sample_id, _ in samples if sample_id in done]
+        report = self.report(records, run_name)
+        failed = len(samples) - len(records)
+        if failed:
+            print(f"{failed} samples failed, run again with --run-name {run_name} to retry them.")
+        return report
+
+    def report(self, records: list, run_name: str) -> pd.DataFrame:
+        """Prints and stores the summary: mean scores, pipeline latency percentiles and judge cache hits."""
+        frame = pd.DataFrame([
+            {"sample_id": r["sample_id"], "user_input": r["user_input"], **r["scores"], "latency_ms": r["latency_ms"]}
+            for r in records
+        ])
+        summary = {"run": run_name, "samples": len(records), "judge_cache": self.judge_cache.stats()}
+        if records:
+            summary["scores"] = {name: (None if frame[name].isna().all() else round(float(frame[name].mean()), 4))
+                                 for name in METRICS}
+            latencies = frame["latency_ms"].to_numpy()
+            summary["latency_ms"] = {"p50": round(float(np.percentile(latencies, 50)), 1),
+                                     "p95": round(float(np.percentile(latencies, 95)), 1),
+                                     "mean": round(float(latencies.mean()), 1)}
+        summary_path = Config.EVAL_RESULTS_DIRECTORY / f"{run_name}.summary.json"
+        summary_path.write_text(json.dumps(summary, indent=2))
+        print(json.dumps(summary, indent=2))
+        print(f"Per-sample results: {Config.EVAL_RESULTS_DIRECTORY / f'{run_name}.jsonl'}")
+        return frame
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAGAS evaluation of RAGgy")
+    parser.add_argument("--data", default=str(Path(__file__).parent / "eval_data.json"))
+    parser.add_argument("--run-name", default="default", help="Results and checkpoint name, reuse it to resume")
+    parser.add_argument("--fresh", action="store_true", help="Discard the checkpoint of the run")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="Samples evaluated at once")
+    args = parser.parse_args()
+    # Every sample should run the full pipeline, otherwise latencies and re-runs after a retriever change are off.
+    Config.ANSWER_CACHE_ENABLED = False
     vm = VectorStoreManager()
     rag = RAGgy_Engine(vm)
     evaluator = RAGEvaluator(rag)
-    results = asyncio.run(evaluator.run("eval_data.json"))
-    print(results)
-
+    asyncio.run(evaluator.run(args.data, args.run_name, args.fresh, args.max_concurrency))
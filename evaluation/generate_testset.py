@@ -11,7 +11,7 @@ from langchain_core.documents import Document
 
 from ragas.llms import LangchainLLMWrapper
 from ragas.embeddings import LangchainEmbeddingsWrapper
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from src.model_providers import get_chat_model, get_embeddings
 
 
 from ragas.testset import TestsetGenerator
@@ -21,25 +21,16 @@ from ragas.testset.synthesizers import (
     MultiHopAbstractQuerySynthesizer
 )
 '''
-NOT FULLY TESTED. TOO MANY API CALLS WHILE CREATING -> Set Up local LLM
+NOT FULLY TESTED. TOO MANY API CALLS WHILE CREATING -> Config.LLM_PROVIDER/EMBEDDING_PROVIDER = "local" runs it on local models
 '''
 
 class SynthDataGenerator:
     def __init__(self):
         Config.validate()
-        google_llm = ChatGoogleGenerativeAI(
-            model=Config.LLM_MODEL,
-            temperature=0,
-            max_tokens=None,
-            timeout=None,
-            max_retries=3,
-            google_api_key=Config.GOOGLE_API_KEY
-        )
-        google_embeddings=GoogleGenerativeAIEmbeddings(
-            model=Config.EMBEDDING_MODEL
-        )
-        self.generator_llm = LangchainLLMWrapper(google_llm)
-        self.generator_embeddings = LangchainEmbeddingsWrapper(google_embeddings)
+        generator_llm, _ = get_chat_model()
+        generator_embeddings, _ = get_embeddings()
+        self.generator_llm = LangchainLLMWrapper(generator_llm)
+        self.generator_embeddings = LangchainEmbeddingsWrapper(generator_embeddings)
         self.generator = TestsetGenerator(
             llm=self.generator_llm,
             embedding_model=self.generator_embeddings,
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+from src.rate_limit import AsyncRateLimiter, aretry_with_backoff
+
+
+class JudgeCache:
+    """
+    Persistent cache of judge LLM and embedding responses (SQLite), keyed by hash(model + call type + prompt).
+    A re-run only pays for prompts that changed, e.g. the samples whose retrieved context changed.
+    """
+    def __init__(self, db_path: Union[str, Path]):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS judge_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM judge_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO judge_cache (key, value, created_at) VALUES (?, ?, ?)",
+                               (key, value, time.time()))
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def wrap_judge_llm(llm, model_name: str, cache: JudgeCache, limiter: AsyncRateLimiter, max_retries: int = 5):
+    """
+    Puts the cache and the rate limiter in front of a ragas InstructorLLM. Only cache misses take a rate limit
+    slot, rate limit errors are retried with backoff.
+    """
+    generate = llm.agenerate
+
+    async def agenerate(prompt: str, response_model):
+        key = cache.key(model_name, "generate", response_model.__name__, prompt)
+        cached = cache.get(key)
+        if cached is not None:
+            return response_model.model_validate_json(cached)
+        async with limiter:
+            result = await aretry_with_backoff(generate, prompt, response_model, max_retries=max_retries)
+        cache.set(key, result.model_dump_json())
+        return result
+
+    llm.agenerate = agenerate
+    return llm
+
+
+def wrap_judge_embeddings(embeddings, model_name: str, cache: JudgeCache, limiter: AsyncRateLimiter,
+                          max_retries: int = 5):
+    """Same as wrap_judge_llm for ragas embeddings, every text is cached on its own."""
+    embed_text, embed_texts = embeddings.aembed_text, embeddings.aembed_texts
+
+    async def aembed_text(text: str, **kwargs):
+        key = cache.key(model_name, "embed", text)
+        cached = cache.get(key)
+        if cached is not None:
+            return json.loads(cached)
+        async with limiter:
+            vector = await aretry_with_backoff(embed_text, text, max_retries=max_retries, **kwargs)
+        cache.set(key, json.dumps(list(vector)))
+        return vector
+
+    async def aembed_texts(texts, **kwargs):
+        keys = [cache.key(model_name, "embed", text) for text in texts]
+        vectors = [cache.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            async with limiter:
+                fresh = await aretry_with_backoff(embed_texts, [texts[i] for i in missing],
+                                                  max_retries=max_retries, **kwargs)
+            for i, vector in zip(missing, fresh):
+                cache.set(keys[i], json.dumps(list(vector)))
+                vectors[i] = json.dumps(list(vector))
+        return [json.loads(vector) for vector in vectors]
+
+    embeddings.aembed_text = aembed_text
+    embeddings.aembed_texts = aembed_texts
+    return embeddings
@@ -0,0 +1,118 @@
+"""
+Judge models of the RAGAS evaluation, selected with Config.JUDGE_PROVIDER:
+- "google": Gemini and Google embeddings through ragas (needs GOOGLE_API_KEY),
+- "local": the process-wide local chat model and embedder of src/model_providers.py. The chat model answers
+  with JSON constrained to the schema of the metric, so no remote call is made during an evaluation.
+"""
+import json
+import re
+from typing import Callable, Dict, Optional
+
+from pydantic import ValidationError
+from ragas.embeddings.base import BaseRagasEmbedding
+from ragas.llms.base import InstructorBaseRagasLLM
+
+from configs.config import Config
+from src.model_providers import get_chat_model, get_embeddings
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+class LocalJudgeLLM(InstructorBaseRagasLLM):
+    """Structured outputs of a LangChain chat model, the JSON schema of the response model is passed as format."""
+    def __init__(self, chat_model, max_attempts: int = 2):
+        self.chat_model = chat_model
+        self.max_attempts = max_attempts
+
+    def _messages(self, prompt: str, response_model) -> tuple:
+        schema = response_model.model_json_schema()
+        system = f"Answer only with a JSON object that matches this JSON schema:\n{json.dumps(schema)}"
+        kwargs = {"response_format": {"type": "json_object", "schema": schema}}
+        return [("system", system), ("human", prompt)], kwargs
+
+    @staticmethod
+    def _parse(text: str, response_model):
+        match = _JSON_OBJECT.search(text)
+        return response_model.model_validate_json(match.group(0) if match else text)
+
+    def generate(self, prompt: str, response_model):
+        messages, kwargs = self._messages(prompt, response_model)
+        error = None
+        for _ in range(self.max_attempts):
+            try:
+                return self._parse(self.chat_model.invoke(messages, **kwargs).content, response_model)
+            except (ValidationError, ValueError) as e:
+                error = e
+        raise ValueError(f"Judge answer does not match {response_model.__name__}: {error}")
+
+    async def agenerate(self, prompt: str, response_model):
+        messages, kwargs = self._messages(prompt, response_model)
+        error = None
+        for _ in range(self.max_attempts):
+            try:
+                return self._parse((await self.chat_model.ainvoke(messages, **kwargs)).content, response_model)
+            except (ValidationError, ValueError) as e:
+                error = e
+        raise ValueError(f"Judge answer does not match {response_model.__name__}: {error}")
+
+
+class LocalJudgeEmbeddings(BaseRagasEmbedding):
+    """ragas interface over a LangChain embedding model."""
+    def __init__(self, embeddings):
+        super().__init__()
+        self.embeddings = embeddings
+
+    def embed_text(self, text: str, **kwargs):
+        return self.embeddings.embed_query(text)
+
+    async def aembed_text(self, text: str, **kwargs):
+        return await self.embeddings.aembed_query(text)
+
+    def embed_texts(self, texts, **kwargs):
+        return self.embeddings.embed_documents(list(texts))
+
+    async def aembed_texts(self, texts, **kwargs):
+        return await self.embeddings.aembed_documents(list(texts))
+
+
+def _google_judge():
+    from google import genai
+    from ragas.embeddings import GoogleEmbeddings
+    from ragas.llms import llm_factory
+    google_client = genai.Client(api_key=Config.GOOGLE_API_KEY)
+    judge_llm = llm_factory(
+        model=Config.JUDGE_LLM_MODEL,
+        client=google_client,
+        provider="google",
+        temperature=0,
+        max_tokens=None,
+        timeout=None,
+        max_retries=3,
+        google_api_key=Config.GOOGLE_API_KEY
+    )
+    judge_embeddings = GoogleEmbeddings(model=Config.JUDGE_EMBEDDING_MODEL, client=google_client)
+    return judge_llm, Config.JUDGE_LLM_MODEL, judge_embeddings, Config.JUDGE_EMBEDDING_MODEL
+
+
+def _local_judge():
+    chat_model, llm_name = get_chat_model("local")
+    embeddings, embedding_name = get_embeddings("local")
+    return LocalJudgeLLM(chat_model), llm_name, LocalJudgeEmbeddings(embeddings), embedding_name
+
+
+# Provider name -> factory returning (judge_llm, llm_name, judge_embeddings, embedding_name).
+JUDGE_PROVIDERS: Dict[str, Callable[[], tuple]] = {
+    "google": _google_judge,
+    "local": _local_judge,
+}
+
+
+def create_judge(provider: Optional[str] = None) -> tuple:
+    """
+    Judge models of the provider (default Config.JUDGE_PROVIDER).
+    :return: (judge_llm, llm_name, judge_embeddings, embedding_name), the names namespace the judge cache.
+    """
+    name = provider or Config.JUDGE_PROVIDER
+    if name not in JUDGE_PROVIDERS:
+        raise ValueError(f"Unknown judge provider '{name}', choose one of {sorted(JUDGE_PROVIDERS)}")
+    return JUDGE_PROVIDERS[name]()
@@ -1,28 +1,42 @@
 import streamlit as st
-import os
+import shutil
 import tempfile
+import uuid
+from configs.config import Config
+from src.ingest_queue import IngestJobQueue, IngestWorkerPool
 from src.vector_store import VectorStoreManager
-from src.raggy_engine import RAGgy_Engine
 
 st.set_page_config(page_title="RAGgy", layout="wide")
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
+# The engine keeps the compact history of this chat under this ID for follow-up questions
+if "chat_session_id" not in st.session_state:
+    st.session_state.chat_session_id = uuid.uuid4().hex
 
 # Cache DB/LLM to not reload these everytime
 @st.cache_resource
 def get_managers():
     vm = VectorStoreManager()
-    rag = RAGgy_Engine(vm)
-    return vm, rag
+    ingest_queue = IngestJobQueue(Config.INGEST_QUEUE_PATH, Config.INGEST_QUEUE_LEASE_SECONDS)
+    ingest_workers = IngestWorkerPool(vm, ingest_queue, workers=Config.INGEST_QUEUE_WORKERS)
+    return vm, ingest_workers
 
-vector_store_manager, raggy_engine = get_managers()
+# The chat model and retrieval chain load with the first question, the page renders without them
+@st.cache_resource
+def get_engine():
+    from src.raggy_engine import RAGgy_Engine
+    return RAGgy_Engine(vector_store_manager)
+
+vector_store_manager, ingest_workers = get_managers()
 st.title("RAGgy")
 
 if "file_uploader_key" not in st.session_state:
     st.session_state["file_uploader_key"] = 0
 if "processed_files" not in st.session_state:
     st.session_state.processed_files = []
+if "reported_jobs" not in st.session_state:
+    st.session_state.reported_jobs = set()
 
 uploaded_file = st.file_uploader(
     "Upload a PDF",
@@ -32,28 +46,45 @@ uploaded_file = st.file_uploader(
 
 if uploaded_file is not None:
     if uploaded_file.name not in st.session_state.processed_files:
+        # Copy the upload in 1 MB blocks instead of reading it into memory at once
+        Config.UPLOAD_DIRECTORY.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=Config.UPLOAD_DIRECTORY) as tmp_file:
+            shutil.copyfileobj(uploaded_file, tmp_file, length=1024 * 1024)
+            tmp_path = tmp_file.name
+
+        # Indexing runs in a background worker, the chat stays responsive meanwhile
+        ingest_workers.submit(tmp_path, uploaded_file.name, delete_file=True)
+        st.session_state.processed_files.append(uploaded_file.name)
+        st.toast(f"Queued '{uploaded_file.name}' for indexing.")
+
+
+# Refreshes on its own while documents are indexed, without rerunning the chat
+@st.fragment(run_every=3)
+def documents_sidebar():
+    jobs = ingest_workers.queue.list_jobs(active_only=True)
+    if jobs:
+        st.header("Indexing")
+        for job in jobs:
+            col1, col2 = st.columns([4, 1])
+            total = job["total_pages"]
+            text = f"{job['source']}: {job['pages_done']}/{total} pages" if total else f"{job['source']}: {job['status']}"
+            col1.progress(job["pages_done"] / total if total else 0.0, text=text)
+            if col2.button("X", key=f"cancel_{job['job_id']}", help=f"Cancels indexing of {job['source']}"):
+                ingest_workers.queue.cancel(job["job_id"])
+                st.toast(f"Cancelling {job['source']}...")
+    for job in ingest_workers.queue.list_jobs(limit=10):
+        if job["status"] == "failed" and job["job_id"] not in st.session_state.reported_jobs:
+            st.session_state.reported_jobs.add(job["job_id"])
+            st.error(f"{job['source']}: {job['message']}")
 
-        with st.spinner("Processing PDF..."):
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(uploaded_file.read())
-                tmp_path = tmp_file.name
-
-            state, msg = vector_store_manager.add_pdf(tmp_path, uploaded_file.name)
-            os.remove(tmp_path)
-
-            if state == 0:
-                st.session_state.processed_files.append(uploaded_file.name)
-                st.rerun()
-            else:
-                st.error(msg)
-    else:
-        st.toast(f"File '{uploaded_file.name}' added.")
-
-
-with st.sidebar:
     st.header("Documents")
     files = vector_store_manager.list_pdfs()
     if files:
+        # Deleted documents drop out of the selection before the widget is drawn
+        if "scope_sources" in st.session_state:
+            st.session_state.scope_sources = [f for f in st.session_state.scope_sources if f in files]
+        st.multiselect("Search in", files, key="scope_sources", placeholder="All documents",
+                       help="Answers only use the selected documents")
         for f in files:
             col1, col2 = st.columns([4,1])
             col1.text(f)
@@ -61,12 +92,21 @@ with st.sidebar:
                 state, msg = vector_store_manager.delete_pdf(f)
                 if state == 0:
                     st.toast(msg)
-                    st.rerun()
+                    st.rerun(scope="fragment")
                 else:
                     st.error(msg)
     else:
         st.info("No documents found.")
 
+
+with st.sidebar:
+    if st.session_state.messages and st.button("New chat", help="Starts a conversation without the earlier questions"):
+        get_engine().end_session(st.session_state.chat_session_id)
+        st.session_state.chat_session_id = uuid.uuid4().hex
+        st.session_state.messages = []
+        st.rerun()
+    documents_sidebar()
+
 # Display History
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -80,8 +120,21 @@ if prompt := st.chat_input("What's your Question?"):
 
     # AI Response
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            response = raggy_engine.ask(prompt)
-            st.markdown(response)
-            st.session_state.messages.append({"role": "assistant", "content": response})
+        trace = {}
+
+        def answer_tokens():
+            for chunk in get_engine().stream(prompt, sources=st.session_state.get("scope_sources") or None,
+                                             session_id=st.session_state.chat_session_id):
+                if "answer" in chunk:
+                    yield chunk["answer"]
+                elif "trace" in chunk:
+                    trace.update(chunk["trace"])
+
+        # Tokens are rendered as soon as the LLM produces them
+        response = st.write_stream(answer_tokens())
+        st.session_state.messages.append({"role": "assistant", "content": response})
+        if trace:
+            with st.expander(f"Trace ({trace['total_ms']:.0f} ms)"):
+                st.table([{"stage": s["stage"], "ms": round(s["ms"], 1)} for s in trace["stages"]])
+                st.json(trace["attributes"])
 
@@ -1,17 +1,185 @@
 """
 RAGgy CLI - Mainly for debugging backend.
+Without arguments an interactive menu is started. Non-interactive commands for scripts and cron jobs:
+  python raggy_cli.py list
+  python raggy_cli.py ingest [PDF or directory ...]      (default: data/raw/)
+  python raggy_cli.py delete NAME [NAME ...]
+  python raggy_cli.py ask "question" [--json] [--source NAME ...] [--pages 3-5] [--since 2026-01-31]
+  python raggy_cli.py batch questions.txt [--max-concurrency N] [--output answers.jsonl]
+batch answers every line of questions.txt concurrently.
+Models and the vector store are only loaded by the commands that need them, list only reads the document registry.
 """
-import os
+import argparse
+import asyncio
+import json
 import sys
 from pathlib import Path
 
-from src.vector_store import VectorStoreManager
-from src.raggy_engine import RAGgy_Engine
+from configs.config import Config
+
+
+def _sources(docs) -> list:
+    return sorted({doc.metadata.get("source") for doc in docs if doc.metadata.get("source")})
+
+
+def _pdf_paths(paths: list) -> list:
+    pdfs = []
+    for path in paths or [Config.PDF_DIRECTORY]:
+        path = Path(path)
+        pdfs.extend(sorted(path.glob("*.pdf")) if path.is_dir() else [path])
+    return pdfs
+
+
+def _page_range(text: str) -> tuple:
+    """Parses "3-5", "3-", "-5" or "4" into (first, last), an open end is None."""
+    first, _, last = text.partition("-") if "-" in text else (text, "", text)
+    try:
+        return int(first) if first else None, int(last) if last else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid page range: {text}")
+
+
+def run_list() -> int:
+    """Reads the document registry only, without loading the vector store or any model."""
+    from src.document_registry import DocumentRegistry
+    registry = DocumentRegistry(Config.REGISTRY_DB_PATH)
+    if registry.is_empty():
+        # A collection indexed before the registry existed gets its registry built when it is loaded.
+        from src.vector_store import VectorStoreManager
+        vm = VectorStoreManager()
+        vm.vector_store
+        names = vm.list_pdfs()
+    else:
+        names = registry.list_sources()
+    for name in names:
+        print(name)
+    return 0
+
+
+def run_ingest(paths: list) -> int:
+    """Ingests PDFs, unchanged files are skipped and edited files only re-embed their changed chunks."""
+    from src.vector_store import VectorStoreManager
+    pdfs = _pdf_paths(paths)
+    if not pdfs:
+        print("No PDFs found.", file=sys.stderr)
+        return 1
+    state, msg = VectorStoreManager().add_pdfs(
+        pdfs,
+        progress_callback=lambda done, total: print(f"\rParsed {done}/{total} files", end="", flush=True,
+                                                    file=sys.stderr)
+    )
+    print(file=sys.stderr)
+    print(msg if state == 0 else f"Error: {msg}")
+    return 0 if state == 0 else 1
+
+
+def run_delete(names: list) -> int:
+    from src.vector_store import VectorStoreManager
+    vm = VectorStoreManager()
+    failed = 0
+    for name in names:
+        state, msg = vm.delete_pdf(name)
+        print(f"{name}: {msg}")
+        failed += state != 0
+    return 1 if failed else 0
+
+
+def run_ask(question: str, as_json: bool = False, **filters) -> int:
+    """
+    Streams the answer to stdout, or prints one JSON object with answer and sources.
+    :param filters: Retrieval filters of RAGgy_Engine.stream (sources, pages, ingested_after).
+    """
+    from src.raggy_engine import RAGgy_Engine
+    from src.vector_store import VectorStoreManager
+    rag = RAGgy_Engine(VectorStoreManager())
+    docs, tokens, error = [], [], None
+    for chunk in rag.stream(question, **filters):
+        if "docs" in chunk:
+            docs = chunk["docs"]
+        elif "answer" in chunk:
+            tokens.append(chunk["answer"])
+            if not as_json:
+                print(chunk["answer"], end="", flush=True)
+        elif "trace" in chunk:
+            error = chunk["trace"].get("error")
+    if as_json:
+        print(json.dumps({"question": question, "answer": "".join(tokens), "sources": _sources(docs), "error": error}))
+    else:
+        print()
+    return 1 if error else 0
+
+
+def run_batch(questions_file: Path, max_concurrency: int, output: Path = None):
+    """Answers all questions of a file (one per line) and writes one JSON line per question."""
+    from src.raggy_engine import RAGgy_Engine
+    from src.vector_store import VectorStoreManager
+    questions = [line.strip() for line in questions_file.read_text(encoding="utf-8").splitlines() if line.strip()]
+    vm = VectorStoreManager()
+    rag = RAGgy_Engine(vm)
+    results = asyncio.run(rag.abatch(questions, max_concurrency=max_concurrency))
+    out = open(output, "w", encoding="utf-8") if output else sys.stdout
+    try:
+        for result in results:
+            out.write(json.dumps({
+                "question": result["input"],
+                "answer": result["answer"],
+                "error": result["error"],
+                "sources": _sources(result["docs"])
+            }) + "\n")
+    finally:
+        if output:
+            out.close()
+    failed = sum(1 for result in results if result["error"])
+    print(f"Answered {len(results) - failed}/{len(results)} questions.", file=sys.stderr)
+    return 1 if failed else 0
+
 
 def main():
+    parser = argparse.ArgumentParser(description="RAGgy CLI")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("list", help="List the ingested documents")
+    ingest_parser = subparsers.add_parser("ingest", help="Ingest PDFs (files or directories, default data/raw/)")
+    ingest_parser.add_argument("paths", nargs="*", type=Path)
+    delete_parser = subparsers.add_parser("delete", help="Delete documents by file name")
+    delete_parser.add_argument("names", nargs="+")
+    ask_parser = subparsers.add_parser("ask", help="Answer one question")
+    ask_parser.add_argument("question")
+    ask_parser.add_argument("--json", action="store_true", help="Print answer and sources as one JSON object")
+    ask_parser.add_argument("--source", action="append", default=None, help="Only search this PDF (repeatable)")
+    ask_parser.add_argument("--pages", type=_page_range, default=None, help="Only search these pages, e.g. 3-5")
+    ask_parser.add_argument("--since", default=None, help="Only search documents ingested on or after YYYY-MM-DD")
+    batch_parser = subparsers.add_parser("batch", help="Answer all questions in a file (one per line)")
+    batch_parser.add_argument("questions_file", type=Path)
+    batch_parser.add_argument("--max-concurrency", type=int, default=None)
+    batch_parser.add_argument("--output", type=Path, default=None, help="JSONL output file (default: stdout)")
+    args = parser.parse_args()
+
+    match args.command:
+        case "list":
+            return run_list()
+        case "ingest":
+            return run_ingest(args.paths)
+        case "delete":
+            return run_delete(args.names)
+        case "ask":
+            return run_ask(args.question, args.json, sources=args.source, pages=args.pages,
+                           ingested_after=args.since)
+        case "batch":
+            return run_batch(args.questions_file, args.max_concurrency, args.output)
+        case _:
+            interactive()
+            return 0
+
+
+def interactive():
+    from src.ingest_queue import IngestJobQueue, IngestWorkerPool
+    from src.vector_store import VectorStoreManager
     print("--- Initialite RAGgy CLI ---")
     vm = VectorStoreManager()
-    rag = RAGgy_Engine(vm)
+    rag = None  # The chat model is only loaded for the first question
+    # Indexes queued PDFs in the background while questions can be asked
+    ingest_queue = IngestJobQueue(Config.INGEST_QUEUE_PATH, Config.INGEST_QUEUE_LEASE_SECONDS)
+    ingest_workers = IngestWorkerPool(vm, ingest_queue, workers=Config.INGEST_QUEUE_WORKERS)
     RAW_DATA_DIR = Path("data") / "raw"
     if RAW_DATA_DIR.exists():
         RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -23,6 +191,8 @@ def main():
         print("2. List Ingested Documents")
         print("3. Delete a Document")
         print("4. Ask Question")
+        print("5. Queue all PDFs from data/raw/ for background indexing")
+        print("6. Show / cancel indexing jobs")
         print("q. Exit")
 
         menu_selection = input("\nEnter choice: ").strip().lower()
@@ -30,17 +200,17 @@ def main():
         match menu_selection:
             case '1':
                 # Ingest all PDFs from data/raw
+                # Unchanged files are skipped, edited files only re-embed their changed chunks
                 pdf_files = list(RAW_DATA_DIR.glob("*.pdf"))
-                existing_docs = vm.list_pdfs()
-                for file_path in pdf_files:
-                    filename = file_path.name
-                    if filename in existing_docs:
-                        continue
-                    state, msg = vm.add_pdf(file_path, filename)
-                    if state == 0:
-                        print("Done")
-                    else:
-                        print(f"Error: {msg}")
+                state, msg = vm.add_pdfs(
+                    pdf_files,
+                    progress_callback=lambda done, total: print(f"\rParsed {done}/{total} files", end="", flush=True)
+                )
+                print()
+                if state == 0:
+                    print(msg)
+                else:
+                    print(f"Error: {msg}")
             case '2':
                 # List all Docs
                 files = vm.list_pdfs()
@@ -81,14 +251,42 @@ def main():
                 if prompt:
                     print("\nThinking...")
                     try:
+                        if rag is None:
+                            from src.raggy_engine import RAGgy_Engine
+                            rag = RAGgy_Engine(vm)
                         # BREAKPOINT HERE
-                        response = rag.ask(prompt)
-                        print(f"\nRAGgy: {response}\n")
+                        print("\nRAGgy: ", end="", flush=True)
+                        for token in rag.stream_answer(prompt):
+                            print(token, end="", flush=True)
+                        print("\n")
                     except Exception as e:
                         print(f"\nError: {e}")
 
+            case '5':
+                # Queue all PDFs from data/raw, progress can be polled with 6
+                pdf_files = list(RAW_DATA_DIR.glob("*.pdf"))
+                for pdf in pdf_files:
+                    ingest_workers.submit(pdf, pdf.name)
+                print(f"Queued {len(pdf_files)} files.")
+            case '6':
+                # Show recent jobs and optionally cancel one
+                jobs = ingest_workers.queue.list_jobs(limit=20)
+                if not jobs:
+                    print("No indexing jobs.")
+                    continue
+                for i, job in enumerate(jobs, 1):
+                    progress = f"{job['pages_done']}/{job['total_pages']} pages" if job["total_pages"] else ""
+                    print(f"{i}. {job['source']} [{job['status']}] {progress} {job['message'] or ''}")
+                selection = input("Enter number to cancel (Enter to go back): ").strip()
+                if selection.isdigit() and 0 < int(selection) <= len(jobs):
+                    job = jobs[int(selection) - 1]
+                    if ingest_workers.queue.cancel(job["job_id"]):
+                        print(f"Cancelling {job['source']}.")
+                    else:
+                        print(f"{job['source']} has already finished.")
             case 'q' | 'exit' | 'quit':
                 # Exit
+                ingest_workers.shutdown(wait=False)
                 print("Bye!")
                 break
             case _:
@@ -96,4 +294,4 @@ def main():
                 print("Instalid command. Please try again.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""
+RAGgy HTTP service, see src/api_server.py for the endpoints.
+  python raggy_server.py [--host 0.0.0.0] [--port 8000]
+  python raggy_server.py --fake-models   serves the offline fake models of src/fake_models.py (no API key needed),
+                                         all stores live under data/fake so the real collection is never touched
+Needs an ASGI server, uvicorn is used if installed. Any other one can serve raggy_server:app.
+"""
+import argparse
+import threading
+from pathlib import Path
+
+from configs.config import Config
+from src.api_server import create_app
+
+_app_lock = threading.Lock()
+
+
+def _use_data_root(root: Path):
+    """Moves every store and directory of Config below ROOT_DIR/data to the same place below root."""
+    data_dir = Config.ROOT_DIR / "data"
+    for name in dir(Config):
+        value = getattr(Config, name)
+        if name.endswith(("_PATH", "_DIRECTORY")) and isinstance(value, Path) and value.is_relative_to(data_dir):
+            setattr(Config, name, root / value.relative_to(data_dir))
+
+
+def build_app(fake_models: bool = False):
+    if not fake_models:
+        return create_app()
+    from src.fake_models import FakeChatModel, FakeEmbeddings
+    # Fake embeddings must never be written into the collection of the real embedding model.
+    _use_data_root(Config.ROOT_DIR / "data" / "fake")
+    return create_app(embeddings=FakeEmbeddings(), llm=FakeChatModel())
+
+
+def __getattr__(name):
+    # "raggy_server:app" for ASGI servers, built once on first access so importing this module stays cheap.
+    # Later accesses find the global and never get here, so there is one store and worker pool per process.
+    if name == "app":
+        with _app_lock:
+            if "app" not in globals():
+                globals()["app"] = build_app()
+        return globals()["app"]
+    raise AttributeError(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAGgy HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--fake-models", action="store_true", help="Use local fake embedding and chat models")
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("Serving needs an ASGI server: pip install uvicorn")
+    # A single event loop per process keeps the pooled async HTTP client valid, scale out with more processes.
+    uvicorn.run(build_app(args.fake_models), host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+def normalize_query(query: str) -> str:
+    """Lowercases, collapses whitespace and strips trailing punctuation."""
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+
+def _serialize_docs(docs: List[Document]) -> list:
+    return [{"id": doc.id, "page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+
+def _deserialize_docs(data: list) -> List[Document]:
+    return [Document(id=d.get("id"), page_content=d["page_content"], metadata=d["metadata"]) for d in data]
+
+
+class AnswerCache:
+    """
+    Two-tier response cache in front of the RAG chain.
+    1. Exact tier: normalized query text.
+    2. Semantic tier: reuses an answer whose query embedding has a cosine similarity >= threshold.
+    Every entry is tagged with the corpus version it was computed on and is ignored once the corpus changes.
+    Entries expire after ttl_seconds, the least recently used ones are evicted beyond max_entries.
+    A similarity_threshold of None disables the semantic tier.
+    Answers of a scoped retrieval are stored under their scope (the canonical filter text) and only use the exact tier.
+    Entries are namespaced by the chat model (llm_model) and the embedding model: an answer of another model is never
+    returned, and query embeddings of another embedding model are never compared.
+    """
+    def __init__(self, db_path: Union[str, Path], ttl_seconds: float = 86400, max_entries: int = 5000,
+                 similarity_threshold: Optional[float] = 0.95, llm_model: str = "", embedding_model: str = ""):
+        self.llm_model = llm_model
+        self.embedding_model = embedding_model
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.semantic_enabled = similarity_threshold is not None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # In-memory matrix of the query embeddings of one corpus version for the semantic tier.
+        self._matrix_version = None
+        self._matrix_keys: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                query_key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                embedding BLOB,
+                response TEXT NOT NULL,
+                corpus_version INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                llm_model TEXT,
+                embedding_model TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_answers_last_access ON answers(last_access);
+            CREATE INDEX IF NOT EXISTS idx_answers_version ON answers(corpus_version);
+            """
+        )
+        # Entries of caches created before the model namespace have no models and are never hit.
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(answers)")}
+        for column in ("llm_model", "embedding_model"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE answers ADD COLUMN {column} TEXT")
+        self._conn.commit()
+
+    def _key(self, query: str, scope: str = "") -> str:
+        text = f"{self.llm_model}\x00{self.embedding_model}\x00{scope}\x00{normalize_query(query)}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        return matrix / np.maximum(np.linalg.norm(matrix, axis=-1, keepdims=True), 1e-12)
+
+    def _load_matrix(self, corpus_version: int):
+        """Loads all valid query embeddings of the given corpus version and models into one normalized matrix."""
+        rows = self._conn.execute(
+            "SELECT query_key, embedding FROM answers WHERE corpus_version = ? AND created_at >= ? "
+            "AND embedding IS NOT NULL AND llm_model = ? AND embedding_model = ?",
+            (corpus_version, time.time() - self.ttl_seconds, self.llm_model, self.embedding_model)
+        ).fetchall()
+        self._matrix_version = corpus_version
+        self._matrix_keys = [row[0] for row in rows]
+        if rows:
+            self._matrix = self._normalize(np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows]))
+        else:
+            self._matrix = None
+
+    def _add_to_matrix(self, query_key: str, embedding: np.ndarray):
+        """Adds a stored query embedding to the loaded matrix, so a new entry does not reload all of them."""
+        vector = self._normalize(embedding)
+        if self._matrix is None:
+            self._matrix_keys, self._matrix = [query_key], vector[np.newaxis, :]
+        elif self._matrix.shape[1] != vector.shape[0]:
+            self._matrix_version = None
+        elif query_key in self._matrix_keys:
+            self._matrix[self._matrix_keys.index(query_key)] = vector
+        else:
+            self._matrix_keys.append(query_key)
+            self._matrix = np.vstack([self._matrix, vector])
+
+    def _fetch(self, query_key: str, corpus_version: int) -> Optional[dict]:
+        row = self._conn.execute(
+            "SELECT response FROM answers WHERE query_key = ? AND corpus_version = ? AND created_at >= ?",
+            (query_key, corpus_version, time.time() - self.ttl_seconds)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE answers SET last_access = ? WHERE query_key = ?", (time.time(), query_key))
+        self._conn.commit()
+        response = json.loads(row[0])
+        response["docs"] = _deserialize_docs(response["docs"])
+        return response
+
+    def get_exact(self, query: str, corpus_version: int, scope: str = "") -> Optional[dict]:
+        """
+        Exact tier lookup on the normalized query text.
+        :return: Dict with "answer" and "docs" or None on a miss.
+        """
+        with self._lock:
+            response = self._fetch(self._key(query, scope), corpus_version)
+            if response is not None:
+                self.exact_hits += 1
+            return response
+
+    def get_similar(self, embedding: Optional[List[float]], corpus_version: int) -> Optional[dict]:
+        """
+        Semantic tier lookup: returns the response of the most similar cached query above the threshold.
+        Counts a miss without lookup if the semantic tier is disabled or no embedding is given.
+        :return: Dict with "answer" and "docs" or None on a miss.
+        """
+        if not self.semantic_enabled or embedding is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        vector = self._normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock:
+            if self._matrix_version != corpus_version:
+                self._load_matrix(corpus_version)
+            if self._matrix is not None and self._matrix.shape[1] == vector.shape[0]:
+                similarities = self._matrix @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    response = self._fetch(self._matrix_keys[best], corpus_version)
+                    if response is not None:
+                        self.semantic_hits += 1
+                        return response
+            self.misses += 1
+            return None
+
+    def put(self, query: str, response: dict, corpus_version: int, embedding: Optional[List[float]] = None,
+            scope: str = ""):
+        """Stores a response ("answer" and "docs") for the query."""
+        payload = json.dumps({"answer": response["answer"], "docs": _serialize_docs(response.get("docs", []))})
+        # Without an embedding, a scoped answer can never be a semantic hit for a query of another scope.
+        vector = np.asarray(embedding, dtype=np.float32) if embedding is not None and not scope else None
+        query_key = self._key(query, scope)
+        now = time.time()
+        with self._lock, self._conn:
+            # Corpus versions only grow: an answer retrieved before a newer version was stored is stale already,
+            # e.g. from a request that started before an ingest or from another process sharing the file.
+            newest = self._conn.execute("SELECT MAX(corpus_version) FROM answers").fetchone()[0]
+            if newest is not None and corpus_version < newest:
+                return
+            # Entries of older corpus versions can never be hit again.
+            self._conn.execute("DELETE FROM answers WHERE corpus_version < ?", (corpus_version,))
+            expired = self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(query_key, query, embedding, response, corpus_version, created_at, last_access, llm_model, "
+                "embedding_model) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (query_key, query, vector.tobytes() if vector is not None else None, payload, corpus_version, now,
+                 now, self.llm_model, self.embedding_model)
+            )
+            evicted = self._conn.execute(
+                "DELETE FROM answers WHERE query_key IN (SELECT query_key FROM answers "
+                "ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            # The matrix of another corpus version is reloaded on the next lookup anyway.
+            if expired.rowcount > 0 or evicted.rowcount > 0:
+                self._matrix_version = None
+            elif vector is not None and self._matrix_version == corpus_version:
+                self._add_to_matrix(query_key, vector)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "entries": entries,
+            }
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answers")
+            self._matrix_version = None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,421 @@
+"""
+Headless HTTP service on top of RAGgy_Engine and VectorStoreManager as a plain ASGI application
+(run it with any ASGI server, see raggy_server.py).
+
+Endpoints:
+  POST   /ask                 {"query": "..."} -> {"answer", "sources", "coalesced"}
+  POST   /stream              {"query": "..."} -> NDJSON lines {"docs"}, {"answer"} per token, {"trace"}
+                              both optionally scoped with "sources": [...], "pages": [first, last],
+                              "ingested_after" and "ingested_before" (ISO dates or Unix time), and with
+                              "session_id" for follow-up questions of one conversation
+  POST   /ingest?filename=x   raw PDF body -> 202 {"job_id"}, indexed by the background ingest workers
+  GET    /jobs, /jobs/{id}    ingest job status, DELETE /jobs/{id} cancels a job
+  GET    /documents           indexed PDFs, DELETE /documents/{name} removes one
+  GET    /health, /metrics    liveness with load figures, Prometheus metrics
+
+Identical in-flight questions share one pipeline run, at most API_MAX_INFLIGHT pipelines run at once with
+API_MAX_QUEUE waiting, everything beyond is shed with 429. Every client has its own token bucket, keyed on the peer
+address, or on the X-Client-Id header with API_TRUST_CLIENT_ID_HEADER behind a trusted proxy that sets it.
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote
+
+from configs.config import Config
+from src.answer_cache import normalize_query
+from src.retrieval_filter import build_filter, filter_key
+from src.instrumentation import get_instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Token bucket per client: rate_per_minute tokens are refilled continuously up to burst.
+    Only the max_clients most recently seen clients are tracked.
+    """
+    def __init__(self, rate_per_minute: float, burst: int, max_clients: int = 10_000):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def acquire(self, client: str) -> float:
+        """
+        Takes one token from the client's bucket.
+        :return: 0 if the request may pass, otherwise the seconds until the next token.
+        """
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(client, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate if self.rate > 0 else 60.0
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionController:
+    """
+    Bounds the pipelines running at once (max_inflight) and the requests waiting for a slot (max_queue).
+    A request is rejected immediately if the queue is full and after queue_timeout seconds of waiting.
+    """
+    def __init__(self, max_inflight: int, max_queue: int, queue_timeout: float):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_inflight)
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise Overloaded("queue_full", 1.0)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise Overloaded("queue_timeout", 1.0)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._semaphore.release()
+
+
+class RequestCoalescer:
+    """
+    Runs identical concurrent requests once. The first caller of a key starts the work, later callers
+    await the same result. A caller that disconnects does not cancel the work for the others.
+    """
+    def __init__(self):
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    async def run(self, key: str, factory) -> Tuple[object, bool]:
+        """
+        :param factory: Coroutine function that produces the result.
+        :return: Tuple (result, True if the result was shared with an earlier caller).
+        """
+        task = self._pending.get(key)
+        coalesced = task is not None
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task), coalesced
+
+    def __len__(self):
+        return len(self._pending)
+
+
+def _serialize_source(doc) -> dict:
+    return {
+        "source": doc.metadata.get("source"),
+        "page": doc.metadata.get("page"),
+        "content": doc.page_content
+    }
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[List[Tuple[str, str]]] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or []
+
+
+class RaggyASGIApp:
+    """
+    The ASGI application. Models and stores are injected, so the service runs fully offline with fake models.
+    :param ingest_workers: IngestWorkerPool for /ingest and /jobs, None disables those endpoints.
+    """
+    def __init__(self, vector_store_manager, engine, ingest_workers=None):
+        self.vector_store_manager = vector_store_manager
+        self.engine = engine
+        self.ingest_workers = ingest_workers
+        self.instrumentation = get_instrumentation()
+        self.rate_limiter = RateLimiter(Config.API_RATE_LIMIT_PER_MINUTE, Config.API_RATE_LIMIT_BURST)
+        self.admission = AdmissionController(Config.API_MAX_INFLIGHT, Config.API_MAX_QUEUE,
+                                             Config.API_QUEUE_TIMEOUT_SECONDS)
+        self.coalescer = RequestCoalescer()
+        self._started = time.time()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        method, path = scope["method"], scope["path"].rstrip("/") or "/"
+        endpoint = path.split("/")[1] if path != "/" else "root"
+        status = 500
+        response_started = False
+
+        async def tracked_send(message):
+            nonlocal response_started
+            response_started = response_started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            status = await self._route(method, path, scope, receive, tracked_send)
+        except Exception as e:
+            if not response_started:
+                status = await self._send_error(send, method, path, e)
+            else:
+                # The status line is out already, the response can only be cut short.
+                logger.exception("Error after the response started on %s %s", method, path)
+        finally:
+            self.instrumentation.count("raggy_api_requests_total", endpoint=endpoint, status=str(status))
+
+    async def _send_error(self, send, method: str, path: str, error: Exception) -> int:
+        """Answers a request that failed before its response started."""
+        if isinstance(error, _HTTPError):
+            return await self._send_json(send, error.status, {"error": str(error)}, error.headers)
+        if isinstance(error, Overloaded):
+            self.instrumentation.count("raggy_api_shed_total", reason=error.reason)
+            return await self._send_json(send, 429, {"error": f"Server overloaded ({error.reason}), retry later."},
+                                         [("retry-after", str(max(1, round(error.retry_after))))])
+        logger.exception("Error handling %s %s", method, path)
+        return await self._send_json(send, 500, {"error": str(error)})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.ingest_workers is not None:
+                    self.ingest_workers.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _route(self, method: str, path: str, scope, receive, send) -> int:
+        parts = [unquote(part) for part in path.strip("/").split("/")]
+        if path == "/health" and method == "GET":
+            return await self._send_json(send, 200, self.health())
+        if path == "/metrics" and method == "GET":
+            body = self.instrumentation.registry.to_prometheus().encode("utf-8")
+            return await self._send(send, 200, body, "text/plain; version=0.0.4")
+
+        self._check_rate_limit(scope)
+        if path == "/ask" and method == "POST":
+            return await self._ask(receive, send)
+        if path == "/stream" and method == "POST":
+            return await self._stream(receive, send)
+        if path == "/ingest" and method == "POST":
+            return await self._ingest(scope, receive, send)
+        if parts[0] == "documents":
+            if len(parts) == 1 and method == "GET":
+                return await self._send_json(send, 200, {"documents": await self.vector_store_manager.alist_pdfs()})
+            if len(parts) == 2 and method == "DELETE":
+                state, msg = await self.vector_store_manager.adelete_pdf(parts[1])
+                return await self._send_json(send, 200 if state == 0 else 404, {"message": msg})
+        if parts[0] == "jobs" and len(parts) <= 2:
+            queue = self._require_ingest().queue
+            if len(parts) == 1 and method == "GET":
+                return await self._send_json(send, 200, {"jobs": queue.list_jobs()})
+            if len(parts) == 2 and method == "GET":
+                job = queue.get(parts[1])
+                if job is None:
+                    raise _HTTPError(404, "Job not found.")
+                return await self._send_json(send, 200, job)
+            if len(parts) == 2 and method == "DELETE":
+                if not queue.cancel(parts[1]):
+                    raise _HTTPError(404, "Job not found or already finished.")
+                return await self._send_json(send, 202, {"message": "Cancelling."})
+        raise _HTTPError(404, f"No route for {method} {path}.")
+
+    def health(self) -> dict:
+        return {
+            "status": "ok",
+            "uptime_seconds": round(time.time() - self._started, 1),
+            "inflight": self.admission.inflight,
+            "queued": self.admission.waiting,
+            "coalescing": len(self.coalescer),
+            "corpus_version": self.vector_store_manager.corpus_version()
+        }
+
+    def _check_rate_limit(self, scope):
+        client = ""
+        if Config.API_TRUST_CLIENT_ID_HEADER:
+            # Any client could pick a fresh ID per request, so only a trusted proxy may set it.
+            client = dict(scope.get("headers") or []).get(b"x-client-id", b"").decode("latin-1")
+        if not client:
+            client = (scope.get("client") or ("unknown",))[0]
+        wait = self.rate_limiter.acquire(client)
+        if wait:
+            self.instrumentation.count("raggy_api_shed_total", reason="rate_limit")
+            raise _HTTPError(429, "Rate limit exceeded.", [("retry-after", str(max(1, round(wait))))])
+
+    def _require_ingest(self):
+        if self.ingest_workers is None:
+            raise _HTTPError(501, "Ingestion is disabled on this server.")
+        return self.ingest_workers
+
+    async def _read_query(self, receive) -> Tuple[str, dict, Optional[str]]:
+        """:return: Tuple (query, retrieval filters as keyword arguments of RAGgy_Engine.aask, session ID or None)."""
+        body = await self._read_body(receive, 64 * 1024)
+        try:
+            data = json.loads(body or b"{}")
+            query = data.get("query")
+        except (ValueError, AttributeError):
+            raise _HTTPError(400, "Expected a JSON object with a 'query'.")
+        if not isinstance(query, str) or not query.strip():
+            raise _HTTPError(400, "Expected a JSON object with a 'query'.")
+        filters = {key: data[key] for key in ("sources", "pages", "ingested_after", "ingested_before")
+                   if data.get(key) is not None}
+        try:
+            # Validated here, so a bad filter is a client error and not a pipeline error.
+            build_filter(**filters)
+        except (ValueError, TypeError) as e:
+            raise _HTTPError(400, f"Invalid filter: {e}")
+        session_id = data.get("session_id")
+        if session_id is not None and (not isinstance(session_id, str) or not 0 < len(session_id) <= 128):
+            raise _HTTPError(400, "'session_id' must be a string of at most 128 characters.")
+        return query, filters, session_id
+
+    async def _ask(self, receive, send) -> int:
+        query, filters, session_id = await self._read_query(receive)
+
+        async def run():
+            async with self.admission.slot():
+                return await self.engine.aask(query, **filters, session_id=session_id)
+
+        key = f"{session_id or ''}\x00{filter_key(build_filter(**filters))}\x00{normalize_query(query)}"
+        response, coalesced = await self.coalescer.run(key, run)
+        if coalesced:
+            self.instrumentation.count("raggy_api_coalesced_total")
+        if not isinstance(response, dict):
+            # aask reports pipeline errors as a message string
+            raise _HTTPError(502, str(response))
+        return await self._send_json(send, 200, {
+            "answer": response["answer"],
+            "sources": [_serialize_source(doc) for doc in response.get("docs", [])],
+            "coalesced": coalesced
+        })
+
+    async def _stream(self, receive, send) -> int:
+        query, filters, session_id = await self._read_query(receive)
+        async with self.admission.slot():
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"application/x-ndjson")]})
+            status = 200
+            try:
+                async for chunk in self.engine.astream(query, **filters, session_id=session_id):
+                    if "docs" in chunk:
+                        chunk = {"docs": [_serialize_source(doc) for doc in chunk["docs"]]}
+                    line = json.dumps(chunk, default=str) + "\n"
+                    await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+            except Exception as e:
+                # The 200 is sent already, the error ends the stream as its last line.
+                logger.exception("Error while streaming an answer")
+                line = json.dumps({"error": str(e)}) + "\n"
+                await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+                status = 500
+            await send({"type": "http.response.body", "body": b""})
+        return status
+
+    async def _ingest(self, scope, receive, send) -> int:
+        ingest_workers = self._require_ingest()
+        params = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        filename = Path((params.get("filename") or [""])[0]).name
+        if not filename.lower().endswith(".pdf"):
+            raise _HTTPError(400, "Pass the PDF name as ?filename=<name>.pdf")
+        Config.UPLOAD_DIRECTORY.mkdir(parents=True, exist_ok=True)
+        limit = Config.API_MAX_UPLOAD_MB * 1024 * 1024
+        received = 0
+        # Stream the body to disk, uploads can be far larger than memory should hold
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=Config.UPLOAD_DIRECTORY) as tmp_file:
+            try:
+                while True:
+                    message = await receive()
+                    chunk = message.get("body", b"")
+                    received += len(chunk)
+                    if received > limit:
+                        raise _HTTPError(413, f"Upload exceeds {Config.API_MAX_UPLOAD_MB} MB.")
+                    tmp_file.write(chunk)
+                    if not message.get("more_body"):
+                        break
+            except BaseException:
+                tmp_file.close()
+                os.remove(tmp_file.name)
+                raise
+        if received == 0:
+            os.remove(tmp_file.name)
+            raise _HTTPError(400, "Empty upload.")
+        job_id = ingest_workers.submit(tmp_file.name, filename, delete_file=True)
+        return await self._send_json(send, 202, {"job_id": job_id})
+
+    @staticmethod
+    async def _read_body(receive, limit: int) -> bytes:
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > limit:
+                raise _HTTPError(413, "Request body too large.")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    @staticmethod
+    async def _send(send, status: int, body: bytes, content_type: str,
+                    headers: Optional[List[Tuple[str, str]]] = None) -> int:
+        raw_headers = [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+        raw_headers += [(name.encode(), value.encode()) for name, value in headers or []]
+        await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": body})
+        return status
+
+    async def _send_json(self, send, status: int, data: dict,
+                         headers: Optional[List[Tuple[str, str]]] = None) -> int:
+        return await self._send(send, status, json.dumps(data, default=str).encode("utf-8"),
+                                "application/json", headers)
+
+
+def create_app(vector_store_manager=None, engine=None, ingest_workers=None, embeddings=None, llm=None,
+               enable_ingest: bool = True) -> RaggyASGIApp:
+    """
+    Builds the service. Missing components are created from Config, embeddings and llm replace the Google models
+    (e.g. local fakes for offline tests and load tests).
+    """
+    from src.ingest_queue import IngestJobQueue, IngestWorkerPool
+    from src.raggy_engine import RAGgy_Engine
+    from src.vector_store import VectorStoreManager
+
+    if vector_store_manager is None:
+        vector_store_manager = VectorStoreManager(embeddings=embeddings)
+    if engine is None:
+        engine = RAGgy_Engine(vector_store_manager, llm=llm)
+    if ingest_workers is None and enable_ingest:
+        ingest_queue = IngestJobQueue(Config.INGEST_QUEUE_PATH, Config.INGEST_QUEUE_LEASE_SECONDS)
+        ingest_workers = IngestWorkerPool(vector_store_manager, ingest_queue, workers=Config.INGEST_QUEUE_WORKERS)
+    return RaggyASGIApp(vector_store_manager, engine, ingest_workers)
@@ -0,0 +1,113 @@
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+# Adjacent chunks share at most CHUNK_OVERLAP characters, shorter matches are coincidence.
+_MIN_OVERLAP = 20
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about 4 characters per token for Gemini on English text)."""
+    return max(1, len(text) // 4)
+
+
+class _Segment:
+    def __init__(self, source: Optional[str], page: Optional[int], page_label: Optional[str], text: str):
+        self.source = source
+        self.page = page
+        self.page_label = page_label
+        self.text = text
+
+
+def _overlap(first: str, second: str, max_overlap: int) -> int:
+    """Length of the longest suffix of first that is a prefix of second."""
+    for length in range(min(len(first), len(second), max_overlap), _MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+def merge_adjacent(docs: Sequence[Document], max_overlap: int = 400) -> List[_Segment]:
+    """
+    Merges chunks of the same source and page whose texts overlap (neighbours from the splitter),
+    so the overlap is sent once. Segments keep the rank of their best chunk.
+    """
+    segments: List[_Segment] = []
+    for doc in docs:
+        meta = doc.metadata
+        text = doc.page_content.strip()
+        merged = False
+        for segment in segments:
+            if (segment.source, segment.page) != (meta.get("source"), meta.get("page")):
+                continue
+            if text in segment.text:
+                merged = True
+            elif length := _overlap(segment.text, text, max_overlap):
+                segment.text += text[length:]
+                merged = True
+            elif length := _overlap(text, segment.text, max_overlap):
+                segment.text = text + segment.text[length:]
+                merged = True
+            if merged:
+                break
+        if not merged:
+            segments.append(_Segment(meta.get("source"), meta.get("page"), meta.get("page_label"), text))
+    return segments
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text at the last sentence boundary within max_tokens, at a word boundary if the first sentence is too long."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    result = ""
+    for sentence in _SENTENCE_END.split(text):
+        candidate = f"{result} {sentence}" if result else sentence
+        if estimate_tokens(candidate) > max_tokens:
+            break
+        result = candidate
+    if not result:
+        result = text[:max_tokens * 4].rsplit(" ", 1)[0] + " ..."
+    return result
+
+
+def _source_tag(segment: _Segment) -> str:
+    if segment.page_label is not None:
+        page = segment.page_label
+    elif segment.page is not None:
+        page = segment.page + 1  # PyPDFLoader pages are 0-based
+    else:
+        return f"[{segment.source or 'unknown'}]"
+    return f"[{segment.source or 'unknown'} p.{page}]"
+
+
+def pack_context(docs: Sequence[Document], token_budget: Optional[int]) -> Tuple[str, int, int]:
+    """
+    Greedily packs retrieved chunks (best first) into token_budget estimated tokens.
+    Overlapping neighbours are merged, a segment that does not fit whole is cut at a sentence boundary
+    and every segment is prefixed with a compact source tag like "[manual.pdf p.3]".
+    A token_budget of None packs everything. The budget covers the source tags, the returned token counts only
+    cover chunk text, so packed and dropped tokens add up to the tokens of the retrieved chunks.
+    :return: Tuple (context, packed chunk text tokens, dropped tokens of merged overlap, truncated and skipped text).
+    """
+    segments = merge_adjacent(docs)
+    total = sum(estimate_tokens(doc.page_content) for doc in docs)
+    parts, used, packed = [], 0, 0
+    for segment in segments:
+        tag = _source_tag(segment)
+        cost = estimate_tokens(tag) + estimate_tokens(segment.text)
+        if token_budget is None or used + cost <= token_budget:
+            text = segment.text
+        else:
+            remaining = token_budget - used - estimate_tokens(tag)
+            # Fragments of a few tokens add noise, not information.
+            if remaining < 32:
+                continue
+            text = truncate_to_tokens(segment.text, remaining)
+            cost = estimate_tokens(tag) + estimate_tokens(text)
+        parts.append(f"{tag}\n{text}")
+        used += cost
+        packed += estimate_tokens(text)
+    packed = min(packed, total)
+    return "\n\n".join(parts), packed, total - packed
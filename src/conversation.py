@@ -0,0 +1,197 @@
+"""
+Conversation sessions of RAGgy_Engine. A session keeps its recent turns verbatim up to
+Config.SESSION_HISTORY_TOKENS estimated tokens, older turns are folded into a rolling summary of at most
+SESSION_SUMMARY_TOKENS that the LLM writes on a background thread. The history sent with a question is therefore
+bounded however long the conversation runs.
+A follow-up whose content words are found in the chunks of the previous retrieval is answered from those chunks
+without retrieving again, a vague follow-up that needs a retrieval is searched together with the previous question.
+Sessions live in an LRU store of at most SESSION_MAX_SESSIONS and expire after SESSION_IDLE_TTL_SECONDS.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from src.context_packer import estimate_tokens, truncate_to_tokens
+from src.query_expansion import content_terms, is_specific
+
+logger = logging.getLogger(__name__)
+
+# Follow-ups with fewer content words and without an identifier are retrieved together with the previous question.
+_SPECIFIC_QUESTION_TERMS = 4
+
+# (summary so far, [(question, answer), ...] to fold in) -> new summary
+Summarizer = Callable[[str, List[Tuple[str, str]]], str]
+
+
+class Session:
+    """History of one conversation, all fields are guarded by lock."""
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.lock = threading.Lock()
+        self.turns: List[Tuple[str, str, int]] = []  # (question, answer, estimated tokens), oldest first
+        self.folding: List[Tuple[str, str, int]] = []  # Older turns waiting for the summarizer
+        self.summary = ""
+        self.docs: List[Document] = []  # Chunks of the last retrieval
+        self.doc_terms: frozenset = frozenset()
+        self.docs_key: Optional[tuple] = None  # (filter key, corpus version) the chunks were retrieved with
+        self.last_access = time.monotonic()
+
+
+class Turn:
+    """
+    One question, created by SessionStore.begin_turn.
+    docs are the chunks of the previous turn to answer from, None if the question needs a retrieval with
+    retrieval_query. history holds the earlier turns as chat messages and summary the turns before those.
+    Without history the answer only depends on the question, so use_cache allows the answer cache.
+    """
+    def __init__(self, session: Optional[Session], query: str, docs_key: Optional[tuple] = None):
+        self.session = session
+        self.query = query
+        self.docs_key = docs_key
+        self.docs: Optional[List[Document]] = None
+        self.retrieval_query = query
+        self.history: List[BaseMessage] = []
+        self.summary = ""
+        self.history_tokens = 0
+        self.use_cache = True
+
+
+def _extract(summary: str, turns: List[Tuple[str, str, int]], max_tokens: int) -> str:
+    """Fallback summary without the LLM: the summary so far and the folded questions, newest kept first."""
+    lines = ([summary] if summary else []) + [f"The user asked: {question}" for question, _, _ in turns]
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class SessionStore:
+    """
+    Sessions by ID in LRU order: beyond max_sessions the least recently used session is evicted, sessions idle for
+    longer than ttl_seconds are dropped. summarize writes the rolling summaries on one background thread,
+    so no answer waits for it. If it fails or is None, the folded questions are kept as an extract.
+    """
+    def __init__(self, summarize: Optional[Summarizer] = None, max_sessions: int = 1000,
+                 ttl_seconds: float = 2 * 60 * 60, history_tokens: int = 800, summary_tokens: int = 200,
+                 reuse_min_coverage: float = 0.8):
+        self.summarize = summarize
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.reuse_min_coverage = reuse_min_coverage
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="raggy-session-summary")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _get(self, session_id: str) -> Session:
+        now = time.monotonic()
+        with self._lock:
+            # LRU order is access order, so expired sessions are at the front.
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest.last_access <= self.ttl_seconds:
+                    break
+                self._sessions.popitem(last=False)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session(session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+            session.last_access = now
+        return session
+
+    def end(self, session_id: str):
+        """Forgets a conversation, e.g. when the user starts a new chat."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def begin_turn(self, session_id: Optional[str], query: str, docs_key: Optional[tuple] = None) -> Turn:
+        """
+        Prepares a question of a session: its history, and whether the chunks of the previous turn still cover it.
+        :param session_id: None for a stateless question.
+        :param docs_key: (filter key, corpus version) of the question, chunks of another scope or corpus are not reused.
+        """
+        if session_id is None:
+            return Turn(None, query)
+        session = self._get(session_id)
+        turn = Turn(session, query, docs_key)
+        terms = content_terms(query)
+        with session.lock:
+            history = session.folding + session.turns
+            if not history:
+                return turn
+            turn.use_cache = False
+            last_question = history[-1][0]
+            if session.docs and session.docs_key == docs_key:
+                covered = session.doc_terms | content_terms(last_question)
+                coverage = len(terms & covered) / len(terms) if terms else 1.0
+                if coverage >= self.reuse_min_coverage:
+                    turn.docs = list(session.docs)
+            if turn.docs is None and not is_specific(query, _SPECIFIC_QUESTION_TERMS):
+                turn.retrieval_query = f"{last_question}\n{query}"
+            turn.summary = session.summary
+            turn.history_tokens = estimate_tokens(session.summary) if session.summary else 0
+        # Newest turns first up to the cap, turns still waiting for a busy summarizer stay out of the prompt.
+        recent, used = [], 0
+        for question, answer, tokens in reversed(history):
+            if recent and used + tokens > self.history_tokens:
+                break
+            recent.append((question, answer))
+            used += tokens
+        turn.history = [message for question, answer in reversed(recent)
+                        for message in (HumanMessage(question), AIMessage(answer))]
+        turn.history_tokens += used
+        return turn
+
+    def end_turn(self, turn: Turn, answer: str, docs: List[Document]):
+        """Adds the answered question to its session and starts the summarizer once the history is over its cap."""
+        session = turn.session
+        if session is None:
+            return
+        # A single long answer must not take the whole history budget.
+        question = truncate_to_tokens(turn.query, self.history_tokens // 4)
+        answer = truncate_to_tokens(answer or "", self.history_tokens // 2)
+        tokens = estimate_tokens(question) + estimate_tokens(answer)
+        retrieved = docs is not turn.docs
+        doc_terms = frozenset(content_terms(" ".join(doc.page_content for doc in docs))) if retrieved else None
+        with session.lock:
+            session.turns.append((question, answer, tokens))
+            if retrieved:
+                session.docs, session.doc_terms, session.docs_key = list(docs), doc_terms, turn.docs_key
+            fold = []
+            total = sum(turn_tokens for _, _, turn_tokens in session.turns)
+            if total > self.history_tokens:
+                # Fold down to half the cap, so the summarizer runs every few turns and not on every turn.
+                # The last turn always stays verbatim, follow-ups mostly refer to it.
+                while len(session.turns) > 1 and total > self.history_tokens // 2:
+                    fold.append(session.turns.pop(0))
+                    total -= fold[-1][2]
+                session.folding.extend(fold)
+        if fold:
+            self._executor.submit(self._fold, session, len(fold))
+
+    def _fold(self, session: Session, n: int):
+        # Jobs run one at a time in submission order, so the first n folding turns are the ones of this job.
+        with session.lock:
+            summary, turns = session.summary, session.folding[:n]
+        text = None
+        if self.summarize is not None:
+            try:
+                text = self.summarize(summary, [(question, answer) for question, answer, _ in turns])
+            except Exception as e:
+                logger.warning("Summarizing the conversation failed, keeping the questions only: %s", e)
+        text = (text or "").strip() or _extract(summary, turns, self.summary_tokens)
+        with session.lock:
+            session.summary = truncate_to_tokens(text, self.summary_tokens)
+            del session.folding[:n]
@@ -0,0 +1,201 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+
+
+class DocumentRegistry:
+    """
+    SQLite index of all ingested documents, kept beside the Chroma store.
+    Maps every source file to its chunk IDs, page count, file hash and ingest time, so listing and deleting
+    documents never has to scan the metadata of the whole collection.
+    """
+    def __init__(self, db_path: Union[str, Path]):
+        self._lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                source TEXT PRIMARY KEY,
+                file_hash TEXT,
+                page_count INTEGER NOT NULL DEFAULT 0,
+                chunk_count INTEGER NOT NULL DEFAULT 0,
+                ingested_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL REFERENCES documents(source) ON DELETE CASCADE
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source);
+            CREATE TABLE IF NOT EXISTS corpus (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO corpus (id, version) VALUES (0, 0);
+            CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+                source TEXT PRIMARY KEY,
+                file_hash TEXT NOT NULL,
+                next_page INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS checkpoint_chunks (
+                chunk_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL REFERENCES ingest_checkpoints(source) ON DELETE CASCADE
+            );
+            """
+        )
+        self._conn.commit()
+
+    def register(self, source: str, file_hash: Optional[str], page_count: int,
+                 chunk_ids: Iterable[str], replace: bool = True):
+        """
+        Records a document and its chunks.
+        :param replace: If True the given IDs replace the stored ones, otherwise they are added to them.
+        """
+        chunk_ids = list(chunk_ids)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO documents (source, file_hash, page_count, ingested_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(source) DO UPDATE SET file_hash = excluded.file_hash, "
+                "page_count = excluded.page_count, ingested_at = excluded.ingested_at",
+                (source, file_hash, page_count, time.time())
+            )
+            if replace:
+                self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, source) VALUES (?, ?)",
+                [(chunk_id, source) for chunk_id in chunk_ids]
+            )
+            self._conn.execute(
+                "UPDATE documents SET chunk_count = (SELECT COUNT(*) FROM chunks WHERE source = ?) WHERE source = ?",
+                (source, source)
+            )
+            self._bump_corpus_version()
+
+    def remove(self, source: str) -> List[str]:
+        """
+        Removes a document from the registry.
+        :return: The chunk IDs that belonged to the document.
+        """
+        with self._lock, self._conn:
+            ids = [row[0] for row in self._conn.execute("SELECT chunk_id FROM chunks WHERE source = ?", (source,))]
+            self._conn.execute("DELETE FROM documents WHERE source = ?", (source,))
+            self._bump_corpus_version()
+            return ids
+
+    def _bump_corpus_version(self):
+        self._conn.execute("UPDATE corpus SET version = version + 1 WHERE id = 0")
+
+    def corpus_version(self) -> int:
+        """
+        Counter that changes whenever a document is added, updated or removed.
+        Caches derived from the corpus use it to detect that they are stale.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT version FROM corpus WHERE id = 0").fetchone()[0]
+
+    def get_chunk_ids(self, source: str) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT chunk_id FROM chunks WHERE source = ?", (source,))]
+
+    def get_file_hash(self, source: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT file_hash FROM documents WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def list_sources(self) -> List[str]:
+        """Registered documents and partially ingested ones with a checkpoint, whose written chunks are retrievable."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT source FROM documents UNION SELECT source FROM ingest_checkpoints ORDER BY source"
+            )]
+
+    def list_documents(self) -> List[dict]:
+        """
+        Lists all documents with their bookkeeping data.
+        :return: List of dicts with source, file_hash, page_count, chunk_count and ingested_at.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, file_hash, page_count, chunk_count, ingested_at FROM documents ORDER BY source"
+            ).fetchall()
+        keys = ("source", "file_hash", "page_count", "chunk_count", "ingested_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def get_checkpoint(self, source: str, file_hash: Optional[str] = None):
+        """
+        Progress of an interrupted streaming ingest of exactly this file version.
+        :param file_hash: None matches the checkpoint of any version.
+        :return: Tuple (next page to process, chunk IDs already written) or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT next_page FROM ingest_checkpoints WHERE source = ? AND file_hash = COALESCE(?, file_hash)",
+                (source, file_hash)
+            ).fetchone()
+            if row is None:
+                return None
+            ids = [r[0] for r in self._conn.execute("SELECT chunk_id FROM checkpoint_chunks WHERE source = ?",
+                                                    (source,))]
+        return row[0], ids
+
+    def save_checkpoint(self, source: str, file_hash: str, next_page: int, chunk_ids: Iterable[str]):
+        """Records that all pages before next_page are written, together with the chunk IDs of the last window."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT file_hash FROM ingest_checkpoints WHERE source = ?",
+                                     (source,)).fetchone()
+            if row is not None and row[0] != file_hash:
+                # A different version of the file was interrupted before, its progress does not apply.
+                self._conn.execute("DELETE FROM ingest_checkpoints WHERE source = ?", (source,))
+            self._conn.execute(
+                "INSERT INTO ingest_checkpoints (source, file_hash, next_page, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(source) DO UPDATE SET next_page = excluded.next_page, updated_at = excluded.updated_at",
+                (source, file_hash, next_page, time.time())
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO checkpoint_chunks (chunk_id, source) VALUES (?, ?)",
+                [(chunk_id, source) for chunk_id in chunk_ids]
+            )
+
+    def clear_checkpoint(self, source: str) -> List[str]:
+        """:return: The chunk IDs the checkpoint recorded as written."""
+        with self._lock, self._conn:
+            ids = [row[0] for row in self._conn.execute("SELECT chunk_id FROM checkpoint_chunks WHERE source = ?",
+                                                        (source,))]
+            self._conn.execute("DELETE FROM ingest_checkpoints WHERE source = ?", (source,))
+        return ids
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None
+
+    def rebuild(self, vector_store, page_size: int = 5000):
+        """
+        One-time migration for collections that were filled before the registry existed.
+        Pages through the collection metadata and registers every source found.
+        """
+        documents = {}
+        offset = 0
+        while True:
+            data = vector_store.get(include=['metadatas'], limit=page_size, offset=offset)
+            ids = data.get('ids', [])
+            if not ids:
+                break
+            for chunk_id, meta in zip(ids, data.get('metadatas', [])):
+                if not meta or "source" not in meta:
+                    continue
+                doc = documents.setdefault(meta["source"], {"file_hash": None, "pages": set(), "ids": []})
+                doc["file_hash"] = meta.get("file_hash", doc["file_hash"])
+                doc["pages"].add(meta.get("page"))
+                doc["ids"].append(chunk_id)
+            offset += len(ids)
+        for source, doc in documents.items():
+            self.register(source, doc["file_hash"], len(doc["pages"]), doc["ids"])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import inspect
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Callable, List, Union
+
+from langchain_core.embeddings import Embeddings
+
+from src.instrumentation import get_instrumentation
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed, on-disk cache in front of an embedding model.
+    Vectors are keyed by hash(model name + task + text) and stored as float32 in SQLite.
+    The least recently used entries are evicted once max_entries is exceeded.
+    """
+    def __init__(self, embeddings: Union[Embeddings, Callable[[], Embeddings]], model_name: str,
+                 cache_path: Union[str, Path], max_entries: int = 200_000):
+        """
+        :param embeddings: The embedding model, or a factory for it that is only called on the first cache miss.
+        """
+        self._embeddings = embeddings if isinstance(embeddings, Embeddings) else None
+        self._factory = None if isinstance(embeddings, Embeddings) else embeddings
+        self._model_lock = threading.Lock()
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(cache_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)"
+        )
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @property
+    def embeddings(self) -> Embeddings:
+        if self._embeddings is None:
+            with self._model_lock:
+                if self._embeddings is None:
+                    self._embeddings = self._factory()
+        return self._embeddings
+
+    def _key(self, task: str, text: str) -> str:
+        # Query and document embeddings use different task types, so they never share a key.
+        return hashlib.sha256(f"{self.model_name}\x00{task}\x00{text}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _encode(vector: List[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    def _lookup(self, keys: List[str]) -> dict:
+        """
+        Fetches cached vectors for the given keys and refreshes their LRU timestamp.
+        :return: Dict key -> vector for all keys found in the cache.
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit.
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = self._decode(blob)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, items: dict):
+        """Writes new vectors to the cache and evicts the least recently used entries if needed."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, self._encode(vector), now) for key, vector in items.items()]
+            )
+            self._size += self._conn.total_changes - before
+            if self._size > self.max_entries:
+                overflow = self._size - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self._size -= overflow
+            self._conn.commit()
+
+    def _split(self, task: str, texts: List[str]):
+        keys = [self._key(task, text) for text in texts]
+        cached = self._lookup(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        misses = sum(1 for key in keys if key in missing)
+        with self._lock:
+            self.hits += len(keys) - misses
+            self.misses += misses
+        instrumentation = get_instrumentation()
+        instrumentation.count("raggy_embedding_cache_total", len(keys) - misses, task=task, result="hit")
+        instrumentation.count("raggy_embedding_cache_total", misses, task=task, result="miss")
+        if task == "query" and len(keys) == 1:
+            instrumentation.set_attribute("embedding_cache", "miss" if misses else "hit")
+        return keys, cached, missing
+
+    def _merge(self, keys: List[str], cached: dict, missing: dict, vectors: List[List[float]]):
+        # Round fresh vectors through float32 so hits and misses return identical values.
+        fresh = {key: self._decode(self._encode(vector)) for key, vector in zip(missing, vectors)}
+        self._store(fresh)
+        cached.update(fresh)
+        return [cached[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._split("document", texts)
+        vectors = self.embeddings.embed_documents(list(missing.values())) if missing else []
+        return self._merge(keys, cached, missing, vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        with get_instrumentation().stage("query_embedding"):
+            keys, cached, missing = self._split("query", [text])
+            vectors = [self.embeddings.embed_query(text)] if missing else []
+            return self._merge(keys, cached, missing, vectors)[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._split("document", texts)
+        vectors = await self.embeddings.aembed_documents(list(missing.values())) if missing else []
+        return self._merge(keys, cached, missing, vectors)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        with get_instrumentation().stage("query_embedding"):
+            keys, cached, missing = self._split("query", [text])
+            vectors = [await self.embeddings.aembed_query(text)] if missing else []
+            return self._merge(keys, cached, missing, vectors)[0]
+
+    def _supports_query_batches(self) -> bool:
+        return "task_type" in inspect.signature(self.embeddings.embed_documents).parameters
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds many queries at once. Uses a single batched request with the query task type if the
+        underlying model supports it, or its own embed_queries (local and fake models), and shares the cache
+        entries with embed_query.
+        """
+        keys, cached, missing = self._split("query", texts)
+        if not missing:
+            vectors = []
+        elif self._supports_query_batches():
+            vectors = self.embeddings.embed_documents(list(missing.values()), task_type="RETRIEVAL_QUERY")
+        elif hasattr(self.embeddings, "embed_queries"):
+            vectors = self.embeddings.embed_queries(list(missing.values()))
+        else:
+            vectors = [self.embeddings.embed_query(text) for text in missing.values()]
+        return self._merge(keys, cached, missing, vectors)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Async variant of embed_queries."""
+        keys, cached, missing = self._split("query", texts)
+        if not missing:
+            vectors = []
+        elif self._supports_query_batches():
+            vectors = await self.embeddings.aembed_documents(list(missing.values()), task_type="RETRIEVAL_QUERY")
+        elif hasattr(self.embeddings, "aembed_queries"):
+            vectors = await self.embeddings.aembed_queries(list(missing.values()))
+        else:
+            vectors = await asyncio.gather(*(self.embeddings.aembed_query(text) for text in missing.values()))
+        return self._merge(keys, cached, missing, vectors)
+
+    def stats(self) -> dict:
+        """
+        Returns cache counters.
+        :return: Dict with hits, misses, hit_rate and the number of stored entries.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": self._size,
+                "max_entries": self.max_entries,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,128 @@
+"""
+Deterministic local stand-ins for the Google embedding and chat models, used by the benchmarks and the "fake"
+model provider. Both simulate network latency, so benchmarks measure the pipeline under realistic timing without
+any API call.
+"""
+import asyncio
+import hashlib
+import math
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashing-trick bag-of-words embeddings: texts sharing words get similar vectors, so retrieval
+    results stay meaningful. Each call sleeps call_latency_ms plus per_text_latency_ms per text.
+    """
+    def __init__(self, size: int = 256, call_latency_ms: float = 0.0, per_text_latency_ms: float = 0.0):
+        self.size = size
+        self.call_latency_ms = call_latency_ms
+        self.per_text_latency_ms = per_text_latency_ms
+        self.calls = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for token in _TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _latency(self, n_texts: int) -> float:
+        return (self.call_latency_ms + self.per_text_latency_ms * n_texts) / 1000
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self._latency(len(texts)))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        time.sleep(self._latency(1))
+        return self._embed(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        self.calls += 1
+        await asyncio.sleep(self._latency(len(texts)))
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        await asyncio.sleep(self._latency(1))
+        return self._embed(text)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await self.aembed_documents(texts)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers with the first words of the system prompt context.
+    Simulates time to first token and per-token latency and reports token usage like Gemini does.
+    """
+    answer_tokens: int = 40
+    first_token_latency_ms: float = 0.0
+    token_latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "raggy-fake-chat"
+
+    def _answer(self, messages: List[BaseMessage]) -> List[str]:
+        text = " ".join(str(message.content) for message in messages)
+        words = _TOKEN_PATTERN.findall(text) or ["empty"]
+        return [words[i % len(words)] + " " for i in range(self.answer_tokens)]
+
+    def _usage(self, messages: List[BaseMessage], tokens: List[str]) -> dict:
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        return {"input_tokens": input_tokens, "output_tokens": len(tokens),
+                "total_tokens": input_tokens + len(tokens)}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._answer(messages)
+        time.sleep((self.first_token_latency_ms + self.token_latency_ms * len(tokens)) / 1000)
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._answer(messages)
+        await asyncio.sleep((self.first_token_latency_ms + self.token_latency_ms * len(tokens)) / 1000)
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        tokens = self._answer(messages)
+        time.sleep(self.first_token_latency_ms / 1000)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.token_latency_ms / 1000)
+            usage = self._usage(messages, tokens) if i == len(tokens) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = self._answer(messages)
+        await asyncio.sleep(self.first_token_latency_ms / 1000)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.token_latency_ms / 1000)
+            usage = self._usage(messages, tokens) if i == len(tokens) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
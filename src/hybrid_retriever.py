@@ -0,0 +1,96 @@
+import asyncio
+import contextvars
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.instrumentation import get_instrumentation
+from src.shared_clients import get_search_executor, run_in_search_executor
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[Document]], weights: Sequence[float],
+                           rrf_k: int = 60) -> List[Tuple[Document, float]]:
+    """
+    Fuses several ranked result lists: score(d) = sum_i weight_i / (rrf_k + rank_i(d)).
+    Documents are matched by their chunk ID.
+    :return: List of (Document, fused score), best first.
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, doc in enumerate(results, start=1):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(docs[key], score) for key, score in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Runs vector similarity search and BM25 keyword search side by side and fuses the rankings with RRF.
+    The stages are timed as vector_search, keyword_search and fusion in the trace of the request.
+    """
+    vector_store: Any
+    keyword_index: Any
+    k: int = 5
+    fetch_k: int = 20
+    vector_weight: float = 1.0
+    keyword_weight: float = 1.0
+    rrf_k: int = 60
+
+    def _vector_search(self, query: str, filter: Optional[dict] = None) -> List[Document]:
+        with get_instrumentation().stage("vector_search"):
+            return self.vector_store.similarity_search(query, k=self.fetch_k, filter=filter)
+
+    def _keyword_search(self, query: str, filter: Optional[dict] = None) -> List[Document]:
+        with get_instrumentation().stage("keyword_search"):
+            return [doc for doc, _ in self.keyword_index.search(query, k=self.fetch_k, filter=filter)]
+
+    async def _avector_search(self, query: str, filter: Optional[dict] = None) -> List[Document]:
+        with get_instrumentation().stage("vector_search"):
+            return await self.vector_store.asimilarity_search(query, k=self.fetch_k, filter=filter)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                filter: Optional[dict] = None) -> List[Document]:
+        # The vector side waits on the embedding API, the keyword side runs locally in the meantime.
+        # The copied context keeps its stage timing in the trace of this request.
+        vector_future = get_search_executor().submit(contextvars.copy_context().run, self._vector_search, query,
+                                                     filter)
+        keyword_docs = self._keyword_search(query, filter)
+        return self._fuse(vector_future.result(), keyword_docs)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager,
+                                       filter: Optional[dict] = None) -> List[Document]:
+        vector_docs, keyword_docs = await asyncio.gather(
+            self._avector_search(query, filter), run_in_search_executor(self._keyword_search, query, filter)
+        )
+        return self._fuse(vector_docs, keyword_docs)
+
+    def _fuse(self, vector_docs: List[Document], keyword_docs: List[Document]) -> List[Document]:
+        with get_instrumentation().stage("fusion"):
+            fused = reciprocal_rank_fusion(
+                [vector_docs, keyword_docs], [self.vector_weight, self.keyword_weight], self.rrf_k
+            )[:self.k]
+            return [
+                Document(id=doc.id, page_content=doc.page_content, metadata={**doc.metadata, "rrf_score": score})
+                for doc, score in fused
+            ]
+
+
+class KeywordRetriever(BaseRetriever):
+    """Pure BM25 retriever. Needs no embedding call, so it works fully offline."""
+    keyword_index: Any
+    k: int = 5
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                filter: Optional[dict] = None) -> List[Document]:
+        with get_instrumentation().stage("keyword_search"):
+            return [doc for doc, _ in self.keyword_index.search(query, k=self.k, filter=filter)]
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager,
+                                       filter: Optional[dict] = None) -> List[Document]:
+        return await run_in_search_executor(self._get_relevant_documents, query, run_manager=run_manager,
+                                            filter=filter)
@@ -0,0 +1,282 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+_FINISHED = (DONE, FAILED, CANCELLED)
+_COLUMNS = ("job_id", "file_path", "source", "status", "pages_done", "total_pages", "message",
+            "cancel_requested", "delete_file", "created_at", "started_at", "finished_at", "owner", "lease_expires_at")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _remove_file(path: str):
+    """Removes the uploaded temporary file of a finished or cancelled job."""
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning("Could not remove %s: %s", path, e)
+
+
+class IngestJobQueue:
+    """
+    Persistent queue of PDF ingestion jobs (SQLite). Every job has a status
+    (queued, running, done, failed, cancelled), page progress and a result message.
+    Several processes can share the queue: a worker claims a job together with a lease of lease_seconds and renews
+    it while the job runs. Jobs whose lease has expired (their process died) are queued again and resume from their
+    ingest checkpoint.
+    """
+    def __init__(self, db_path: Union[str, Path], lease_seconds: float = 60.0):
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                file_path TEXT NOT NULL,
+                source TEXT NOT NULL,
+                status TEXT NOT NULL,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                total_pages INTEGER NOT NULL DEFAULT 0,
+                message TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                delete_file INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner TEXT,
+                lease_expires_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, sql_type in (("owner", "TEXT"), ("lease_expires_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {sql_type}")
+        self._conn.commit()
+        # Only jobs of dead workers are queued again, jobs of other live processes keep running.
+        with self._lock, self._conn:
+            self._requeue_expired()
+
+    def _requeue_expired(self):
+        # Running jobs without a lease were claimed before leases existed.
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, owner = NULL, lease_expires_at = NULL "
+            "WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)", (QUEUED, RUNNING, time.time())
+        )
+
+    def submit(self, file_path: Union[str, Path], source: str, delete_file: bool = False) -> str:
+        """
+        Queues a PDF for ingestion under the given source name.
+        :param delete_file: Delete file_path once the job has finished (e.g. for uploaded temp files).
+        :return: The job ID.
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, file_path, source, status, delete_file, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, str(file_path), source, QUEUED, int(delete_file), time.time())
+            )
+        return job_id
+
+    def claim(self) -> Optional[dict]:
+        """
+        Marks the oldest queued job as running under a lease of this queue's owner and returns it,
+        None if the queue is empty. BEGIN IMMEDIATE takes the database write lock before the job is selected,
+        so two processes never claim the same job.
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._requeue_expired()
+                rows = self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, lease_expires_at = ?, started_at = ? "
+                    "WHERE job_id = (SELECT job_id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1) "
+                    f"AND status = ? RETURNING {', '.join(_COLUMNS)}",
+                    (RUNNING, self.owner, now + self.lease_seconds, now, QUEUED, QUEUED)
+                ).fetchall()
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return dict(zip(_COLUMNS, rows[0])) if rows else None
+
+    def renew(self, job_ids: List[str]):
+        """Extends the leases of running jobs of this queue's owner, workers call it well within lease_seconds."""
+        if not job_ids:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET lease_expires_at = ? WHERE owner = ? AND status = ? "
+                f"AND job_id IN ({', '.join('?' * len(job_ids))})",
+                (time.time() + self.lease_seconds, self.owner, RUNNING, *job_ids)
+            )
+
+    def update_progress(self, job_id: str, pages_done: int, total_pages: int):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET pages_done = ?, total_pages = ? WHERE job_id = ?",
+                               (pages_done, total_pages, job_id))
+
+    def finish(self, job_id: str, status: str, message: str) -> bool:
+        """:return: False if the job's lease was lost and another worker has claimed it since."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, message = ?, finished_at = ?, lease_expires_at = NULL "
+                "WHERE job_id = ? AND owner = ? AND status = ?",
+                (status, message, time.time(), job_id, self.owner, RUNNING)
+            )
+        return cursor.rowcount > 0
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a job. Queued jobs are cancelled immediately and their uploaded file is removed,
+        running jobs stop after their current page window.
+        :return: False if the job does not exist or has already finished.
+        """
+        with self._lock, self._conn:
+            queued = self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, message = 'Cancelled before start.' "
+                "WHERE job_id = ? AND status = ? RETURNING file_path, delete_file",
+                (CANCELLED, time.time(), job_id, QUEUED)
+            ).fetchone()
+            cursor = self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = ?",
+                                        (job_id, RUNNING))
+            row = self._conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if queued is not None and queued[1]:
+            _remove_file(queued[0])
+        return row is not None and (row[0] == CANCELLED or cursor.rowcount > 0)
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def list_jobs(self, active_only: bool = False, limit: int = 50) -> List[dict]:
+        """Lists the most recent jobs, newest first."""
+        query = f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+        params: list = []
+        if active_only:
+            query += " WHERE status IN (?, ?)"
+            params.extend([QUEUED, RUNNING])
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class IngestWorkerPool:
+    """
+    Background threads that take jobs from an IngestJobQueue and run them through VectorStoreManager.add_pdf.
+    Parsing and embedding of several jobs overlap, the writes to the vector store are serialized by the manager.
+    The callers (Streamlit sessions, CLI) only submit jobs and poll their status, so they never block on ingestion.
+    A heartbeat thread renews the leases of the running jobs three times per lease period.
+    """
+    def __init__(self, vector_store_manager, queue: IngestJobQueue, workers: int = 2, poll_interval: float = 1.0):
+        self.vector_store_manager = vector_store_manager
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._active_lock = threading.Lock()
+        self._active: set = set()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"raggy-ingest-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="raggy-ingest-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, file_path: Union[str, Path], source: str, delete_file: bool = False) -> str:
+        job_id = self.queue.submit(file_path, source, delete_file)
+        self._wakeup.set()
+        return job_id
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            with self._active_lock:
+                self._active.add(job["job_id"])
+            try:
+                self._process(job)
+            finally:
+                with self._active_lock:
+                    self._active.discard(job["job_id"])
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            with self._active_lock:
+                job_ids = list(self._active)
+            try:
+                self.queue.renew(job_ids)
+            except sqlite3.Error as e:
+                logger.warning("Could not renew the ingest job leases: %s", e)
+
+    def _process(self, job: dict):
+        job_id = job["job_id"]
+
+        def progress(pages_done: int, total_pages: int):
+            self.queue.update_progress(job_id, pages_done, total_pages)
+            if self.queue.is_cancel_requested(job_id):
+                raise JobCancelled()
+
+        try:
+            state, msg = self.vector_store_manager.add_pdf(job["file_path"], job["source"], progress_callback=progress)
+        except Exception as e:
+            state, msg = -1, str(e)
+        cancelled = self.queue.is_cancel_requested(job_id)
+        if cancelled:
+            finished = self.queue.finish(job_id, CANCELLED, "Cancelled.")
+        else:
+            finished = self.queue.finish(job_id, DONE if state == 0 else FAILED, msg)
+        if not finished:
+            logger.warning("Lost the lease of ingest job %s, another worker has taken it over.", job_id)
+            return
+        if not job["delete_file"]:
+            return
+        if cancelled:
+            # The uploaded file is removed, so nothing can resume from the checkpoint of the cancelled job.
+            try:
+                self.vector_store_manager.discard_checkpoint(job["source"])
+            except Exception as e:
+                logger.warning("Could not discard the ingest checkpoint of %s: %s", job["source"], e)
+        # The upload of a failed job is removed too: its written windows stay in the checkpoint, listed as a
+        # partial document, and uploading the file again resumes there.
+        _remove_file(job["file_path"])
+
+    def shutdown(self, wait: bool = True):
+        """Stops the workers after their current job."""
+        self._stop.set()
+        self._wakeup.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,290 @@
+import bisect
+import contextvars
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from configs.config import Config
+
+# Latency buckets in milliseconds, also used for sizes (chars/tokens) via size buckets.
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+SIZE_BUCKETS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+
+def _label_key(labels: dict) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[dict] = None) -> str:
+    items = list(labels) + sorted((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile from the bucket counts (upper bucket bound)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """In-process registry of counters and histograms with Prometheus text export."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS_MS, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def snapshot(self) -> dict:
+        """
+        Returns all metrics as plain data.
+        :return: Dict with "counters" and "histograms" (count, sum, p50, p95, p99 per series).
+        """
+        with self._lock:
+            counters = {
+                name + _format_labels(key): value
+                for name, series in self._counters.items() for key, value in series.items()
+            }
+            histograms = {
+                name + _format_labels(key): {
+                    "count": hist.count,
+                    "sum": hist.sum,
+                    "p50": hist.quantile(0.5),
+                    "p95": hist.quantile(0.95),
+                    "p99": hist.quantile(0.99),
+                }
+                for name, series in self._histograms.items() for key, hist in series.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, {'le': bound})} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, {'le': '+Inf'})} {hist.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {hist.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+class Trace:
+    """Per-request record of stage timings and attributes (chunk counts, context size, tokens, cache hits)."""
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.total_ms: Optional[float] = None
+        self.stages: List[dict] = []
+        self.attributes: Dict[str, Union[str, int, float, None]] = {}
+        self.error: Optional[str] = None
+
+    def add_stage(self, stage: str, ms: float):
+        self.stages.append({"stage": stage, "ms": round(ms, 3)})
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "total_ms": self.total_ms,
+            "stages": self.stages,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class JsonlTraceSink:
+    """Appends every finished trace as one JSON line to a file."""
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        line = json.dumps(trace.to_dict(), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("raggy_trace", default=None)
+
+
+class Instrumentation:
+    """
+    Records stage timings and counters into a MetricsRegistry and per-request Traces.
+    Sinks (objects with export(trace)) receive every finished trace, the most recent traces are kept in memory.
+    """
+    def __init__(self, registry: Optional[MetricsRegistry] = None, sinks: Optional[list] = None,
+                 keep_traces: int = 100):
+        self.registry = registry or MetricsRegistry()
+        self.sinks = list(sinks or [])
+        self.recent_traces = deque(maxlen=keep_traces)
+
+    @contextmanager
+    def trace(self, name: str):
+        """Starts a request trace that all stage() calls in this context (and its tasks) are attached to."""
+        trace = Trace(name)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        except Exception as e:
+            trace.error = str(e)
+            self.registry.inc("raggy_errors_total", request=name)
+            raise
+        finally:
+            try:
+                _current_trace.reset(token)
+            except ValueError:
+                # Generators can be finalized in a different context than the one they started in.
+                _current_trace.set(None)
+            trace.total_ms = (time.perf_counter() - trace._start) * 1000
+            self.registry.observe("raggy_request_latency_ms", trace.total_ms, request=name)
+            self.registry.inc("raggy_requests_total", request=name)
+            self.recent_traces.append(trace)
+            for sink in self.sinks:
+                try:
+                    sink.export(trace)
+                except Exception as e:
+                    print(f"Error exporting trace: {e}")
+
+    def record_error(self, trace: Trace, error: Exception):
+        """Marks a trace as failed for code paths that handle the exception themselves."""
+        trace.error = str(error)
+        self.registry.inc("raggy_errors_total", request=trace.name)
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Times a pipeline stage, both in the latency histogram and in the current trace."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, (time.perf_counter() - start) * 1000)
+
+    def record_stage(self, stage: str, ms: float):
+        self.registry.observe("raggy_stage_latency_ms", ms, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(stage, ms)
+
+    def set_attribute(self, key: str, value, observe: bool = False):
+        """
+        Attaches a value to the current trace.
+        :param observe: Also record the value in a size histogram raggy_<key>.
+        """
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.attributes[key] = value
+        if observe and isinstance(value, (int, float)):
+            self.registry.observe(f"raggy_{key}", value, buckets=SIZE_BUCKETS)
+
+    def count(self, name: str, value: float = 1, **labels):
+        self.registry.inc(name, value, **labels)
+
+
+_instrumentation: Optional[Instrumentation] = None
+_instrumentation_lock = threading.Lock()
+
+
+def get_instrumentation() -> Instrumentation:
+    """
+    Returns the process-wide instrumentation. On first use it is set up from Config:
+    TRACE_LOG_PATH adds a JSONL trace sink, METRICS_PORT starts the Prometheus endpoint.
+    """
+    global _instrumentation
+    with _instrumentation_lock:
+        if _instrumentation is None:
+            sinks = [JsonlTraceSink(Config.TRACE_LOG_PATH)] if Config.TRACE_LOG_PATH else []
+            _instrumentation = Instrumentation(sinks=sinks)
+            if Config.METRICS_PORT:
+                start_metrics_server(Config.METRICS_PORT)
+        return _instrumentation
+
+
+def set_instrumentation(instrumentation: Instrumentation):
+    """Replaces the process-wide instrumentation, e.g. with one that has additional sinks."""
+    global _instrumentation
+    with _instrumentation_lock:
+        _instrumentation = instrumentation
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves the Prometheus text format of the process-wide registry on http://host:port/metrics."""
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = get_instrumentation().registry.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,215 @@
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from langchain_core.documents import Document
+
+from src.retrieval_filter import FILTER_COLUMNS, ensure_filter_columns, filter_values, json_field, where_to_sql
+
+# Keeps part numbers and acronyms like "AB-1234" or "v2.1" together as one term.
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+# Function words and question phrasing, they carry no topic and have the longest posting lists.
+STOPWORDS = frozenset(
+    "a an and are as at be but by can could do does did for from had has have how i if in is it its me my "
+    "of on or our should so than that the their them then there these they this those to us was we were "
+    "what when where which who why will with would you your about tell explain describe give show "
+    "more else also again please".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class KeywordIndex:
+    """
+    Incrementally updated BM25 index over the chunks of the vector store.
+    The inverted index lives in SQLite, so keyword search runs locally without any network call.
+    Metadata filters are applied in the postings query, only chunks in scope are scored.
+    Query stopwords and terms in more than max_df_ratio of all chunks are not scored, they hardly change the
+    ranking but have the longest posting lists. The BM25 sum is computed by SQLite, only the top k leave it.
+    """
+    def __init__(self, db_path: Union[str, Path], k1: float = 1.5, b: float = 0.75, max_df_ratio: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self._lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS kw_chunks (
+                chunk_id TEXT PRIMARY KEY,
+                length INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                source TEXT,
+                page INTEGER,
+                ingested_at INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id);
+            CREATE TABLE IF NOT EXISTS kw_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                n_chunks INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO kw_stats (id, n_chunks, total_length) VALUES (0, 0, 0);
+            CREATE TABLE IF NOT EXISTS kw_df (
+                term TEXT PRIMARY KEY,
+                df INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            """
+        )
+        # Indexes created before the document frequency table get it from their postings once.
+        if self._conn.execute("SELECT 1 FROM kw_df LIMIT 1").fetchone() is None:
+            self._conn.execute("INSERT INTO kw_df (term, df) SELECT term, COUNT(*) FROM postings GROUP BY term")
+        ensure_filter_columns(self._conn, "kw_chunks")
+        self._conn.executescript(
+            """
+            CREATE INDEX IF NOT EXISTS idx_kw_chunks_source ON kw_chunks(source);
+            CREATE INDEX IF NOT EXISTS idx_kw_chunks_ingested_at ON kw_chunks(ingested_at);
+            """
+        )
+        self._conn.commit()
+
+    def add(self, documents: List[Document]):
+        """Indexes the given chunks. Documents must carry their chunk ID, existing IDs are re-indexed."""
+        if not documents:
+            return
+        self.remove([doc.id for doc in documents])
+        rows, postings, total_length = [], [], 0
+        for doc in documents:
+            terms = Counter(tokenize(doc.page_content))
+            length = sum(terms.values())
+            total_length += length
+            rows.append((doc.id, length, doc.page_content, json.dumps(doc.metadata), *filter_values(doc.metadata)))
+            postings.extend((term, doc.id, tf) for term, tf in terms.items())
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO kw_chunks (chunk_id, length, content, metadata, source, page, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+            self._conn.executemany(
+                "INSERT INTO kw_df (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                Counter(term for term, _, _ in postings).items()
+            )
+            self._conn.execute(
+                "UPDATE kw_stats SET n_chunks = n_chunks + ?, total_length = total_length + ? WHERE id = 0",
+                (len(rows), total_length)
+            )
+
+    def update_metadatas(self, chunk_ids: List[str], metadatas: List[dict]):
+        """Replaces the metadata of indexed chunks, their terms stay as they are."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE kw_chunks SET metadata = ?, source = ?, page = ?, ingested_at = ? WHERE chunk_id = ?",
+                [(json.dumps(meta), *filter_values(meta), chunk_id) for chunk_id, meta in zip(chunk_ids, metadatas)]
+            )
+
+    def remove(self, chunk_ids: List[str]):
+        if not chunk_ids:
+            return
+        with self._lock, self._conn:
+            for i in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                count, total_length = self._conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM kw_chunks WHERE chunk_id IN ({placeholders})",
+                    batch
+                ).fetchone()
+                if not count:
+                    continue
+                self._conn.execute(
+                    "UPDATE kw_df SET df = df - removed.n FROM (SELECT term, COUNT(*) AS n FROM postings "
+                    f"WHERE chunk_id IN ({placeholders}) GROUP BY term) AS removed WHERE kw_df.term = removed.term",
+                    batch
+                )
+                self._conn.execute("DELETE FROM kw_df WHERE df <= 0")
+                self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({placeholders})", batch)
+                self._conn.execute(f"DELETE FROM kw_chunks WHERE chunk_id IN ({placeholders})", batch)
+                self._conn.execute(
+                    "UPDATE kw_stats SET n_chunks = n_chunks - ?, total_length = total_length - ? WHERE id = 0",
+                    (count, total_length)
+                )
+
+    @staticmethod
+    def _column(key: str) -> str:
+        return f"c.{key}" if key in FILTER_COLUMNS else json_field(key, "c.metadata")
+
+    def search(self, query: str, k: int = 5, filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        """
+        Ranks chunks with BM25. IDF and length statistics are those of the whole index, so scores
+        of a filtered search equal the scores of the same chunks in an unfiltered one.
+        :param filter: Optional Chroma where clause on the chunk metadata (see src/retrieval_filter.py).
+        :return: List of (Document, score), best match first.
+        """
+        terms = set(tokenize(query))
+        terms = terms - STOPWORDS or terms
+        if not terms:
+            return []
+        condition, params = where_to_sql(filter, self._column) if filter else ("1", [])
+        with self._lock:
+            n_chunks, total_length = self._conn.execute(
+                "SELECT n_chunks, total_length FROM kw_stats WHERE id = 0"
+            ).fetchone()
+            if not n_chunks:
+                return []
+            df = dict(self._conn.execute(
+                f"SELECT term, df FROM kw_df WHERE term IN ({','.join('?' * len(terms))})", list(terms)
+            ).fetchall())
+            if not df:
+                return []
+            idf = {term: math.log(1 + (n_chunks - n + 0.5) / (n + 0.5)) for term, n in df.items()}
+            # Terms in most chunks are dropped unless the query has nothing else.
+            weights = {term: idf[term] for term in idf if df[term] <= self.max_df_ratio * n_chunks} or idf
+            rows = self._conn.execute(
+                f"WITH q(term, idf) AS (VALUES {', '.join(['(?, ?)'] * len(weights))}) "
+                "SELECT p.chunk_id, SUM(q.idf * p.tf * ? / (p.tf + ? * (? + ? * c.length))) AS score "
+                "FROM q JOIN postings p ON p.term = q.term JOIN kw_chunks c ON c.chunk_id = p.chunk_id "
+                f"WHERE {condition} GROUP BY p.chunk_id ORDER BY score DESC LIMIT ?",
+                (*(value for item in weights.items() for value in item), self.k1 + 1, self.k1, 1 - self.b,
+                 self.b / (total_length / n_chunks), *params, k)
+            ).fetchall()
+            if not rows:
+                return []
+            found = {chunk_id: (content, metadata) for chunk_id, content, metadata in self._conn.execute(
+                f"SELECT chunk_id, content, metadata FROM kw_chunks WHERE chunk_id IN ({','.join('?' * len(rows))})",
+                [chunk_id for chunk_id, _ in rows]
+            )}
+        return [(Document(id=chunk_id, page_content=found[chunk_id][0], metadata=json.loads(found[chunk_id][1])), score)
+                for chunk_id, score in rows]
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT n_chunks FROM kw_stats WHERE id = 0").fetchone()[0] == 0
+
+    def rebuild(self, vector_store, page_size: int = 5000):
+        """One-time migration: indexes all chunks already stored in the vector store."""
+        offset = 0
+        while True:
+            data = vector_store.get(include=['documents', 'metadatas'], limit=page_size, offset=offset)
+            ids = data.get('ids', [])
+            if not ids:
+                break
+            self.add([
+                Document(id=chunk_id, page_content=content or "", metadata=meta or {})
+                for chunk_id, content, meta in zip(ids, data.get('documents', []), data.get('metadatas', []))
+            ])
+            offset += len(ids)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,463 @@
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.retrieval_filter import (FILTER_COLUMNS, ensure_filter_columns, filter_key, filter_values, json_field,
+                                  where_to_sql)
+from src.vector_backends import VectorBackend
+
+logger = logging.getLogger(__name__)
+
+_DTYPES = {"float32": np.float32, "int8": np.int8}
+# Rows scored per block in exact search, bounds the dequantized working set.
+_BLOCK_ROWS = 65536
+_MAX_TRAIN_SAMPLE = 200_000
+# Row sets of recent filters, a chat usually keeps its scope for many questions.
+_FILTER_CACHE_SIZE = 64
+
+
+class LocalANNStore(VectorBackend):
+    """
+    Local on-disk vector index for corpora that do not fit in RAM as float32.
+    - Vectors are L2-normalized (cosine similarity) and kept in a memory-mapped file, either as float32
+      or int8 with one scale per vector (4x smaller). Only the pages touched by a search are loaded,
+      so opening the index costs the same for 10 and 5M chunks.
+    - An IVF index (spherical k-means with nlist lists) is trained once train_min chunks are stored;
+      queries scan the nprobe closest lists. Below train_min, with nprobe >= nlist or exact=True the search
+      is an exact brute-force NumPy scan, which also serves as ground truth for recall().
+    - Chunk IDs, texts and metadata live in SQLite. Deleted rows are reused by later inserts.
+    """
+    def __init__(self, path: Union[str, Path], embedding_function: Optional[Embeddings] = None,
+                 quantization: str = "int8", nlist: Optional[int] = None, nprobe: int = 8,
+                 train_min: int = 10_000):
+        if quantization not in _DTYPES:
+            raise ValueError(f"Unknown quantization: {quantization} (use 'float32' or 'int8')")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.embedding_function = embedding_function
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_min = train_min
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path / "chunks.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT UNIQUE,
+                source TEXT,
+                document TEXT,
+                metadata TEXT,
+                page INTEGER,
+                ingested_at INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source);
+            CREATE TABLE IF NOT EXISTS index_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        ensure_filter_columns(self._conn, "chunks")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_ingested_at ON chunks(ingested_at)")
+        self._conn.commit()
+        meta = dict(self._conn.execute("SELECT key, value FROM index_meta").fetchall())
+        self.quantization = meta.get("quantization", quantization)
+        if self.quantization != quantization:
+            logger.warning("Local index at %s stores %s vectors, ignoring '%s'.", self.path, self.quantization,
+                           quantization)
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self._capacity = int(meta.get("capacity", 0))
+        self._size = int(meta.get("size", 0))  # High-water mark of used rows
+        self._count = int(meta.get("count", 0))
+        self._trained_count = int(meta.get("trained_count", 0))
+        self._vectors = self._scales = self._assign = None
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._filter_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        if self.dim is not None:
+            self._open_files()
+            centroids_path = self.path / "centroids.npy"
+            if centroids_path.exists():
+                self._centroids = np.load(centroids_path)
+
+    # ---- storage ----------------------------------------------------------
+
+    def _file(self, name: str) -> Path:
+        return self.path / name
+
+    def _map(self, name: str, dtype, shape: tuple):
+        path = self._file(name)
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, "ab") as f:
+            if f.tell() < nbytes:
+                f.truncate(nbytes)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _open_files(self):
+        capacity = max(self._capacity, 1)
+        self._vectors = self._map(f"vectors.{self.quantization}", _DTYPES[self.quantization], (capacity, self.dim))
+        self._scales = self._map("scales.float32", np.float32, (capacity,))
+        self._assign = self._map("assign.int32", np.int32, (capacity,))
+
+    def _grow(self, rows_needed: int):
+        if rows_needed <= self._capacity:
+            return
+        old_capacity = self._capacity
+        self._capacity = max(rows_needed, 2 * old_capacity, 1024)
+        for array in (self._vectors, self._scales, self._assign):
+            if array is not None:
+                array.flush()
+        self._open_files()
+        # New rows are not assigned to any IVF list.
+        self._assign[old_capacity:] = -1
+
+    def _save_meta(self):
+        meta = {"quantization": self.quantization, "dim": self.dim, "capacity": self._capacity,
+                "size": self._size, "count": self._count, "trained_count": self._trained_count}
+        self._conn.executemany("INSERT OR REPLACE INTO index_meta (key, value) VALUES (?, ?)",
+                               [(key, str(value)) for key, value in meta.items() if value is not None])
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    def _encode(self, matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.quantization == "float32":
+            return matrix, np.ones(len(matrix), dtype=np.float32)
+        scales = np.maximum(np.abs(matrix).max(axis=1), 1e-12) / 127
+        return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        return self._vectors[rows].astype(np.float32) * self._scales[rows][:, None]
+
+    # ---- writes -----------------------------------------------------------
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[dict]):
+        if not ids:
+            return
+        matrix = self._normalize(embeddings)
+        with self._lock, self._conn:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self._open_files()
+                self._assign[:] = -1
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match the index ({self.dim})")
+
+            # Existing IDs keep their row, new IDs reuse free rows first, then append.
+            existing = dict(self._fetch_rows(ids))
+            new_ids = [chunk_id for chunk_id in dict.fromkeys(ids) if chunk_id not in existing]
+            free = [row for (row,) in self._conn.execute(
+                "SELECT row FROM chunks WHERE chunk_id IS NULL LIMIT ?", (len(new_ids),))]
+            appended = list(range(self._size, self._size + len(new_ids) - len(free)))
+            self._grow(self._size + len(appended))
+            rows_by_id = {**existing, **dict(zip(new_ids, free + appended))}
+            self._size += len(appended)
+            self._count += len(new_ids)
+
+            rows = np.array([rows_by_id[chunk_id] for chunk_id in ids], dtype=np.int64)
+            codes, scales = self._encode(matrix)
+            self._vectors[rows] = codes
+            self._scales[rows] = scales
+            self._assign[rows] = self._nearest_list(matrix) if self._centroids is not None else -1
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (row, chunk_id, document, metadata, source, page, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(rows_by_id[chunk_id], chunk_id, text, json.dumps(meta or {}), *filter_values(meta or {}))
+                 for chunk_id, text, meta in zip(ids, documents, metadatas)]
+            )
+            self._lists = None
+            self._filter_cache.clear()
+            if self._centroids is None and self._count >= self.train_min:
+                self._train()
+            elif self._centroids is not None and self._count > 4 * self._trained_count:
+                # Lists drift out of balance as the corpus grows, retrain on the larger sample.
+                self._train()
+            self._save_meta()
+            self._flush()
+
+    def update_metadatas(self, ids: List[str], metadatas: List[dict]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE chunks SET metadata = ?, source = ?, page = ?, ingested_at = ? WHERE chunk_id = ?",
+                [(json.dumps(meta or {}), *filter_values(meta or {}), chunk_id) for chunk_id, meta in zip(ids, metadatas)]
+            )
+            self._filter_cache.clear()
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return None
+        with self._lock, self._conn:
+            rows = [row for _, row in self._fetch_rows(ids)]
+            if not rows:
+                return True
+            rows = np.array(rows, dtype=np.int64)
+            # A zero scale marks a free row.
+            self._scales[rows] = 0
+            self._assign[rows] = -1
+            self._conn.executemany(
+                "UPDATE chunks SET chunk_id = NULL, source = NULL, document = NULL, metadata = NULL, page = NULL, "
+                "ingested_at = NULL WHERE row = ?",
+                [(int(row),) for row in rows]
+            )
+            self._count -= len(rows)
+            self._lists = None
+            self._filter_cache.clear()
+            self._save_meta()
+            self._flush()
+        return True
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, *,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if ids is None:
+            ids = [uuid.uuid4().hex for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        self.upsert(ids, self.embedding_function.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def _fetch_rows(self, ids: List[str]) -> List[Tuple[str, int]]:
+        result = []
+        for i in range(0, len(ids), 900):
+            batch = ids[i:i + 900]
+            result.extend(self._conn.execute(
+                f"SELECT chunk_id, row FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+        return result
+
+    def _flush(self):
+        for array in (self._vectors, self._scales, self._assign):
+            array.flush()
+
+    # ---- IVF index --------------------------------------------------------
+
+    def _live_rows(self) -> np.ndarray:
+        return np.flatnonzero(np.asarray(self._scales[:self._size]) > 0)
+
+    @staticmethod
+    def _nearest(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        # Blocked, so the score matrix stays small for large nlist.
+        return np.concatenate([
+            np.argmax(matrix[i:i + 8192] @ centroids.T, axis=1) for i in range(0, len(matrix), 8192)
+        ]).astype(np.int32) if len(matrix) else np.array([], dtype=np.int32)
+
+    def _nearest_list(self, matrix: np.ndarray) -> np.ndarray:
+        return self._nearest(matrix, self._centroids)
+
+    def _train(self, iterations: int = 15, seed: int = 0):
+        """Spherical k-means on a sample of the stored vectors, then assigns every vector to its list."""
+        live = self._live_rows()
+        nlist = self.nlist or int(np.clip(4 * np.sqrt(len(live)), 1, 65536))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(live, size=min(len(live), 256 * nlist, _MAX_TRAIN_SAMPLE), replace=False))
+        data = self._normalize(self._decode(sample))
+        centroids = data[rng.choice(len(data), size=min(nlist, len(data)), replace=False)]
+        for _ in range(iterations):
+            labels = self._nearest(data, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            empty = np.bincount(labels, minlength=len(centroids)) == 0
+            # Empty lists are re-seeded with random sample points.
+            sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+            centroids = self._normalize(sums)
+        self._centroids = centroids
+        np.save(self.path / "centroids.npy", centroids)
+        for start in range(0, len(live), _BLOCK_ROWS):
+            rows = live[start:start + _BLOCK_ROWS]
+            self._assign[rows] = self._nearest_list(self._normalize(self._decode(rows)))
+        self._trained_count = len(live)
+        self._lists = None
+
+    def rebuild_index(self):
+        """Retrains the IVF lists on the current vectors."""
+        with self._lock, self._conn:
+            if self._count:
+                self._train()
+                self._save_meta()
+                self._flush()
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows sorted by list, with the start offset of every list."""
+        if self._lists is None:
+            assign = np.asarray(self._assign[:self._size])
+            order = np.argsort(assign, kind="stable")
+            offsets = np.searchsorted(assign[order], np.arange(len(self._centroids) + 1))
+            self._lists = (order, offsets)
+        return self._lists
+
+    # ---- search -----------------------------------------------------------
+
+    @staticmethod
+    def _column(key: str) -> str:
+        return key if key in FILTER_COLUMNS else json_field(key)  # Indexed columns first
+
+    def _filter_rows(self, filter: Optional[dict]) -> Optional[np.ndarray]:
+        """Sorted rows matching a Chroma where clause, selected in SQLite before any vector is scored."""
+        if not filter:
+            return None
+        key = filter_key(filter)
+        if key in self._filter_cache:
+            self._filter_cache.move_to_end(key)
+            return self._filter_cache[key]
+        condition, params = where_to_sql(filter, self._column)
+        cursor = self._conn.execute(f"SELECT row FROM chunks WHERE chunk_id IS NOT NULL AND {condition}", params)
+        rows = np.sort(np.fromiter((row for (row,) in cursor), dtype=np.int64))
+        self._filter_cache[key] = rows
+        if len(self._filter_cache) > _FILTER_CACHE_SIZE:
+            self._filter_cache.popitem(last=False)
+        return rows
+
+    def _candidates(self, query: np.ndarray, allowed: Optional[np.ndarray], exact: bool) -> np.ndarray:
+        if exact or self._centroids is None or self.nprobe >= len(self._centroids):
+            return allowed if allowed is not None else self._live_rows()
+        # A scope smaller than the probed lists is cheaper to scan exactly, and keeps full recall.
+        if allowed is not None and len(allowed) <= self._count * self.nprobe / len(self._centroids):
+            return allowed
+        order, offsets = self._inverted_lists()
+        probes = np.argsort(-(self._centroids @ query))[:self.nprobe]
+        rows = np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probes])
+        if allowed is not None:
+            rows = rows[np.isin(rows, allowed)]
+        return np.sort(rows)
+
+    @staticmethod
+    def _search(query: np.ndarray, k: int, rows: np.ndarray, vectors: np.memmap, scales: np.memmap):
+        best_rows, best_scores = np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        for start in range(0, len(rows), _BLOCK_ROWS):
+            block = rows[start:start + _BLOCK_ROWS]
+            scores = (vectors[block].astype(np.float32) @ query) * scales[block]
+            merged_rows = np.concatenate([best_rows, block])
+            merged_scores = np.concatenate([best_scores, scores])
+            top = np.argpartition(-merged_scores, k)[:k] if len(merged_scores) > k else np.arange(len(merged_scores))
+            top = top[np.argsort(-merged_scores[top])]
+            best_rows, best_scores = merged_rows[top], merged_scores[top]
+        return best_rows, best_scores
+
+    def _documents(self, rows: np.ndarray) -> dict:
+        if not len(rows):
+            return {}
+        return {
+            row: Document(id=chunk_id, page_content=text or "", metadata=json.loads(meta or "{}"))
+            for row, chunk_id, text, meta in self._conn.execute(
+                f"SELECT row, chunk_id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(rows))})",
+                [int(row) for row in rows]
+            )
+        }
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[dict] = None,
+                                               exact: bool = False) -> List[Tuple[Document, float]]:
+        """:return: List of (Document, cosine similarity), best first."""
+        if self.dim is None or self._count == 0:
+            return []
+        query = self._normalize(embedding)[0]
+        # Only the candidate rows and the memmaps are taken under the lock, scoring runs outside it so concurrent
+        # searches do not serialize. A grown index reopens its memmaps, the snapshot keeps mapping the old rows.
+        with self._lock:
+            rows = self._candidates(query, self._filter_rows(filter), exact)
+            vectors, scales = self._vectors, self._scales
+        rows, scores = self._search(query, k, rows, vectors, scales)
+        with self._lock:
+            # Rows deleted meanwhile have no chunk anymore and are dropped below.
+            docs = self._documents(rows)
+        return [(docs[int(row)], float(score)) for row, score in zip(rows, scores) if int(row) in docs]
+
+    def query_by_vectors(self, embeddings: List[List[float]], k: int = 5,
+                         filter: Optional[dict] = None) -> List[List[Document]]:
+        return [[doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+                for embedding in embeddings]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None,
+                                    **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None,
+                          **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return lambda similarity: (1.0 + similarity) / 2.0
+
+    def get_embeddings(self, ids: List[str]) -> List[Optional[List[float]]]:
+        """Returns the stored (dequantized, normalized) vectors."""
+        with self._lock:
+            rows = dict(self._fetch_rows(ids))
+            if not rows:
+                return [None] * len(ids)
+            found = [chunk_id for chunk_id in ids if chunk_id in rows]
+            vectors = dict(zip(found, self._decode(np.array([rows[c] for c in found], dtype=np.int64))))
+        return [vectors[chunk_id] if chunk_id in vectors else None for chunk_id in ids]
+
+    def recall(self, embeddings: List[List[float]], k: int = 5) -> float:
+        """
+        Recall@k of the IVF search against exact brute-force search for the given query embeddings.
+        """
+        hits = total = 0
+        for embedding in embeddings:
+            approx = {doc.id for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)}
+            exact = {doc.id for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, exact=True)}
+            hits += len(approx & exact)
+            total += len(exact)
+        return hits / total if total else 1.0
+
+    # ---- inspection -------------------------------------------------------
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding_function
+
+    def count(self) -> int:
+        return self._count
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None, limit: Optional[int] = None,
+            offset: int = 0, include: Optional[List[str]] = None) -> dict:
+        """Chroma compatible paging over the stored chunks."""
+        include = include or ["documents", "metadatas"]
+        query = "SELECT chunk_id, document, metadata FROM chunks WHERE chunk_id IS NOT NULL"
+        params: list = []
+        if ids is not None:
+            query += f" AND chunk_id IN ({','.join('?' * len(ids))})"
+            params.extend(ids)
+        if where:
+            condition, where_params = where_to_sql(where, self._column)
+            query += f" AND {condition}"
+            params.extend(where_params)
+        query += " ORDER BY row LIMIT ? OFFSET ?"
+        params.extend([-1 if limit is None else limit, offset])
+        with self._lock:
+            data = self._conn.execute(query, params).fetchall()
+        result = {"ids": [row[0] for row in data]}
+        if "documents" in include:
+            result["documents"] = [row[1] for row in data]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(row[2] or "{}") for row in data]
+        return result
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, *,
+                   ids: Optional[List[str]] = None, path: Union[str, Path] = "local_index",
+                   **kwargs: Any) -> "LocalANNStore":
+        store = cls(path, embedding_function=embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._flush()
+            self._conn.close()
@@ -0,0 +1,180 @@
+"""
+CPU-runnable local models, so the pipeline runs without any remote API (see src/model_providers.py):
+- LocalEmbeddings: a sentence-transformers model, concurrent calls are merged into one batched forward pass,
+- LocalChatModel: a quantized GGUF chat model on llama.cpp.
+Both load their weights once per process through the provider registry.
+"""
+import threading
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from src.shared_clients import run_in_search_executor
+
+_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+class _PendingBatch:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.vectors: Optional[List[List[float]]] = None
+        self.error: Optional[BaseException] = None
+        self.lead = False  # Set when the owner has to encode the queue
+        self.done = threading.Event()  # Set once the vectors are ready or the lead is handed to the owner
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    sentence-transformers embeddings on the CPU, e.g. "BAAI/bge-small-en-v1.5". Needs the optional
+    sentence-transformers package. Calls from concurrent threads (queries of parallel chats, ingest batches)
+    are coalesced: the first caller encodes everything queued so far in one batched pass of batch_size texts,
+    then hands the lead to the owner of the oldest batch queued meanwhile, so no caller encodes for others forever.
+    """
+    def __init__(self, model_name: str, batch_size: int = 64, device: str = "cpu"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("Local embeddings need 'pip install sentence-transformers'") from e
+        self.model = SentenceTransformer(model_name, device=device)
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._queue: List[_PendingBatch] = []
+        self._encoding = False
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                    convert_to_numpy=True, show_progress_bar=False)
+        return vectors.tolist()
+
+    def _drain(self):
+        """Encodes the queued requests in one pass, run by the caller holding the lead."""
+        with self._lock:
+            batches, self._queue = self._queue, []
+        try:
+            vectors = self._encode([text for batch in batches for text in batch.texts])
+            start = 0
+            for batch in batches:
+                batch.vectors = vectors[start:start + len(batch.texts)]
+                start += len(batch.texts)
+        except BaseException as e:
+            for batch in batches:
+                batch.error = e
+        finally:
+            with self._lock:
+                if self._queue:
+                    self._queue[0].lead = True
+                    self._queue[0].done.set()
+                else:
+                    self._encoding = False
+            for batch in batches:
+                batch.done.set()
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        if not texts:
+            return []
+        batch = _PendingBatch(list(texts))
+        with self._lock:
+            self._queue.append(batch)
+            batch.lead = not self._encoding
+            self._encoding = True
+        if not batch.lead:
+            batch.done.wait()
+        if batch.lead:
+            # Either the first caller or handed the lead, the own batch is part of the pass.
+            self._drain()
+        if batch.error is not None:
+            raise batch.error
+        return batch.vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Queries are encoded like documents, so a batch of queries is one pass."""
+        return self.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        return await run_in_search_executor(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await run_in_search_executor(self.embed_query, text)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await run_in_search_executor(self.embed_queries, texts)
+
+
+class LocalChatModel(BaseChatModel):
+    """
+    GGUF chat model on llama.cpp (CPU), e.g. a 4-bit Qwen2.5 or Llama 3.2 instruct model.
+    Needs the optional llama-cpp-python package. The prompt is evaluated in batches of n_batch tokens on
+    n_threads cores. A llama.cpp context serves one sequence at a time, so concurrent requests take turns.
+    Extra keyword arguments of a call (e.g. response_format with a JSON schema) go to create_chat_completion.
+    """
+    model_path: str
+    n_ctx: int = 4096
+    n_threads: Optional[int] = None
+    n_batch: int = 512
+    max_tokens: int = 512
+    temperature: float = 0.0
+    _llama: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        try:
+            from llama_cpp import Llama
+        except ImportError as e:
+            raise ImportError("The local chat model needs 'pip install llama-cpp-python'") from e
+        self._llama = Llama(model_path=self.model_path, n_ctx=self.n_ctx, n_threads=self.n_threads,
+                            n_batch=self.n_batch, verbose=False)
+
+    @property
+    def _llm_type(self) -> str:
+        return "raggy-llama-cpp"
+
+    @staticmethod
+    def _to_messages(messages: List[BaseMessage]) -> List[dict]:
+        return [{"role": _ROLES.get(message.type, "user"), "content": str(message.content)} for message in messages]
+
+    def _completion_args(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict) -> dict:
+        return {"messages": self._to_messages(messages), "max_tokens": self.max_tokens,
+                "temperature": self.temperature, "stop": stop, **kwargs}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        with self._lock:
+            response = self._llama.create_chat_completion(**self._completion_args(messages, stop, kwargs))
+        usage = response.get("usage") or {}
+        message = AIMessage(
+            content=response["choices"][0]["message"].get("content") or "",
+            usage_metadata={"input_tokens": usage.get("prompt_tokens", 0),
+                            "output_tokens": usage.get("completion_tokens", 0),
+                            "total_tokens": usage.get("total_tokens", 0)}
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        with self._lock:
+            output_tokens = 0
+            for chunk in self._llama.create_chat_completion(stream=True,
+                                                            **self._completion_args(messages, stop, kwargs)):
+                content = chunk["choices"][0]["delta"].get("content")
+                if not content:
+                    continue
+                output_tokens += 1
+                if run_manager:
+                    run_manager.on_llm_new_token(content)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=content))
+            # Streamed completions carry no usage, the context holds the prompt and the generated tokens.
+            input_tokens = max(self._llama.n_tokens - output_tokens, 0)
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens,
+                            "total_tokens": input_tokens + output_tokens}
+        ))
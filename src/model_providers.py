@@ -0,0 +1,100 @@
+"""
+Provider registry for the chat model and the embedder, selected with Config.LLM_PROVIDER and
+Config.EMBEDDING_PROVIDER:
+- "google": Gemini and Google embeddings on the pooled client of src/shared_clients.py (needs GOOGLE_API_KEY),
+- "local": CPU models of src/local_models.py, no network access needed,
+- "fake": the deterministic offline models of src/fake_models.py.
+Every provider is created once per process and shared by all engines and vector store managers.
+The judge models of the evaluation are registered in evaluation/judge_models.py.
+"""
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from configs.config import Config
+from src.shared_clients import get_google_chat_model, get_google_embeddings
+
+_lock = threading.Lock()
+_instances: Dict[Tuple[str, str], object] = {}
+
+
+def _local_embeddings():
+    from src.local_models import LocalEmbeddings
+    return LocalEmbeddings(Config.LOCAL_EMBEDDING_MODEL, batch_size=Config.LOCAL_EMBEDDING_BATCH_SIZE,
+                           device=Config.LOCAL_EMBEDDING_DEVICE)
+
+
+def _local_chat_model():
+    from src.local_models import LocalChatModel
+    return LocalChatModel(model_path=str(Config.LOCAL_LLM_MODEL_PATH), n_ctx=Config.LOCAL_LLM_CONTEXT_TOKENS,
+                          n_threads=Config.LOCAL_LLM_THREADS, n_batch=Config.LOCAL_LLM_BATCH_TOKENS,
+                          max_tokens=Config.LOCAL_LLM_MAX_TOKENS)
+
+
+def _fake_embeddings():
+    from src.fake_models import FakeEmbeddings
+    return FakeEmbeddings()
+
+
+def _fake_chat_model():
+    from src.fake_models import FakeChatModel
+    return FakeChatModel()
+
+
+# Provider name -> (factory, model name). The model name namespaces the embedding cache.
+EMBEDDING_PROVIDERS: Dict[str, Tuple[Callable, Callable[[], str]]] = {
+    "google": (get_google_embeddings, lambda: Config.EMBEDDING_MODEL),
+    "local": (_local_embeddings, lambda: f"local:{Config.LOCAL_EMBEDDING_MODEL}"),
+    "fake": (_fake_embeddings, lambda: "fake"),
+}
+CHAT_PROVIDERS: Dict[str, Tuple[Callable, Callable[[], str]]] = {
+    "google": (get_google_chat_model, lambda: Config.LLM_MODEL),
+    "local": (_local_chat_model, lambda: f"local:{Config.LOCAL_LLM_MODEL_PATH.name}"),
+    "fake": (_fake_chat_model, lambda: "fake"),
+}
+
+
+def _lookup(providers: dict, kind: str, name: str):
+    if name not in providers:
+        raise ValueError(f"Unknown {kind} provider '{name}', choose one of {sorted(providers)}")
+    return providers[name]
+
+
+def _shared(kind: str, name: str, factory: Callable):
+    # Loading local weights takes seconds, so the lock is held while creating: one instance per process.
+    with _lock:
+        if (kind, name) not in _instances:
+            _instances[(kind, name)] = factory()
+        return _instances[(kind, name)]
+
+
+def get_embedding_model_name(provider: Optional[str] = None) -> str:
+    """Model name of the embedding provider without loading the model."""
+    return _lookup(EMBEDDING_PROVIDERS, "embedding", provider or Config.EMBEDDING_PROVIDER)[1]()
+
+
+def get_embeddings(provider: Optional[str] = None):
+    """
+    The process-wide embedding model of the provider (default Config.EMBEDDING_PROVIDER).
+    :return: (embeddings, model_name)
+    """
+    name = provider or Config.EMBEDDING_PROVIDER
+    factory, model_name = _lookup(EMBEDDING_PROVIDERS, "embedding", name)
+    return _shared("embeddings", name, factory), model_name()
+
+
+def get_chat_model(provider: Optional[str] = None):
+    """
+    The process-wide chat model of the provider (default Config.LLM_PROVIDER).
+    :return: (chat_model, model_name)
+    """
+    name = provider or Config.LLM_PROVIDER
+    factory, model_name = _lookup(CHAT_PROVIDERS, "chat", name)
+    return _shared("chat", name, factory), model_name()
+
+
+def register_provider(kind: str, name: str, factory: Callable, model_name: Callable[[], str]):
+    """Adds a provider, kind is "embeddings" or "chat", e.g. for an OpenAI-compatible server on the LAN."""
+    providers = {"embeddings": EMBEDDING_PROVIDERS, "chat": CHAT_PROVIDERS}[kind]
+    with _lock:
+        providers[name] = (factory, model_name)
+        _instances.pop((kind, name), None)
@@ -0,0 +1,146 @@
+import json
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.instrumentation import get_instrumentation
+from src.shared_clients import run_in_search_executor
+
+
+class ParentDocStore:
+    """
+    Compact SQLite store of the parent passages of the parent-child chunking mode.
+    Every passage is stored once, zlib-compressed together with its metadata, and referenced by the
+    parent_id metadata of its child chunks in the vector store.
+    """
+    def __init__(self, db_path: Union[str, Path]):
+        self._lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS parents (
+                parent_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_parents_source ON parents(source);
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _encode(text: str, metadata: dict) -> bytes:
+        return zlib.compress(json.dumps({"text": text, "metadata": metadata}).encode("utf-8"))
+
+    @staticmethod
+    def _decode(parent_id: str, blob: bytes) -> Document:
+        data = json.loads(zlib.decompress(blob))
+        return Document(id=parent_id, page_content=data["text"], metadata=data["metadata"])
+
+    def put(self, parents: Dict[str, tuple]):
+        """
+        Stores parent passages, existing IDs are left as they are (IDs are content hashes).
+        :param parents: Dict parent_id -> (text, metadata), the metadata must contain the source.
+        """
+        if not parents:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO parents (parent_id, source, data) VALUES (?, ?, ?)",
+                [(parent_id, metadata["source"], self._encode(text, metadata))
+                 for parent_id, (text, metadata) in parents.items()]
+            )
+
+    def get(self, parent_ids: List[str]) -> Dict[str, Document]:
+        found = {}
+        unique_ids = list(dict.fromkeys(parent_ids))
+        with self._lock:
+            for i in range(0, len(unique_ids), 500):
+                batch = unique_ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT parent_id, data FROM parents WHERE parent_id IN ({placeholders})", batch
+                ).fetchall()
+                for parent_id, blob in rows:
+                    found[parent_id] = self._decode(parent_id, blob)
+        return found
+
+    def prune(self, source: str, keep_ids: Optional[Iterable[str]] = None):
+        """Deletes the parents of a source that are not in keep_ids (all of them without keep_ids)."""
+        keep = set(keep_ids or [])
+        with self._lock, self._conn:
+            stored = [row[0] for row in self._conn.execute("SELECT parent_id FROM parents WHERE source = ?", (source,))]
+            self._conn.executemany("DELETE FROM parents WHERE parent_id = ?",
+                                   [(parent_id,) for parent_id in stored if parent_id not in keep])
+
+    def remove(self, parent_ids: Iterable[str]):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM parents WHERE parent_id = ?", [(parent_id,) for parent_id in parent_ids])
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM parents").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        """Compressed size of all stored passages."""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM parents").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def expand_to_parents(docs: List[Document], docstore: ParentDocStore, k: int) -> List[Document]:
+    """
+    Maps child hits (best first) to their parent passages, keeping the rank of the best child of each parent.
+    Chunks without a parent_id (indexed with the standard splitter) are passed through unchanged.
+    :return: Up to k distinct passages, every parent carries the number of its hits in "child_hits".
+    """
+    parents = docstore.get([doc.metadata["parent_id"] for doc in docs if doc.metadata.get("parent_id")])
+    result: List[Document] = []
+    positions: Dict[str, int] = {}
+    for doc in docs:
+        parent_id = doc.metadata.get("parent_id")
+        parent = parents.get(parent_id) if parent_id else None
+        if parent is None:
+            key = doc.id or doc.page_content
+            if key not in positions and len(result) < k:
+                positions[key] = len(result)
+                result.append(doc)
+            continue
+        if parent_id in positions:
+            result[positions[parent_id]].metadata["child_hits"] += 1
+        elif len(result) < k:
+            positions[parent_id] = len(result)
+            result.append(Document(id=parent_id, page_content=parent.page_content,
+                                   metadata={**parent.metadata, "child_hits": 1}))
+    return result
+
+
+class ParentExpandingRetriever(BaseRetriever):
+    """Runs a child-chunk retriever and returns the k best distinct parent passages of its hits."""
+    base_retriever: Any
+    docstore: Any
+    k: int = 5
+
+    def _expand(self, docs: List[Document]) -> List[Document]:
+        with get_instrumentation().stage("parent_expansion"):
+            return expand_to_parents(docs, self.docstore, self.k)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                filter: Optional[dict] = None) -> List[Document]:
+        return self._expand(self.base_retriever.invoke(query, filter=filter))
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager,
+                                       filter: Optional[dict] = None) -> List[Document]:
+        docs = await self.base_retriever.ainvoke(query, filter=filter)
+        return await run_in_search_executor(self._expand, docs)
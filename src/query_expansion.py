@@ -0,0 +1,249 @@
+"""
+Query expansion stage (Config.QUERY_EXPANSION_ENABLED): one LLM call rewrites a vague query into
+QUERY_EXPANSION_VARIANTS search queries while the original query is already being retrieved.
+The rewrites are retrieved in parallel and all rankings are fused with RRF.
+Rewrites are cached by normalized query, and queries that look specific enough skip the LLM.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from pathlib import Path
+from typing import Any, List, Optional, Union
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.retrievers import BaseRetriever
+
+from src.answer_cache import normalize_query
+from src.hybrid_retriever import reciprocal_rank_fusion
+from src.instrumentation import get_instrumentation
+from src.keyword_index import STOPWORDS, tokenize
+from src.shared_clients import get_search_executor
+
+logger = logging.getLogger(__name__)
+
+# Part numbers, versions and other tokens with digits, quoted phrases and acronyms.
+_IDENTIFIER_PATTERN = re.compile(r"\w*\d\w*|\"[^\"]{3,}\"|\b[A-Z]{2,}\b")
+_LIST_MARKER_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+_EXPANSION_SYSTEM_PROMPT = (
+    "You write search queries for a vector database and a keyword index over the user's documents.\n"
+    "Rewrite the user query inside the <query> tags into {n} different search queries.\n"
+    "### Rules:\n"
+    "1. Do not use your internal knowledge, do not add facts, names or numbers that are not in the query.\n"
+    "2. Make every query specific and keyword-rich: remove filler words, spell out abbreviations of the query, "
+    "use synonyms and name the likely document terms.\n"
+    "3. Do NOT answer the question.\n"
+    "Return exactly {n} queries, one per line, without numbering or any other text."
+)
+
+
+def content_terms(text: str) -> set:
+    """Distinct keyword-index tokens of the text without stopwords and question words."""
+    return {token for token in tokenize(text) if token not in STOPWORDS}
+
+
+def is_specific(query: str, min_terms: int = 5) -> bool:
+    """
+    Cheap check whether a rewrite can help: queries with an identifier (part number, version, acronym),
+    a quoted phrase or at least min_terms distinct content words are searched as they are.
+    """
+    if _IDENTIFIER_PATTERN.search(query):
+        return True
+    return len(content_terms(query)) >= min_terms
+
+
+def parse_rewrites(text: str, query: str, n: int) -> List[str]:
+    """Cleans the LLM output: one query per line, list markers removed, duplicates of each other and of the query dropped."""
+    seen = {normalize_query(query)}
+    rewrites = []
+    for line in text.splitlines():
+        rewrite = _LIST_MARKER_PATTERN.sub("", line).strip().strip('"').strip()
+        key = normalize_query(rewrite)
+        if key and key not in seen:
+            seen.add(key)
+            rewrites.append(rewrite)
+    return rewrites[:n]
+
+
+class RewriteCache:
+    """Persistent cache of query rewrites (SQLite), the least recently used entries are evicted beyond max_entries."""
+    def __init__(self, db_path: Union[str, Path], max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS rewrites (
+                key TEXT PRIMARY KEY,
+                rewrites TEXT NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_rewrites_last_access ON rewrites(last_access);
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(model_name: str, n: int, query: str) -> str:
+        return hashlib.sha256(f"{model_name}\x00{n}\x00{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT rewrites FROM rewrites WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE rewrites SET last_access = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
+
+    def put(self, key: str, rewrites: List[str]):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO rewrites (key, rewrites, last_access) VALUES (?, ?, ?)",
+                               (key, json.dumps(rewrites), time.time()))
+            excess = self._conn.execute("SELECT COUNT(*) FROM rewrites").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM rewrites WHERE key IN (SELECT key FROM rewrites ORDER BY last_access LIMIT ?)",
+                    (excess,)
+                )
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class QueryExpander:
+    """Generates n search rewrites of a query with a single LLM call, behind the heuristic and the cache."""
+    def __init__(self, llm, model_name: str, n_variants: int = 3, cache: Optional[RewriteCache] = None,
+                 min_specific_terms: int = 5):
+        self.model_name = model_name
+        self.n_variants = n_variants
+        self.cache = cache
+        self.min_specific_terms = min_specific_terms
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", _EXPANSION_SYSTEM_PROMPT),
+                ("human", "<query>\n{input}\n</query>"),
+            ]
+        )
+        self.chain = prompt | llm | StrOutputParser()
+
+    def _lookup(self, query: str):
+        """:return: Tuple (cache key, rewrites or None if the LLM has to be called)."""
+        instrumentation = get_instrumentation()
+        if is_specific(query, self.min_specific_terms):
+            instrumentation.count("raggy_query_expansion_total", result="specific")
+            return None, []
+        key = RewriteCache.key(self.model_name, self.n_variants, query)
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is not None:
+            instrumentation.count("raggy_query_expansion_total", result="cache_hit")
+            return key, cached
+        instrumentation.count("raggy_query_expansion_total", result="llm")
+        return key, None
+
+    def _store(self, key: str, query: str, text: str) -> List[str]:
+        rewrites = parse_rewrites(text, query, self.n_variants)
+        if self.cache is not None:
+            self.cache.put(key, rewrites)
+        return rewrites
+
+    def expand(self, query: str) -> List[str]:
+        """:return: Up to n_variants rewrites, [] for specific queries or if the LLM call fails."""
+        key, rewrites = self._lookup(query)
+        if rewrites is not None:
+            return rewrites
+        try:
+            with get_instrumentation().stage("query_expansion"):
+                text = self.chain.invoke({"input": query, "n": self.n_variants})
+        except Exception as e:
+            logger.warning("Query expansion failed, retrieving with the original query only: %s", e)
+            return []
+        return self._store(key, query, text)
+
+    async def aexpand(self, query: str) -> List[str]:
+        """Async variant of expand."""
+        key, rewrites = self._lookup(query)
+        if rewrites is not None:
+            return rewrites
+        try:
+            with get_instrumentation().stage("query_expansion"):
+                text = await self.chain.ainvoke({"input": query, "n": self.n_variants})
+        except Exception as e:
+            logger.warning("Query expansion failed, retrieving with the original query only: %s", e)
+            return []
+        return self._store(key, query, text)
+
+
+class QueryExpandingRetriever(BaseRetriever):
+    """
+    Retrieves the original query while the expander writes rewrites, then retrieves all rewrites in parallel
+    and fuses every ranking with RRF (the original query weighs original_weight, each rewrite 1).
+    If the rewrites take longer than timeout seconds the results of the original query are returned,
+    the rewrite still finishes in the background and is cached for the next time.
+    """
+    base_retriever: Any
+    expander: Any
+    k: int = 5
+    rrf_k: int = 60
+    original_weight: float = 2.0
+    timeout: float = 5.0
+
+    def _merge(self, original: List[Document], rewrites: List[str], variant_results: List[List[Document]]):
+        get_instrumentation().set_attribute("query_variants", len(rewrites), observe=True)
+        if not rewrites:
+            return original[:self.k]
+        fused = reciprocal_rank_fusion(
+            [original, *variant_results], [self.original_weight] + [1.0] * len(rewrites), self.rrf_k
+        )
+        return [doc for doc, _ in fused[:self.k]]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                filter: Optional[dict] = None) -> List[Document]:
+        # The LLM call runs on the shared search pool while the original query is retrieved,
+        # a timed-out rewrite keeps its pool thread until it finishes, so no thread is created per query.
+        future = get_search_executor().submit(contextvars.copy_context().run, self.expander.expand, query)
+        start = time.perf_counter()
+        original = self.base_retriever.invoke(query, filter=filter)
+        try:
+            rewrites = future.result(timeout=max(self.timeout - (time.perf_counter() - start), 0))
+        except FutureTimeoutError:
+            logger.warning("Query expansion timed out after %.1f s", self.timeout)
+            rewrites = []
+        variant_results = self.base_retriever.batch(rewrites, filter=filter) if rewrites else []
+        return self._merge(original, rewrites, variant_results)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager,
+                                       filter: Optional[dict] = None) -> List[Document]:
+        expansion = asyncio.ensure_future(self.expander.aexpand(query))
+        start = time.perf_counter()
+        original = await self.base_retriever.ainvoke(query, filter=filter)
+        try:
+            rewrites = await asyncio.wait_for(asyncio.shield(expansion),
+                                              max(self.timeout - (time.perf_counter() - start), 0))
+        except asyncio.TimeoutError:
+            logger.warning("Query expansion timed out after %.1f s", self.timeout)
+            rewrites = []
+        variant_results = await asyncio.gather(*(self.base_retriever.ainvoke(rewrite, filter=filter)
+                                                 for rewrite in rewrites))
+        return self._merge(original, rewrites, list(variant_results))
@@ -1,28 +1,65 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough, RunnableParallel
+import asyncio
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableGenerator, RunnableLambda, RunnablePassthrough, RunnableParallel
 from langchain_core.output_parsers import StrOutputParser
 
 from configs.config import Config
+from src.answer_cache import AnswerCache
+from src.context_packer import pack_context
+from src.conversation import SessionStore, Turn
+from src.instrumentation import get_instrumentation
+from src.rate_limit import aretry_with_backoff
+from src.model_providers import get_chat_model
+from src.retrieval_filter import build_filter, filter_key
+from src.shared_clients import run_in_search_executor
 
-def _format_docs(docs):
-    """Helper to format retrieved documents into a single string."""
-    return "\n\n".join(doc.page_content for doc in docs)
+logger = logging.getLogger(__name__)
 
 class RAGgy_Engine:
-    def __init__(self, vector_store_manager):
-        Config.validate()
+    def __init__(self, vector_store_manager, instrumentation=None, llm=None):
+        """
+        :param llm: Optional chat model to use instead of the Config.LLM_PROVIDER model (e.g. a fake for benchmarks).
+        By default the process-wide model of the provider is used, e.g. Gemini on one pooled HTTP client.
+        """
+        Config.validate(require_api_key=llm is None and Config.LLM_PROVIDER == "google")
         self.vector_store_manager = vector_store_manager
-        self.llm = ChatGoogleGenerativeAI(
-            model=Config.LLM_MODEL,
-            temperature=0,
-            max_tokens=None,
-            timeout=None,
-            max_retries=3,
-            google_api_key=Config.GOOGLE_API_KEY
+        self.instrumentation = instrumentation or get_instrumentation()
+        self.llm, self.llm_name = (llm, type(llm).__name__) if llm is not None else get_chat_model()
+        self.answer_cache = None
+        if Config.ANSWER_CACHE_ENABLED:
+            self.answer_cache = AnswerCache(
+                Config.ANSWER_CACHE_PATH,
+                ttl_seconds=Config.ANSWER_CACHE_TTL_SECONDS,
+                max_entries=Config.ANSWER_CACHE_MAX_ENTRIES,
+                similarity_threshold=Config.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                llm_model=self.llm_name,
+                embedding_model=self.vector_store_manager.embeddings.model_name
+            )
+        self.query_expander = None
+        if Config.QUERY_EXPANSION_ENABLED:
+            from src.query_expansion import QueryExpander, RewriteCache
+            self.query_expander = QueryExpander(
+                self.llm,
+                model_name=self.llm_name,
+                n_variants=Config.QUERY_EXPANSION_VARIANTS,
+                cache=RewriteCache(Config.QUERY_REWRITE_CACHE_PATH, Config.QUERY_REWRITE_CACHE_MAX_ENTRIES),
+                min_specific_terms=Config.QUERY_EXPANSION_MIN_TERMS
+            )
+        self.sessions = SessionStore(
+            self._summarize_history,
+            max_sessions=Config.SESSION_MAX_SESSIONS,
+            ttl_seconds=Config.SESSION_IDLE_TTL_SECONDS,
+            history_tokens=Config.SESSION_HISTORY_TOKENS,
+            summary_tokens=Config.SESSION_SUMMARY_TOKENS,
+            reuse_min_coverage=Config.SESSION_REUSE_MIN_COVERAGE
         )
         self._init_chain()
         self._init_query_rewriter_chain()
+        self._init_summary_chain()
 
     def _init_chain(self):
         """LCEL Pipeline with a custom prompt to prevent using information not provided."""
@@ -38,35 +75,34 @@ class RAGgy_Engine:
             "<context>\n"
             "{context}\n"
             "</context>"
+            # Empty without a session, see _conversation_inputs
+            "{conversation}"
         )
         prompt = ChatPromptTemplate.from_messages(
             [
                 ("system", system_prompt),
+                MessagesPlaceholder("history", optional=True),
                 ("human", "{input}"),
             ]
         )
-        retriever = self.vector_store_manager.get_retriever()
+        retriever = self.vector_store_manager.get_retriever(query_expander=self.query_expander)
         retrieval_step = RunnableParallel({
             "docs": retriever,
             "input": RunnablePassthrough()
         })
         generation_step = (
                 RunnablePassthrough.assign(
-                    context=lambda x: _format_docs(x["docs"])  # Format docs for the prompt
+                    # Format docs for the prompt, "token_budget" in the input overrides Config.CONTEXT_TOKEN_BUDGET
+                    context=lambda x: self._build_context(x["docs"], x.get("token_budget")),
+                    conversation=lambda x: x.get("conversation", "")
                 )
-                | prompt
+                | RunnableLambda(lambda x: self._timed("prompt_assembly", prompt.invoke, x))
                 | self.llm
+                | RunnableGenerator(self._observe_llm, self._aobserve_llm)
                 | StrOutputParser()
         )
-        #self.rag_chain = (
-        #    {
-        #        "context": retriever | _format_docs,
-        #        "input": RunnablePassthrough()
-        #    }
-        #    | prompt
-        #    | self.llm
-        #    | StrOutputParser()
-        #)
+        self.retriever = retriever
+        self.generation_chain = generation_step
         self.rag_chain_new_pipe = retrieval_step.assign(answer=generation_step)
 
     def _init_query_rewriter_chain(self):
@@ -90,37 +126,414 @@ class RAGgy_Engine:
         )
         self.rewriter_chain = rewriter_prompt | self.llm | StrOutputParser()
 
-    def rewrite_query(self, query: str):
+    def _init_summary_chain(self):
+        summary_system_prompt = (
+            "You keep a running summary of a conversation between a user and an assistant answering questions "
+            "about the user's documents.\n"
+            "Update the summary inside the <summary> tags with the turns inside the <turns> tags.\n"
+            "### Rules:\n"
+            "1. Keep the documents, topics, names and numbers the user asked about, so later questions like "
+            "'what about the second one?' can be understood.\n"
+            "2. Do not add anything that is not in the summary or the turns.\n"
+            "3. At most {max_words} words. ONLY return the summary text."
+        )
+        summary_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", summary_system_prompt),
+                ("human", "<summary>\n{summary}\n</summary>\n<turns>\n{turns}\n</turns>"),
+            ]
+        )
+        self.summary_chain = summary_prompt | self.llm | StrOutputParser()
+
+    def _summarize_history(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        """Folds older turns of a session into its rolling summary, runs on the summarizer thread of the SessionStore."""
+        text = "\n".join(f"User: {question}\nAssistant: {answer}" for question, answer in turns)
+        return self.summary_chain.invoke({"summary": summary, "turns": text,
+                                          "max_words": Config.SESSION_SUMMARY_TOKENS * 3 // 4})
+
+    def rewrite_query(self, query: str) -> str:
+        """
+        Single rewrite of the query for retrieval, the query itself if the rewrite fails.
+        The retrieval pipeline uses the query expansion stage instead (Config.QUERY_EXPANSION_ENABLED).
+        """
         if not query:
             return ""
         try:
-            rewritten = self.rewriter_chain.invoke(query)
-            print(f"Rewritten Query: {rewritten}")
-            return rewritten
+            rewritten = self.rewriter_chain.invoke(query).strip()
         except Exception as e:
+            logger.warning("Query rewrite failed, using the original query: %s", e)
+            return query
+        logger.debug("Rewritten query: %s", rewritten)
+        return rewritten or query
+
+
+    def _timed(self, stage: str, fn, *args):
+        with self.instrumentation.stage(stage):
+            return fn(*args)
+
+    def _build_context(self, docs, token_budget: Optional[int] = None) -> str:
+        with self.instrumentation.stage("format_docs"):
+            context, packed, dropped = pack_context(docs, token_budget or Config.CONTEXT_TOKEN_BUDGET)
+        self.instrumentation.set_attribute("context_chars", len(context), observe=True)
+        self.instrumentation.set_attribute("context_tokens_packed", packed, observe=True)
+        self.instrumentation.set_attribute("context_tokens_dropped", dropped, observe=True)
+        return context
+
+    def _record_llm_chunk(self, chunk, start: float, first: bool):
+        if first:
+            self.instrumentation.record_stage("llm_first_token", (time.perf_counter() - start) * 1000)
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage:
+            self.instrumentation.set_attribute("prompt_tokens", usage.get("input_tokens"), observe=True)
+            self.instrumentation.set_attribute("completion_tokens", usage.get("output_tokens"), observe=True)
+
+    def _observe_llm(self, chunks):
+        """Pass-through over the LLM output stream that records time to first token, LLM time and token usage."""
+        start = time.perf_counter()
+        first = True
+        for chunk in chunks:
+            self._record_llm_chunk(chunk, start, first)
+            first = False
+            yield chunk
+        self.instrumentation.record_stage("llm", (time.perf_counter() - start) * 1000)
+
+    async def _aobserve_llm(self, chunks):
+        start = time.perf_counter()
+        first = True
+        async for chunk in chunks:
+            self._record_llm_chunk(chunk, start, first)
+            first = False
+            yield chunk
+        self.instrumentation.record_stage("llm", (time.perf_counter() - start) * 1000)
+
+    def _scope(self, sources=None, pages=None, ingested_after=None, ingested_before=None) -> Optional[dict]:
+        """Where clause of the request filters, see src/retrieval_filter.build_filter."""
+        where = build_filter(sources, pages, ingested_after, ingested_before)
+        if where:
+            self.instrumentation.set_attribute("retrieval_filter", filter_key(where))
+        return where
+
+    def _begin_turn(self, query: str, where: Optional[dict], session_id: Optional[str]) -> Turn:
+        """History of the session and the chunks of the previous turn if they still cover the question."""
+        if session_id is None:
+            return self.sessions.begin_turn(None, query)
+        docs_key = (filter_key(where), self.vector_store_manager.corpus_version())
+        turn = self.sessions.begin_turn(session_id, query, docs_key)
+        self.instrumentation.set_attribute("history_tokens", turn.history_tokens, observe=True)
+        if turn.history:
+            reused = turn.docs is not None
+            self.instrumentation.set_attribute("session_docs_reused", reused)
+            self.instrumentation.count("raggy_session_turns_total", docs="reused" if reused else "retrieved")
+        return turn
+
+    @staticmethod
+    def _conversation_inputs(turn: Turn) -> dict:
+        """Generation chain inputs of the session history, empty for the first question of a session."""
+        if not turn.history:
+            return {}
+        conversation = (
+            "\n\nThe messages before the question are the conversation so far. Use them only to understand "
+            "what the question refers to, the answer still comes from the context."
+        )
+        if turn.summary:
+            conversation += f"\nSummary of the earlier conversation:\n<summary>\n{turn.summary}\n</summary>"
+        return {"history": turn.history, "conversation": conversation}
+
+    def end_session(self, session_id: str):
+        """Forgets the history of a session, e.g. when the user starts a new chat."""
+        self.sessions.end(session_id)
+
+    def _retrieve(self, query: str, where: Optional[dict] = None):
+        with self.instrumentation.stage("retrieval"):
+            docs = self.retriever.invoke(query, filter=where)
+        self.instrumentation.set_attribute("retrieved_chunks", len(docs), observe=True)
+        return docs
+
+    async def _aretrieve(self, query: str, where: Optional[dict] = None):
+        with self.instrumentation.stage("retrieval"):
+            docs = await self.retriever.ainvoke(query, filter=where)
+        self.instrumentation.set_attribute("retrieved_chunks", len(docs), observe=True)
+        return docs
+
+    def _record_cache_result(self, tier: str):
+        self.instrumentation.set_attribute("answer_cache", tier)
+        self.instrumentation.count("raggy_answer_cache_total", result=tier)
+
+    def _lookup_cache(self, query: str, where: Optional[dict] = None):
+        """
+        Looks the query up in the answer cache. Scoped requests only use the exact tier of their scope.
+        :return: Tuple (cached response or None, corpus version, query embedding or None).
+        """
+        if self.answer_cache is None:
+            return None, None, None
+        with self.instrumentation.stage("answer_cache_lookup"):
+            corpus_version = self.vector_store_manager.corpus_version()
+            cached = self.answer_cache.get_exact(query, corpus_version, filter_key(where))
+            embedding = None
+            tier = "exact"
+            if cached is None:
+                # The query embedding is cached, so the retriever reuses it on a miss.
+                if self.answer_cache.semantic_enabled and not where:
+                    embedding = self.vector_store_manager.embeddings.embed_query(query)
+                cached = self.answer_cache.get_similar(embedding, corpus_version)
+                tier = "semantic" if cached is not None else "miss"
+        self._record_cache_result(tier)
+        return cached, corpus_version, embedding
+
+    async def _alookup_cache(self, query: str, where: Optional[dict] = None):
+        """Async variant of _lookup_cache."""
+        if self.answer_cache is None:
+            return None, None, None
+        with self.instrumentation.stage("answer_cache_lookup"):
+            corpus_version = self.vector_store_manager.corpus_version()
+            cached = self.answer_cache.get_exact(query, corpus_version, filter_key(where))
+            embedding = None
+            tier = "exact"
+            if cached is None:
+                if self.answer_cache.semantic_enabled and not where:
+                    embedding = await self.vector_store_manager.embeddings.aembed_query(query)
+                cached = self.answer_cache.get_similar(embedding, corpus_version)
+                tier = "semantic" if cached is not None else "miss"
+        self._record_cache_result(tier)
+        return cached, corpus_version, embedding
+
+    def _store_cache(self, query: str, response: dict, corpus_version, embedding, where: Optional[dict] = None):
+        if self.answer_cache is not None:
+            self.answer_cache.put(query, response, corpus_version, embedding, filter_key(where))
+
+    def _invoke(self, query: str, where: Optional[dict] = None, session_id: Optional[str] = None) -> dict:
+        """
+        Runs the RAG chain behind the answer cache. Returns the chain output (input, docs, answer).
+        Follow-ups of a session bypass the answer cache, their answer depends on the history.
+        """
+        turn = self._begin_turn(query, where, session_id)
+        cached, corpus_version, embedding = self._lookup_cache(query, where) if turn.use_cache else (None, None, None)
+        if cached is not None:
+            response = {"input": query, **cached}
+        else:
+            docs = turn.docs if turn.docs is not None else self._retrieve(turn.retrieval_query, where)
+            with self.instrumentation.stage("generation"):
+                answer = self.generation_chain.invoke({"input": query, "docs": docs, **self._conversation_inputs(turn)})
+            response = {"input": query, "docs": docs, "answer": answer}
+            if turn.use_cache:
+                self._store_cache(query, response, corpus_version, embedding, where)
+        self.sessions.end_turn(turn, response["answer"], response["docs"])
+        return response
+
+    async def _ainvoke(self, query: str, where: Optional[dict] = None, session_id: Optional[str] = None) -> dict:
+        """Async variant of _invoke."""
+        turn = self._begin_turn(query, where, session_id)
+        cached, corpus_version, embedding = (await self._alookup_cache(query, where)) if turn.use_cache \
+            else (None, None, None)
+        if cached is not None:
+            response = {"input": query, **cached}
+        else:
+            docs = turn.docs if turn.docs is not None else await self._aretrieve(turn.retrieval_query, where)
+            with self.instrumentation.stage("generation"):
+                answer = await self.generation_chain.ainvoke({"input": query, "docs": docs,
+                                                              **self._conversation_inputs(turn)})
+            response = {"input": query, "docs": docs, "answer": answer}
+            if turn.use_cache:
+                self._store_cache(query, response, corpus_version, embedding, where)
+        self.sessions.end_turn(turn, response["answer"], response["docs"])
+        return response
+
+    def stream(self, query: str, sources=None, pages=None, ingested_after=None, ingested_before=None,
+               session_id: Optional[str] = None):
+        """
+        Streams the response. Yields {"docs": [...]} once retrieval is done, then {"answer": token}
+        for every token as the LLM produces it and finally {"trace": {...}} with the request trace.
+        The optional filters scope the retrieval and session_id continues a conversation, see ask.
+        """
+        if not query:
+            yield {"answer": "What would you like to know?"}
             return
+        with self.instrumentation.trace("stream") as trace:
+            try:
+                where = self._scope(sources, pages, ingested_after, ingested_before)
+                turn = self._begin_turn(query, where, session_id)
+                cached, corpus_version, embedding = (self._lookup_cache(query, where)) if turn.use_cache \
+                    else (None, None, None)
+                if cached is not None:
+                    yield {"docs": cached["docs"]}
+                    yield {"answer": cached["answer"]}
+                    self.sessions.end_turn(turn, cached["answer"], cached["docs"])
+                else:
+                    docs = turn.docs if turn.docs is not None else self._retrieve(turn.retrieval_query, where)
+                    yield {"docs": docs}
+                    tokens = []
+                    with self.instrumentation.stage("generation"):
+                        for token in self.generation_chain.stream({"input": query, "docs": docs,
+                                                                   **self._conversation_inputs(turn)}):
+                            tokens.append(token)
+                            yield {"answer": token}
+                    answer = "".join(tokens)
+                    if turn.use_cache:
+                        self._store_cache(query, {"docs": docs, "answer": answer}, corpus_version, embedding, where)
+                    self.sessions.end_turn(turn, answer, docs)
+            except Exception as e:
+                self._handle_error(trace, e)
+                yield {"answer": f"Error generating response: {e}"}
+        yield {"trace": trace.to_dict()}
+
+    async def astream(self, query: str, sources=None, pages=None, ingested_after=None, ingested_before=None,
+                      session_id: Optional[str] = None):
+        """Async variant of stream."""
+        if not query:
+            yield {"answer": "What would you like to know?"}
+            return
+        with self.instrumentation.trace("astream") as trace:
+            try:
+                where = self._scope(sources, pages, ingested_after, ingested_before)
+                turn = self._begin_turn(query, where, session_id)
+                cached, corpus_version, embedding = (await self._alookup_cache(query, where)) if turn.use_cache \
+                    else (None, None, None)
+                if cached is not None:
+                    yield {"docs": cached["docs"]}
+                    yield {"answer": cached["answer"]}
+                    self.sessions.end_turn(turn, cached["answer"], cached["docs"])
+                else:
+                    docs = turn.docs if turn.docs is not None else await self._aretrieve(turn.retrieval_query, where)
+                    yield {"docs": docs}
+                    tokens = []
+                    with self.instrumentation.stage("generation"):
+                        async for token in self.generation_chain.astream({"input": query, "docs": docs,
+                                                                   **self._conversation_inputs(turn)}):
+                            tokens.append(token)
+                            yield {"answer": token}
+                    answer = "".join(tokens)
+                    if turn.use_cache:
+                        self._store_cache(query, {"docs": docs, "answer": answer}, corpus_version, embedding, where)
+                    self.sessions.end_turn(turn, answer, docs)
+            except Exception as e:
+                self._handle_error(trace, e)
+                yield {"answer": f"Error generating response: {e}"}
+        yield {"trace": trace.to_dict()}
+
+    async def abatch(self, queries: List[str], max_concurrency: Optional[int] = None, sources=None, pages=None,
+                     ingested_after=None, ingested_before=None) -> List[dict]:
+        """
+        Answers many questions efficiently. All query embeddings are requested in one batched call,
+        the vector lookups run together and generation runs concurrently with retry/backoff on rate limits.
+        The optional filters scope the retrieval of every query, see ask.
+        :return: One dict (input, docs, answer, error) per query, in input order. A failing query sets
+        "error" instead of failing the whole batch.
+        """
+        with self.instrumentation.trace("abatch") as trace:
+            where = self._scope(sources, pages, ingested_after, ingested_before)
+            results = await self._abatch(queries, max_concurrency or Config.BATCH_MAX_CONCURRENCY, where)
+            failed = sum(1 for result in results if result["error"])
+            trace.attributes.update({"batch_size": len(queries), "failed": failed})
+            self.instrumentation.count("raggy_batch_items_total", len(queries) - failed, status="ok")
+            self.instrumentation.count("raggy_batch_items_total", failed, status="error")
+        return results
+
+    async def _abatch(self, queries: List[str], max_concurrency: int, where: Optional[dict] = None) -> List[dict]:
+        results: List[Optional[dict]] = [None] * len(queries)
+        corpus_version = self.vector_store_manager.corpus_version()
+        scope = filter_key(where)
+        pending = {}
+        for i, query in enumerate(queries):
+            if not query:
+                results[i] = {"input": query, "docs": [], "answer": "What would you like to know?", "error": None}
+                continue
+            cached = self.answer_cache.get_exact(query, corpus_version, scope) if self.answer_cache else None
+            if cached is not None:
+                results[i] = {"input": query, **cached, "error": None}
+            else:
+                pending[i] = query
+        if not pending:
+            return results
+
+        indices = list(pending)
+        texts = [pending[i] for i in indices]
+        try:
+            with self.instrumentation.stage("query_embedding"):
+                embeddings = await aretry_with_backoff(
+                    self.vector_store_manager.embeddings.aembed_queries, texts,
+                    max_retries=Config.EMBEDDING_MAX_RETRIES
+                )
+            with self.instrumentation.stage("retrieval"):
+                if Config.RETRIEVAL_MODE == "similarity" and not Config.RERANK_ENABLED and self.query_expander is None:
+                    docs_lists = await run_in_search_executor(
+                        self.vector_store_manager.search_by_vectors, embeddings, Config.RETRIEVAL_K, where
+                    )
+                else:
+                    # Query embeddings are cached now, so the retriever only does local lookups.
+                    docs_lists = await self.retriever.abatch(texts, config={"max_concurrency": max_concurrency},
+                                                             filter=where)
+        except Exception as e:
+            for i in indices:
+                results[i] = {"input": pending[i], "docs": [], "answer": None, "error": f"Retrieval failed: {e}"}
+            return results
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def generate(i: int, query: str, docs, embedding):
+            async with semaphore:
+                try:
+                    with self.instrumentation.stage("generation"):
+                        answer = await aretry_with_backoff(
+                            self.generation_chain.ainvoke, {"input": query, "docs": docs},
+                            max_retries=Config.BATCH_MAX_RETRIES
+                        )
+                except Exception as e:
+                    results[i] = {"input": query, "docs": docs, "answer": None, "error": str(e)}
+                    return
+            response = {"input": query, "docs": docs, "answer": answer}
+            self._store_cache(query, response, corpus_version, embedding, where)
+            results[i] = {**response, "error": None}
+
+        await asyncio.gather(*(
+            generate(i, query, docs, embedding)
+            for i, query, docs, embedding in zip(indices, texts, docs_lists, embeddings)
+        ))
+        return results
 
+    def stream_answer(self, query: str, **options):
+        """Yields only the answer tokens of stream(), e.g. for st.write_stream."""
+        for chunk in self.stream(query, **options):
+            if "answer" in chunk:
+                yield chunk["answer"]
 
-    def ask(self,query: str):
+    def _handle_error(self, trace, error: Exception):
+        self.instrumentation.record_error(trace, error)
+        logger.exception("Error generating response (trace %s)", trace.trace_id)
+
+    def ask(self, query: str, sources=None, pages=None, ingested_after=None, ingested_before=None,
+            session_id: Optional[str] = None):
+        """
+        Answers a question. The optional filters restrict retrieval to a part of the corpus inside the index search:
+        :param sources: PDF file name or list of names.
+        :param pages: Inclusive range (first, last) of 1-based page numbers, either end may be None.
+        :param ingested_after: Only documents ingested at or after this date/datetime/Unix time.
+        :param ingested_before: Only documents ingested before this date/datetime/Unix time (a date includes the day).
+        :param session_id: Any ID of a conversation, follow-up questions are understood in the context of its
+        earlier questions (see src/conversation.py). None answers the question on its own.
+        """
         if not query:
             return "What would you like to know?"
-        try:
-           # response = self.rag_chain.invoke(self.rewrite_query(query))
-           # response_2 = self.rag_chain_new_pipe.invoke(self.rewrite_query(query))['answer']
-            response = self.rag_chain_new_pipe.invoke(query)['answer']
+        with self.instrumentation.trace("ask") as trace:
+            try:
+                where = self._scope(sources, pages, ingested_after, ingested_before)
+                response = self._invoke(query, where, session_id)['answer']
 
-            return response
-        except Exception as e:
-            return f"Error generating response: {e}"
+                return response
+            except Exception as e:
+                self._handle_error(trace, e)
+                return f"Error generating response: {e}"
 
-    async def aask(self,query: str):
+    async def aask(self, query: str, sources=None, pages=None, ingested_after=None, ingested_before=None,
+                   session_id: Optional[str] = None):
+        """Async variant of ask, returns the chain output (input, docs, answer)."""
         if not query:
             return "What would you like to know?"
-        try:
-           # response = self.rag_chain.invoke(self.rewrite_query(query))
-           # response_2 = await self.rag_chain_new_pipe.ainvoke(query)
-            response = await self.rag_chain_new_pipe.ainvoke(query)
+        with self.instrumentation.trace("aask") as trace:
+            try:
+                where = self._scope(sources, pages, ingested_after, ingested_before)
+                response = await self._ainvoke(query, where, session_id)
 
-            return response
-        except Exception as e:
-            return f"Error generating response: {e}"
+                return response
+            except Exception as e:
+                self._handle_error(trace, e)
+                return f"Error generating response: {e}"
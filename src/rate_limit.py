@@ -0,0 +1,83 @@
+import asyncio
+import random
+import time
+
+_RATE_LIMIT_MARKERS = ("429", "resource_exhausted", "resource exhausted", "rate limit", "quota")
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Checks whether an exception raised by a model client signals a rate limit / quota error."""
+    message = str(error).lower()
+    return any(marker in message for marker in _RATE_LIMIT_MARKERS)
+
+
+def _backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    # Exponential backoff with full jitter, so parallel workers don't retry in lockstep.
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def retry_with_backoff(fn, *args, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0, **kwargs):
+    """
+    Calls fn and retries it with exponential backoff as long as it fails with a rate limit error.
+    Other errors are raised immediately.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_rate_limit_error(e):
+                raise
+            time.sleep(_backoff_delay(attempt, base_delay, max_delay))
+            attempt += 1
+
+
+async def aretry_with_backoff(fn, *args, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0, **kwargs):
+    """Async variant of retry_with_backoff for coroutine functions."""
+    attempt = 0
+    while True:
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_rate_limit_error(e):
+                raise
+            await asyncio.sleep(_backoff_delay(attempt, base_delay, max_delay))
+            attempt += 1
+
+
+class AsyncRateLimiter:
+    """
+    Global limit for API calls of one event loop: at most max_concurrency calls in flight and
+    requests_per_minute call starts (token bucket with a burst of max_concurrency).
+    Usage: async with limiter: ...
+    """
+    def __init__(self, requests_per_minute: float, max_concurrency: int):
+        self.rate = requests_per_minute / 60
+        self.capacity = max(1, max_concurrency)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._semaphore = asyncio.Semaphore(self.capacity)
+        self._lock = asyncio.Lock()
+
+    async def _take_token(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        try:
+            await self._take_token()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
@@ -0,0 +1,183 @@
+import logging
+import math
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.instrumentation import get_instrumentation
+from src.keyword_index import tokenize
+from src.shared_clients import run_in_search_executor
+
+logger = logging.getLogger(__name__)
+
+Scorer = Callable[[str, List[Document]], List[float]]
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = tokenize(text)
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def dedupe_overlapping(docs: Sequence[Document], threshold: float = 0.5) -> List[Document]:
+    """
+    Drops chunks that mostly repeat a better ranked chunk of the same source and page, e.g. neighbours
+    sharing the CHUNK_OVERLAP text or identical boilerplate. Overlap is the share of a chunk's
+    word 5-grams that already occur in a kept chunk.
+    """
+    kept: List[Document] = []
+    kept_shingles: Dict[tuple, List[set]] = {}
+    for doc in docs:
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        shingles = _shingles(doc.page_content)
+        if any(len(shingles & other) >= threshold * len(shingles) for other in kept_shingles.get(key, [])):
+            continue
+        kept.append(doc)
+        kept_shingles.setdefault(key, []).append(shingles)
+    return kept
+
+
+def mmr_select(query_embedding: np.ndarray, embeddings: np.ndarray, k: int, lambda_mult: float = 0.7) -> List[int]:
+    """
+    Maximal marginal relevance on normalized vectors: picks k items that are relevant to the query
+    but not similar to each other. lambda_mult = 1 is pure relevance, 0 is pure diversity.
+    :return: Indices into embeddings in selection order.
+    """
+    if len(embeddings) == 0:
+        return []
+    relevance = embeddings @ query_embedding
+    similarity = embeddings @ embeddings.T
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of every candidate to anything selected so far.
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(embeddings)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def lexical_scorer(query: str, docs: List[Document]) -> List[float]:
+    """BM25 over the candidate set only. Runs in microseconds and needs no model."""
+    terms = set(tokenize(query))
+    if not docs or not terms:
+        return [0.0] * len(docs)
+    counts = [Counter(tokenize(doc.page_content)) for doc in docs]
+    lengths = [sum(count.values()) for count in counts]
+    avg_length = max(sum(lengths) / len(lengths), 1)
+    k1, b = 1.5, 0.75
+    scores = []
+    for count, length in zip(counts, lengths):
+        score = 0.0
+        for term in terms:
+            tf = count.get(term, 0)
+            if tf:
+                df = sum(1 for other in counts if term in other)
+                idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+        scores.append(score)
+    return scores
+
+
+class CrossEncoderScorer:
+    """
+    Scores (query, chunk) pairs with a small sentence-transformers cross-encoder on the CPU,
+    e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2". Needs the optional sentence-transformers package.
+    """
+    def __init__(self, model_name: str):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("Cross-encoder reranking needs 'pip install sentence-transformers'") from e
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def __call__(self, query: str, docs: List[Document]) -> List[float]:
+        if not docs:
+            return []
+        return [float(score) for score in self.model.predict([(query, doc.page_content) for doc in docs])]
+
+
+def get_scorer(name: Optional[str]) -> Optional[Scorer]:
+    """None disables reranking, "lexical" uses lexical_scorer, anything else is loaded as a cross-encoder model."""
+    if not name:
+        return None
+    if name == "lexical":
+        return lexical_scorer
+    return CrossEncoderScorer(name)
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Second retrieval stage on top of any first-stage retriever that returns fetch_k candidates:
+    1. drops overlapping chunks of the same source and page,
+    2. diversifies the rest with MMR on the embeddings stored in the vector backend, skipped without embeddings
+       (keyword mode), so a keyword-only first stage never calls the embedding model,
+    3. optionally reorders the MMR pick with a scorer and returns the best k chunks.
+    """
+    base_retriever: Any
+    vector_store: Any
+    embeddings: Any = None
+    k: int = 5
+    mmr_lambda: float = 0.7
+    dedupe_threshold: float = 0.5
+    scorer: Optional[Callable] = None
+
+    def _rerank(self, query: str, candidates: List[Document],
+                query_embedding: Optional[List[float]]) -> List[Document]:
+        timings = {}
+        start = time.perf_counter()
+        candidates = dedupe_overlapping(candidates, self.dedupe_threshold)
+        timings["dedupe_ms"] = (time.perf_counter() - start) * 1000
+
+        # With a scorer, MMR leaves it some room to reorder.
+        pick = self.k * 2 if self.scorer else self.k
+        start = time.perf_counter()
+        vectors = [] if query_embedding is None else self.vector_store.get_embeddings([doc.id for doc in candidates])
+        usable = [i for i, vector in enumerate(vectors) if vector is not None]
+        if usable:
+            matrix = np.asarray([vectors[i] for i in usable], dtype=np.float32)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+            selected = [candidates[usable[i]] for i in mmr_select(query_vector, matrix, pick, self.mmr_lambda)]
+        else:
+            selected = candidates[:pick]
+        if query_embedding is not None:
+            timings["mmr_ms"] = (time.perf_counter() - start) * 1000
+
+        if self.scorer:
+            start = time.perf_counter()
+            scores = self.scorer(query, selected)
+            order = sorted(range(len(selected)), key=lambda i: scores[i], reverse=True)
+            selected = [selected[i] for i in order]
+            timings["rerank_ms"] = (time.perf_counter() - start) * 1000
+
+        result = selected[:self.k]
+        instrumentation = get_instrumentation()
+        for stage, ms in timings.items():
+            instrumentation.record_stage(stage[:-3], ms)
+        instrumentation.set_attribute("rerank_candidates", len(candidates))
+        logger.debug("Reranking timings: %s", timings)
+        return result
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                filter: Optional[dict] = None) -> List[Document]:
+        candidates = self.base_retriever.invoke(query, filter=filter)
+        # Cached by the embedding cache, the first stage has embedded the query already.
+        query_embedding = self.embeddings.embed_query(query) if self.embeddings is not None else None
+        return self._rerank(query, candidates, query_embedding)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager,
+                                       filter: Optional[dict] = None) -> List[Document]:
+        candidates = await self.base_retriever.ainvoke(query, filter=filter)
+        query_embedding = await self.embeddings.aembed_query(query) if self.embeddings is not None else None
+        # Embedding lookups and scoring block, they run on the shared search executor.
+        return await run_in_search_executor(self._rerank, query, candidates, query_embedding)
@@ -0,0 +1,171 @@
+"""
+Per-request retrieval filters. A filter is a Chroma where clause over the chunk metadata: Chroma applies it
+inside the vector search, the local ANN store and the keyword index translate it to SQL over their chunk tables,
+so a scoped search only scores the chunks in scope instead of post-filtering a global top-k.
+Filterable fields written at ingest:
+- source: file name of the PDF,
+- page: 0-based page index of the PDF loader,
+- ingested_at: Unix time (seconds) the chunk was written.
+"""
+import datetime
+import json
+import re
+import sqlite3
+from operator import ge, gt, le, lt
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+Timestamp = Union[datetime.datetime, datetime.date, float, int, str]
+
+# Metadata fields the SQLite stores keep in indexed columns next to the JSON metadata.
+FILTER_COLUMNS = ("source", "page", "ingested_at")
+_KEY_PATTERN = re.compile(r"\w+")
+_SQL_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_COMPARISONS = {"$gt": gt, "$gte": ge, "$lt": lt, "$lte": le}
+
+
+def to_timestamp(value: Timestamp, end_of_day: bool = False) -> int:
+    """
+    Unix time of a datetime, a date (local midnight), an ISO string or a number.
+    :param end_of_day: Dates without time map to the following midnight, so the whole day is included.
+    """
+    if isinstance(value, str):
+        has_time = "T" in value or " " in value
+        value = datetime.datetime.fromisoformat(value) if has_time else datetime.date.fromisoformat(value)
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    if isinstance(value, datetime.date):
+        day = value + datetime.timedelta(days=1) if end_of_day else value
+        return int(datetime.datetime.combine(day, datetime.time()).timestamp())
+    return int(value)
+
+
+def build_filter(sources: Optional[Union[str, Iterable[str]]] = None,
+                 pages: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                 ingested_after: Optional[Timestamp] = None,
+                 ingested_before: Optional[Timestamp] = None) -> Optional[dict]:
+    """
+    Builds the where clause of a scoped retrieval.
+    :param sources: File name or file names to search in. None or empty searches all documents.
+    :param pages: Inclusive range (first, last) of 1-based page numbers, either end may be None.
+    :param ingested_after: Only chunks written at or after this time.
+    :param ingested_before: Only chunks written before this time (a date includes the whole day).
+    :return: Chroma where clause, None without any restriction.
+    """
+    clauses = []
+    if isinstance(sources, str):
+        clauses.append({"source": sources})
+    elif sources:
+        names = sorted(set(sources))
+        clauses.append({"source": names[0]} if len(names) == 1 else {"source": {"$in": names}})
+    if pages is not None:
+        first, last = pages
+        if first is not None:
+            clauses.append({"page": {"$gte": int(first) - 1}})
+        if last is not None:
+            clauses.append({"page": {"$lte": int(last) - 1}})
+    if ingested_after is not None:
+        clauses.append({"ingested_at": {"$gte": to_timestamp(ingested_after)}})
+    if ingested_before is not None:
+        clauses.append({"ingested_at": {"$lt": to_timestamp(ingested_before, end_of_day=True)}})
+    if not clauses:
+        return None
+    # Chroma rejects $and with a single clause.
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def filter_key(where: Optional[dict]) -> str:
+    """Canonical text of a filter, e.g. to namespace cache entries. Empty for no filter."""
+    return json.dumps(where, sort_keys=True, separators=(",", ":")) if where else ""
+
+
+def json_field(key: str, column: str = "metadata") -> str:
+    """SQL expression of a metadata key in a JSON text column."""
+    if not _KEY_PATTERN.fullmatch(key):
+        raise ValueError(f"Unsupported metadata key in filter: {key!r}")
+    return f"json_extract({column}, '$.{key}')"
+
+
+def ensure_filter_columns(conn: sqlite3.Connection, table: str, metadata_column: str = "metadata"):
+    """Adds missing FILTER_COLUMNS to a table of an older version and fills them from the JSON metadata."""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for field in FILTER_COLUMNS:
+        if field not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {field}")
+            conn.execute(f"UPDATE {table} SET {field} = {json_field(field, metadata_column)}")
+
+
+def filter_values(metadata: dict) -> tuple:
+    """Values of FILTER_COLUMNS of one chunk, in column order."""
+    return tuple(metadata.get(field) for field in FILTER_COLUMNS)
+
+
+def matches(where: Optional[dict], metadata: dict) -> bool:
+    """Evaluates a where clause on the metadata of one chunk, with the operators of where_to_sql."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(child, metadata) for child in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches(child, metadata) for child in condition):
+                return False
+            continue
+        value = metadata.get(key)
+        operations = condition.items() if isinstance(condition, dict) else [("$eq", condition)]
+        for operator, expected in operations:
+            if operator == "$in":
+                ok = value in expected
+            elif operator == "$nin":
+                ok = value not in expected
+            elif operator == "$eq":
+                ok = value == expected
+            elif operator == "$ne":
+                ok = value != expected
+            elif operator in _SQL_OPERATORS:
+                ok = value is not None and _COMPARISONS[operator](value, expected)
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+            if not ok:
+                return False
+    return True
+
+
+def where_to_sql(where: dict, column: Callable[[str], str]) -> Tuple[str, List]:
+    """
+    Translates a Chroma where clause to an SQL condition.
+    Supports $and, $or and field conditions with $eq, $ne, $gt, $gte, $lt, $lte, $in and $nin.
+    :param column: Maps a metadata key to the SQL expression holding its value.
+    :return: Tuple (SQL condition, parameters).
+    """
+    if not isinstance(where, dict) or not where:
+        raise ValueError(f"Invalid filter: {where!r}")
+    parts, params = [], []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            children = [where_to_sql(child, column) for child in condition]
+            if not children:
+                raise ValueError(f"{key} needs at least one condition")
+            parts.append("(" + f" {key[1:].upper()} ".join(sql for sql, _ in children) + ")")
+            params.extend(param for _, child_params in children for param in child_params)
+            continue
+        if key.startswith("$"):
+            raise ValueError(f"Unsupported filter operator: {key}")
+        expression = column(key)
+        operations = condition.items() if isinstance(condition, dict) else [("$eq", condition)]
+        for operator, value in operations:
+            if operator in ("$in", "$nin"):
+                values = list(value)
+                if not values:
+                    parts.append("0" if operator == "$in" else "1")
+                    continue
+                negation = "NOT " if operator == "$nin" else ""
+                parts.append(f"{expression} {negation}IN ({','.join('?' * len(values))})")
+                params.extend(values)
+            elif operator in _SQL_OPERATORS:
+                parts.append(f"{expression} {_SQL_OPERATORS[operator]} ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+    return " AND ".join(parts), params
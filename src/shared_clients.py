@@ -0,0 +1,116 @@
+"""
+Process-wide clients and executors shared by all requests:
+- one google-genai client with pooled keep-alive HTTP connections for embeddings and generation,
+- a bounded thread pool for vector searches and one for blocking ingest/delete work,
+so many concurrent chats neither open a connection per request nor spawn a thread per request.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from configs.config import Config
+
+_lock = threading.Lock()
+_genai_client = None
+_embeddings = None
+_chat_model = None
+_search_executor: Optional[ThreadPoolExecutor] = None
+_ingest_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_genai_client():
+    """
+    google-genai client whose sync and async httpx clients keep up to HTTP_MAX_KEEPALIVE_CONNECTIONS
+    connections alive and open at most HTTP_MAX_CONNECTIONS. The async client belongs to the event loop
+    that first uses it, so async callers should share one long-lived loop (e.g. the ASGI server's).
+    """
+    global _genai_client
+    with _lock:
+        if _genai_client is None:
+            Config.require_api_key()
+            import httpx
+            from google import genai
+            from google.genai.types import HttpOptions
+            limits = httpx.Limits(
+                max_connections=Config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY_SECONDS
+            )
+            timeout = httpx.Timeout(Config.HTTP_TIMEOUT_SECONDS)
+            _genai_client = genai.Client(
+                api_key=Config.GOOGLE_API_KEY,
+                http_options=HttpOptions(
+                    httpx_client=httpx.Client(limits=limits, timeout=timeout),
+                    httpx_async_client=httpx.AsyncClient(limits=limits, timeout=timeout)
+                )
+            )
+        return _genai_client
+
+
+def get_google_embeddings():
+    """The Google embedding model on the shared client."""
+    global _embeddings
+    client = get_genai_client()
+    with _lock:
+        if _embeddings is None:
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+            _embeddings = GoogleGenerativeAIEmbeddings(model=Config.EMBEDDING_MODEL)
+            _embeddings.client = client
+        return _embeddings
+
+
+def get_google_chat_model():
+    """The Gemini chat model on the shared client."""
+    global _chat_model
+    client = get_genai_client()
+    with _lock:
+        if _chat_model is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            _chat_model = ChatGoogleGenerativeAI(
+                model=Config.LLM_MODEL,
+                temperature=0,
+                max_tokens=None,
+                timeout=None,
+                max_retries=3,
+                google_api_key=Config.GOOGLE_API_KEY
+            )
+            _chat_model.client = client
+        return _chat_model
+
+
+def get_search_executor() -> ThreadPoolExecutor:
+    """Bounded pool for vector and keyword searches, which block on Chroma, SQLite or NumPy."""
+    global _search_executor
+    with _lock:
+        if _search_executor is None:
+            _search_executor = ThreadPoolExecutor(max_workers=Config.VECTOR_SEARCH_WORKERS,
+                                                  thread_name_prefix="raggy-search")
+        return _search_executor
+
+
+def get_ingest_executor() -> ThreadPoolExecutor:
+    """Bounded pool for the blocking work behind the async VectorStoreManager API."""
+    global _ingest_executor
+    with _lock:
+        if _ingest_executor is None:
+            _ingest_executor = ThreadPoolExecutor(max_workers=Config.ASYNC_INGEST_WORKERS,
+                                                  thread_name_prefix="raggy-ingest")
+        return _ingest_executor
+
+
+async def run_in_search_executor(fn, *args, **kwargs):
+    """Runs a blocking search call on the search pool, preserving the current trace context."""
+    return await _run(get_search_executor(), fn, *args, **kwargs)
+
+
+async def run_in_ingest_executor(fn, *args, **kwargs):
+    return await _run(get_ingest_executor(), fn, *args, **kwargs)
+
+
+async def _run(executor: ThreadPoolExecutor, fn, *args, **kwargs):
+    import contextvars
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
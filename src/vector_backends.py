@@ -0,0 +1,237 @@
+import threading
+from abc import abstractmethod
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from configs.config import Config
+from src.retrieval_filter import filter_key, matches
+from src.shared_clients import run_in_search_executor
+
+# Candidates per result of the unfiltered query that serves scopes above Config.SCOPED_SEARCH_MAX_CHUNKS.
+_BROAD_SCOPE_OVERSAMPLE = 4
+
+
+class VectorBackend(VectorStore):
+    """
+    Storage interface behind VectorStoreManager. On top of the LangChain VectorStore API
+    (similarity_search, as_retriever, ...) a backend offers raw writes with precomputed embeddings,
+    metadata updates, batched multi-query search and Chroma style paging via get().
+    Filters use the Chroma where syntax (see src/retrieval_filter.py). Every backend supports $and/$or over
+    metadata fields with $eq, $ne, $gt, $gte, $lt, $lte, $in and $nin, and applies them inside the search.
+    The async search embeds the query with the async embedding client and runs the blocking lookup on the
+    shared, bounded search executor instead of LangChain's default thread pool.
+    """
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        embedding = await self.embeddings.aembed_query(query)
+        return await self.asimilarity_search_by_vector(embedding, k, **kwargs)
+
+    async def asimilarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Document]:
+        return await run_in_search_executor(self.similarity_search_by_vector, embedding, k, **kwargs)
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[dict]):
+        """Inserts or replaces chunks with precomputed embeddings."""
+
+    @abstractmethod
+    def update_metadatas(self, ids: List[str], metadatas: List[dict]):
+        """Replaces the metadata of existing chunks without re-embedding them."""
+
+    @abstractmethod
+    def query_by_vectors(self, embeddings: List[List[float]], k: int = 5,
+                         filter: Optional[dict] = None) -> List[List[Document]]:
+        """
+        Runs the similarity search for many query embeddings at once.
+        :return: One list of documents per query embedding, best first.
+        """
+
+    @abstractmethod
+    def get_embeddings(self, ids: List[str]) -> List[Optional[List[float]]]:
+        """
+        Returns the stored embeddings of the given chunks.
+        :return: One vector per ID in input order, None for unknown IDs.
+        """
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored chunks."""
+
+
+class ChromaBackend(Chroma, VectorBackend):
+    """
+    The default backend: a persistent Chroma collection.
+    Chroma evaluates a where clause on its metadata tables for every filtered query, which costs more than the
+    unfiltered HNSW search. Scopes of up to Config.SCOPED_SEARCH_MAX_CHUNKS chunks are therefore resolved once,
+    and their embeddings are kept for the last SCOPED_SEARCH_CACHE_SCOPES scopes and searched exactly with NumPy.
+    Larger scopes take the in-scope part of an unfiltered query for _BROAD_SCOPE_OVERSAMPLE * k chunks and fall
+    back to Chroma's filtered search if that holds fewer than k chunks. Every write drops the cached scopes.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._scope_lock = threading.Lock()
+        self._scopes: "OrderedDict[str, Optional[tuple]]" = OrderedDict()
+        self._write_generation = 0
+
+    def _invalidate_scopes(self):
+        with self._scope_lock:
+            self._write_generation += 1
+            self._scopes.clear()
+
+    def _scope(self, where: dict) -> Optional[tuple]:
+        """:return: (chunk IDs, embeddings, squared norms) of a small scope, None above the size limit."""
+        key = filter_key(where)
+        with self._scope_lock:
+            if key in self._scopes:
+                self._scopes.move_to_end(key)
+                return self._scopes[key]
+            generation = self._write_generation
+        limit = Config.SCOPED_SEARCH_MAX_CHUNKS
+        data = self._collection.get(where=where, limit=limit + 1, include=['embeddings'])
+        scope = None
+        if len(data['ids']) <= limit:
+            matrix = np.asarray(data['embeddings'], dtype=np.float32).reshape(len(data['ids']), -1) \
+                if data['ids'] else np.empty((0, 0), dtype=np.float32)
+            scope = (list(data['ids']), matrix, np.einsum("ij,ij->i", matrix, matrix))
+        with self._scope_lock:
+            # A write during the lookup may have changed the scope, it is resolved again next time.
+            if generation == self._write_generation:
+                self._scopes[key] = scope
+                while len(self._scopes) > Config.SCOPED_SEARCH_CACHE_SCOPES:
+                    self._scopes.popitem(last=False)
+        return scope
+
+    def _space(self) -> str:
+        configuration = getattr(self._collection, "configuration", None) or {}
+        space = (configuration.get("hnsw") or {}).get("space")
+        return space or (self._collection.metadata or {}).get("hnsw:space", "l2")
+
+    def _search_scope(self, embedding: List[float], k: int, scope: tuple) -> List[Document]:
+        """Exact search over the cached embeddings of a scope, with the distance function of the collection."""
+        ids, matrix, squared_norms = scope
+        if not ids:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        dots = matrix @ query
+        space = self._space()
+        if space == "cosine":
+            distances = 1 - dots / np.maximum(np.sqrt(squared_norms) * np.linalg.norm(query), 1e-12)
+        elif space == "ip":
+            distances = 1 - dots
+        else:
+            distances = squared_norms - 2 * dots + float(query @ query)
+        top = np.argpartition(distances, k)[:k] if len(ids) > k else np.arange(len(ids))
+        top_ids = [ids[i] for i in top[np.argsort(distances[top])]]
+        data = self._collection.get(ids=top_ids, include=['documents', 'metadatas'])
+        found = {chunk_id: (content, meta) for chunk_id, content, meta in
+                 zip(data['ids'], data['documents'], data['metadatas'])}
+        return [Document(id=chunk_id, page_content=found[chunk_id][0], metadata=found[chunk_id][1] or {})
+                for chunk_id in top_ids if chunk_id in found]
+
+    def _query(self, embeddings: List[List[float]], n: int, where: Optional[dict]) -> List[List[Document]]:
+        results = self._collection.query(
+            query_embeddings=embeddings,
+            n_results=n,
+            where=where,
+            include=['documents', 'metadatas']
+        )
+        return [
+            [Document(id=chunk_id, page_content=content, metadata=meta or {})
+             for chunk_id, content, meta in zip(ids, contents, metadatas)]
+            for ids, contents, metadatas in zip(results['ids'], results['documents'], results['metadatas'])
+        ]
+
+    def _search_filtered(self, embeddings: List[List[float]], k: int, where: dict) -> List[List[Document]]:
+        scope = self._scope(where)
+        if scope is not None:
+            return [self._search_scope(embedding, k, scope) for embedding in embeddings]
+        # A large scope usually holds most of the nearest chunks: the in-scope part of an unfiltered ranking is
+        # the exact scoped ranking. Only queries with fewer than k chunks in scope pay Chroma's filtered search.
+        n = k * _BROAD_SCOPE_OVERSAMPLE
+        results = []
+        for candidates in self._query(embeddings, n, None):
+            in_scope = [doc for doc in candidates if matches(where, doc.metadata)][:k]
+            results.append(in_scope if len(in_scope) == k or len(candidates) < n else None)
+        missing = [i for i, docs in enumerate(results) if docs is None]
+        if missing:
+            for i, docs in zip(missing, self._query([embeddings[i] for i in missing], k, where)):
+                results[i] = docs
+        return results
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None,
+                          **kwargs: Any) -> List[Document]:
+        if filter and not kwargs.get("where_document"):
+            return self._search_filtered([self._embedding_function.embed_query(query)], k, filter)[0]
+        return super().similarity_search(query, k, filter=filter, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None,
+                                    **kwargs: Any) -> List[Document]:
+        if filter and not kwargs.get("where_document"):
+            return self._search_filtered([embedding], k, filter)[0]
+        return super().similarity_search_by_vector(embedding, k, filter=filter, **kwargs)
+
+    def add_texts(self, *args, **kwargs) -> List[str]:
+        try:
+            return super().add_texts(*args, **kwargs)
+        finally:
+            self._invalidate_scopes()
+
+    def delete(self, *args, **kwargs) -> None:
+        try:
+            return super().delete(*args, **kwargs)
+        finally:
+            self._invalidate_scopes()
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[dict]):
+        try:
+            self._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        finally:
+            self._invalidate_scopes()
+
+    def update_metadatas(self, ids: List[str], metadatas: List[dict]):
+        try:
+            self._collection.update(ids=ids, metadatas=metadatas)
+        finally:
+            self._invalidate_scopes()
+
+    def query_by_vectors(self, embeddings: List[List[float]], k: int = 5,
+                         filter: Optional[dict] = None) -> List[List[Document]]:
+        return self._search_filtered(embeddings, k, filter) if filter else self._query(embeddings, k, None)
+
+    def get_embeddings(self, ids: List[str]) -> List[Optional[List[float]]]:
+        if not ids:
+            return []
+        data = self._collection.get(ids=ids, include=['embeddings'])
+        vectors = dict(zip(data['ids'], data['embeddings']))
+        return [vectors.get(chunk_id) for chunk_id in ids]
+
+    def count(self) -> int:
+        return self._collection.count()
+
+
+def create_vector_backend(embeddings: Embeddings) -> VectorBackend:
+    """
+    Creates the backend selected by Config.VECTOR_BACKEND:
+    "chroma" (default) or "local" (memory-mapped IVF index, see src/local_ann_store.py).
+    """
+    if Config.VECTOR_BACKEND == "local":
+        from src.local_ann_store import LocalANNStore
+        return LocalANNStore(
+            Config.LOCAL_INDEX_PATH,
+            embedding_function=embeddings,
+            quantization=Config.LOCAL_INDEX_QUANTIZATION,
+            nlist=Config.LOCAL_INDEX_NLIST,
+            nprobe=Config.LOCAL_INDEX_NPROBE,
+            train_min=Config.LOCAL_INDEX_TRAIN_MIN
+        )
+    if Config.VECTOR_BACKEND != "chroma":
+        raise ValueError(f"Unknown vector backend: {Config.VECTOR_BACKEND}")
+    return ChromaBackend(
+        collection_name="Knowledge_Base",
+        embedding_function=embeddings,
+        persist_directory=str(Config.CHROMA_DB_PATH)
+    )
@@ -1,78 +1,620 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Union
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
 
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 from configs.config import Config
+from src.document_registry import DocumentRegistry
+from src.embedding_cache import CachedEmbeddings
+from src.instrumentation import get_instrumentation
+from src.keyword_index import KeywordIndex
+from src.rate_limit import retry_with_backoff
+from src.model_providers import get_embedding_model_name, get_embeddings
+from src.shared_clients import run_in_ingest_executor, run_in_search_executor
+# PDF parsing, text splitting, Chroma and the retrievers are imported where they are used: listing documents
+# and other registry-only calls then start without loading them.
+
+
+# Child chunks only carry what retrieval, filtering and the registry need, the rest lives with their parent.
+_CHILD_METADATA_KEYS = ("source", "file_hash", "page", "page_label", "total_pages", "ingested_at")
+# Transient metadata of the first child of every parent, moved to the parent docstore before the child is written.
+_PARENT_TEXT_KEY = "parent_text"
+
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _chunking_config() -> dict:
+    """
+    The chunking settings of Config. Worker processes get them passed explicitly, under the spawn start method
+    they import a fresh Config without the overrides of the parent process.
+    """
+    return {
+        "chunk_size": Config.CHUNK_SIZE,
+        "chunk_overlap": Config.CHUNK_OVERLAP,
+        "chunking_mode": Config.CHUNKING_MODE,
+        "parent_chunk_overlap": Config.PARENT_CHUNK_OVERLAP,
+        "child_chunk_size": Config.CHILD_CHUNK_SIZE,
+        "child_chunk_overlap": Config.CHILD_CHUNK_OVERLAP,
+    }
+
+
+def _split_pages(pages: List[Document], original_filename: str, file_hash: str,
+                 chunking: Optional[dict] = None) -> List[Document]:
+    """
+    Splits loaded pages into chunks carrying content hashes and deterministic IDs.
+    The chunk ID only depends on source, page and chunk text, so unchanged chunks keep their ID across re-ingests.
+    :param chunking: Chunking settings, see _chunking_config (default: the current Config).
+    """
+    chunking = chunking or _chunking_config()
+    for doc in pages:
+        doc.metadata["source"] = original_filename # Important for Deletion of files
+        doc.metadata["file_hash"] = file_hash
+        doc.metadata["page_hash"] = _hash_text(doc.page_content)
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    parent_child = chunking["chunking_mode"] == "parent_child"
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunking["chunk_size"],
+        chunk_overlap=chunking["parent_chunk_overlap"] if parent_child else chunking["chunk_overlap"]
+    )
+    splits = text_splitter.split_documents(pages)
+    seen = {}
+    for split in splits:
+        chunk_hash = _hash_text(split.page_content)
+        key = (split.metadata.get("page"), chunk_hash)
+        occurrence = seen.get(key, 0)  # Identical chunks on the same page still need distinct IDs
+        seen[key] = occurrence + 1
+        split.metadata["chunk_hash"] = chunk_hash
+        split.id = _hash_text(f"{original_filename}\x00{key[0]}\x00{chunk_hash}\x00{occurrence}")
+    if not parent_child:
+        return splits
+    return _split_children(splits, chunking["child_chunk_size"], chunking["child_chunk_overlap"])
+
+
+def _stamp_ingest_time(splits: List[Document]):
+    """Sets the ingested_at metadata (Unix seconds) that date filters of a scoped retrieval select on."""
+    now = int(time.time())
+    for split in splits:
+        split.metadata["ingested_at"] = now
+
+
+def _split_children(parents: List[Document], chunk_size: int, chunk_overlap: int) -> List[Document]:
+    """
+    Splits parent passages into small child chunks for embedding (Config.CHILD_CHUNK_SIZE).
+    Children reference their parent by parent_id, the first child of every parent carries the parent text
+    until it is written, see _take_parents.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    child_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    children = []
+    for parent in parents:
+        base_metadata = {key: parent.metadata[key] for key in _CHILD_METADATA_KEYS if key in parent.metadata}
+        seen = {}
+        for i, text in enumerate(child_splitter.split_text(parent.page_content)):
+            chunk_hash = _hash_text(text)
+            occurrence = seen.get(chunk_hash, 0)
+            seen[chunk_hash] = occurrence + 1
+            metadata = {**base_metadata, "parent_id": parent.id}
+            if i == 0:
+                metadata[_PARENT_TEXT_KEY] = parent.page_content
+            # The parent ID covers source, page and parent text, so a changed parent gets new children.
+            child_id = _hash_text(f"{parent.id}\x00{chunk_hash}\x00{occurrence}")
+            children.append(Document(id=child_id, page_content=text, metadata=metadata))
+    return children
+
+
+def _take_parents(splits: List[Document]) -> dict:
+    """
+    Removes the transient parent texts from child chunks.
+    :return: Dict parent_id -> (text, metadata) for the parent docstore.
+    """
+    parents = {}
+    for split in splits:
+        text = split.metadata.pop(_PARENT_TEXT_KEY, None)
+        if text is not None:
+            metadata = {key: split.metadata[key] for key in _CHILD_METADATA_KEYS if key in split.metadata}
+            parents[split.metadata["parent_id"]] = (text, metadata)
+    return parents
+
+
+def _parent_ids(splits: List[Document]) -> set:
+    return {split.metadata["parent_id"] for split in splits if split.metadata.get("parent_id")}
+
+
+def _iter_pdf_pages(path: Path, start_page: int = 0) -> Iterator[Tuple[int, Document]]:
+    """
+    Loads a PDF page by page with pypdf, the pages before start_page are not parsed at all, so resuming a large
+    document does not extract the text of its written pages again. Page text and page numbers match PyPDFLoader.
+    :return: Iterator of (total pages, page).
+    """
+    import pypdf
+    with open(path, "rb") as f:
+        reader = pypdf.PdfReader(f)
+        total_pages = len(reader.pages)
+        for page_number in range(start_page, total_pages):
+            metadata = {"source": str(path), "total_pages": total_pages, "page": page_number,
+                        "page_label": reader.page_labels[page_number]}
+            yield total_pages, Document(page_content=reader.pages[page_number].extract_text().strip(),
+                                        metadata=metadata)
+
+
+def _iter_split_windows(file_path: Union[str, Path], original_filename: str, file_hash: Optional[str] = None,
+                        window_pages: int = 25, start_page: int = 0,
+                        chunking: Optional[dict] = None) -> Iterator[Tuple[int, int, List[Document]]]:
+    """
+    Lazily loads a PDF page by page and yields its chunks in windows of window_pages pages,
+    so only one window is held in memory. Pages before start_page are skipped without parsing.
+    :return: Iterator of (pages done, total pages, chunks of the window).
+    """
+    path = Path(file_path)
+    file_hash = file_hash or _hash_file(path)
+    window: List[Document] = []
+    pages_done = start_page
+    total_pages = 0
+    for total_pages, page in _iter_pdf_pages(path, start_page):
+        pages_done += 1
+        window.append(page)
+        if len(window) >= window_pages:
+            yield pages_done, total_pages, _split_pages(window, original_filename, file_hash, chunking)
+            window = []
+    if window:
+        yield pages_done, total_pages, _split_pages(window, original_filename, file_hash, chunking)
+
+
+def _load_and_split(file_path: Union[str, Path], original_filename: str, file_hash: Optional[str] = None,
+                    chunking: Optional[dict] = None) -> List[Document]:
+    """Loads and splits a whole PDF at once, used where all chunks of a file are needed together."""
+    windows = _iter_split_windows(file_path, original_filename, file_hash, window_pages=1000, chunking=chunking)
+    return [split for _, _, splits in windows for split in splits]
+
+
+def _count_pages(splits: List[Document]) -> int:
+    if not splits:
+        return 0
+    return splits[0].metadata.get("total_pages") or len({split.metadata.get("page") for split in splits})
+
 
 class VectorStoreManager:
-    def __init__(self):
-        Config.validate()
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model=Config.EMBEDDING_MODEL
-        )
-        self.vector_store = Chroma(
-            collection_name="Knowledge_Base",
-            embedding_function=self.embeddings,
-        persist_directory=Config.CHROMA_DB_PATH
+    def __init__(self, instrumentation=None, embeddings=None, embedding_model_name: Optional[str] = None):
+        """
+        :param embeddings: Optional embedding model to use instead of the Config.EMBEDDING_PROVIDER model (e.g. a fake
+        for benchmarks). embedding_model_name namespaces its entries in the embedding cache.
+        The embedding model, the vector store and the parent docstore are loaded on first use. Loading the vector
+        store rebuilds the registry or keyword index of a collection that was indexed before they existed.
+        """
+        Config.validate(require_api_key=False)  # Checked when a Google model is loaded
+        self.instrumentation = instrumentation or get_instrumentation()
+        if embeddings is None:
+            provider = Config.EMBEDDING_PROVIDER
+            embedding_model_name = get_embedding_model_name(provider)
+            embeddings = lambda: get_embeddings(provider)[0]
+        self.embeddings = CachedEmbeddings(
+            embeddings,
+            model_name=embedding_model_name or type(embeddings).__name__,
+            cache_path=Config.EMBEDDING_CACHE_PATH,
+            max_entries=Config.EMBEDDING_CACHE_MAX_ENTRIES
         )
+        self.registry = DocumentRegistry(Config.REGISTRY_DB_PATH)
+        self.keyword_index = KeywordIndex(Config.KEYWORD_INDEX_PATH)
+        self._vector_store = None
+        self._docstore = None
+        self._init_lock = threading.Lock()
+        self._scorer = None  # Loaded on first use, cross-encoders are slow to load
+        # Serializes writes to the vector store and keyword index, e.g. from several ingest workers.
+        self._write_lock = threading.RLock()
+
+    @property
+    def vector_store(self):
+        if self._vector_store is None:
+            with self._init_lock:
+                if self._vector_store is None:
+                    from src.vector_backends import create_vector_backend
+                    vector_store = create_vector_backend(self.embeddings)
+                    # Published after the rebuild, so no caller sees a store with incomplete indexes.
+                    self._rebuild_indexes(vector_store)
+                    self._vector_store = vector_store
+        return self._vector_store
+
+    def _rebuild_indexes(self, vector_store):
+        """
+        Rebuilds the registry or keyword index of an existing collection, e.g. after an upgrade.
+        Runs when the vector store is loaded, so startup does not wait for the collection.
+        """
+        if (self.registry.is_empty() or self.keyword_index.is_empty()) and vector_store.count() > 0:
+            if self.registry.is_empty():
+                self.registry.rebuild(vector_store)
+            if self.keyword_index.is_empty():
+                self.keyword_index.rebuild(vector_store)
+
+    @property
+    def docstore(self):
+        if self._docstore is None:
+            with self._init_lock:
+                if self._docstore is None:
+                    from src.parent_docstore import ParentDocStore
+                    self._docstore = ParentDocStore(Config.PARENT_DOCSTORE_PATH)
+        return self._docstore
 
-    def add_pdf(self, file_path: Union[str, Path], original_filename: str):
+    def add_pdf(self, file_path: Union[str, Path], original_filename: str,
+                progress_callback: Optional[Callable[[int, int], None]] = None):
         """
-        Processes PDF and stores it in the vector store.
+        Streams a PDF into the vector store: pages are loaded lazily and split, embedded and written in windows
+        of Config.INGEST_WINDOW_PAGES pages, so memory stays bounded even for very large documents.
+        A checkpoint is stored after every window, an interrupted ingest of the same file resumes after the last one.
+        :param progress_callback: Optional callable(pages_done, total_pages), invoked after every window.
         """
         try:
             path = Path(file_path)
-            loader = PyPDFLoader(path)
-            docs = loader.load()
-
-            for doc in docs:
-                doc.metadata["source"] = original_filename # Important for Deletion of files
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=Config.CHUNK_SIZE,
-                chunk_overlap=Config.CHUNK_OVERLAP
-            )
-            splits = text_splitter.split_documents(docs)
-            self.vector_store.add_documents(documents=splits)
-            return 0, f"Successfully added {original_filename} ({len(splits)} chunks)."
+            file_hash = _hash_file(path)
+            checkpoint = self.registry.get_checkpoint(original_filename, file_hash)
+            pages_done, chunk_ids = checkpoint if checkpoint else (0, [])
+            windows = _iter_split_windows(path, original_filename, file_hash, Config.INGEST_WINDOW_PAGES, pages_done)
+            while True:
+                with self.instrumentation.stage("ingest_parse"):
+                    window = next(windows, None)
+                if window is None:
+                    break
+                pages_done, total_pages, splits = window
+                self._embed_and_commit(splits)
+                window_ids = [split.id for split in splits]
+                self.registry.save_checkpoint(original_filename, file_hash, pages_done, window_ids)
+                chunk_ids.extend(window_ids)
+                if progress_callback:
+                    progress_callback(pages_done, total_pages)
+            # A new version of a registered file replaces it, its chunks that no longer exist are deleted.
+            self._delete_with_parents(set(self.registry.get_chunk_ids(original_filename)) - set(chunk_ids))
+            self.registry.register(original_filename, file_hash, pages_done, chunk_ids)
+            self.registry.clear_checkpoint(original_filename)
+            resumed = f", resumed after page {checkpoint[0]}" if checkpoint else ""
+            return 0, f"Successfully added {original_filename} ({len(chunk_ids)} chunks{resumed})."
         except Exception as e:
             return -1, str(e)
 
+    def discard_checkpoint(self, original_filename: str):
+        """
+        Drops the progress of an interrupted add_pdf whose file will not be submitted again, e.g. a cancelled upload.
+        The chunks it has written that are not registered for the source are deleted.
+        """
+        written = self.registry.clear_checkpoint(original_filename)
+        registered = set(self.registry.get_chunk_ids(original_filename))
+        self._delete_with_parents(chunk_id for chunk_id in written if chunk_id not in registered)
+
+    def upsert_pdf(self, file_path: Union[str, Path], original_filename: str):
+        """
+        Re-ingests a PDF incrementally. Only chunks whose content changed are embedded and written,
+        chunks that no longer exist in the new version are deleted.
+        """
+        try:
+            path = Path(file_path)
+            file_hash = _hash_file(path)
+            if self.registry.get_file_hash(original_filename) == file_hash:
+                return 0, f"{original_filename} is up to date."
+
+            with self.instrumentation.stage("ingest_parse"):
+                splits = _load_and_split(path, original_filename, file_hash)
+            new_splits, stale_ids, kept_splits = self._diff_against_store(splits, original_filename)
+
+            self._write_chunks(new_splits)
+            self._apply_diff(stale_ids, kept_splits)
+            self.docstore.prune(original_filename, _parent_ids(splits))
+            self.registry.register(original_filename, file_hash, _count_pages(splits), [split.id for split in splits])
+            return 0, (f"Updated {original_filename}: {len(new_splits)} added, "
+                       f"{len(stale_ids)} removed, {len(kept_splits)} unchanged chunks.")
+        except Exception as e:
+            return -1, str(e)
+
+    def add_pdfs(self, paths: Iterable[Union[str, Path]], workers: Optional[int] = None,
+                 progress_callback: Optional[Callable[[int, int], None]] = None):
+        """
+        Bulk ingestion of many PDFs. Parsing and splitting run in a process pool, embeddings are
+        requested in batches with bounded concurrency and the results are committed to the vector store in large batches.
+        Files are stored under their file name, unchanged files are skipped and changed files are updated incrementally.
+        :param progress_callback: Optional callable(files_done, files_total), invoked after every parsed file.
+        """
+        start = time.perf_counter()
+        workers = workers or Config.INGEST_WORKERS
+        pending = {}
+        skipped = 0
+        errors = []
+        for file_path in paths:
+            path = Path(file_path)
+            try:
+                file_hash = _hash_file(path)
+                if self.registry.get_file_hash(path.name) == file_hash:
+                    skipped += 1
+                else:
+                    pending[path] = file_hash
+            except Exception as e:
+                errors.append(f"{path.name}: {e}")
+
+        pages = chunks = 0
+        buffer, stale_ids, kept_splits, parsed = [], [], [], []
+        try:
+            with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+                chunking = _chunking_config()
+                futures = {pool.submit(_load_and_split, path, path.name, file_hash, chunking): path
+                           for path, file_hash in pending.items()}
+                for files_done, future in enumerate(as_completed(futures), start=1):
+                    path = futures[future]
+                    if progress_callback:
+                        progress_callback(files_done, len(futures))
+                    try:
+                        splits = future.result()
+                        new_splits, stale, kept = self._diff_against_store(splits, path.name)
+                    except Exception as e:
+                        errors.append(f"{path.name}: {e}")
+                        continue
+                    page_count = _count_pages(splits)
+                    parsed.append((path, page_count, [split.id for split in splits], _parent_ids(splits)))
+                    pages += page_count
+                    chunks += len(new_splits)
+                    buffer.extend(new_splits)
+                    stale_ids.extend(stale)
+                    kept_splits.extend(kept)
+                    # Embed and commit while the pool keeps parsing the remaining files.
+                    while len(buffer) >= Config.INGEST_COMMIT_BATCH_SIZE:
+                        self._embed_and_commit(buffer[:Config.INGEST_COMMIT_BATCH_SIZE])
+                        buffer = buffer[Config.INGEST_COMMIT_BATCH_SIZE:]
+            if buffer:
+                self._embed_and_commit(buffer)
+            self._apply_diff(stale_ids, kept_splits)
+            # Register only after all chunks are committed, so an aborted run is retried next time.
+            for path, page_count, chunk_ids, parent_ids in parsed:
+                self.docstore.prune(path.name, parent_ids)
+                self.registry.register(path.name, pending[path], page_count, chunk_ids)
+        except Exception as e:
+            return -1, str(e)
+
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        self.instrumentation.record_stage("bulk_ingest", elapsed * 1000)
+        self.instrumentation.count("raggy_ingested_pages_total", pages)
+        msg = (f"Ingested {len(parsed)} files ({skipped} unchanged skipped): "
+               f"{pages} pages, {chunks} chunks in {elapsed:.1f}s "
+               f"({pages / elapsed:.1f} pages/s, {chunks / elapsed:.1f} chunks/s).")
+        if errors:
+            return -1, msg + " Errors: " + "; ".join(errors)
+        return 0, msg
+
+    def _diff_against_store(self, splits: List[Document], original_filename: str):
+        """
+        Compares a fresh split of a file with the chunks stored for it.
+        :return: Tuple (chunks to add, IDs to delete, chunks that are kept).
+        """
+        existing_ids = set(self.registry.get_chunk_ids(original_filename))
+        new_splits = [split for split in splits if split.id not in existing_ids]
+        kept_splits = [split for split in splits if split.id in existing_ids]
+        stale_ids = list(existing_ids - {split.id for split in splits})
+        return new_splits, stale_ids, kept_splits
+
+    def _write_chunks(self, splits: List[Document], embeddings: Optional[List[List[float]]] = None):
+        """
+        Single write path for chunks, keeps the vector store, the keyword index and the parent docstore in sync.
+        Without precomputed embeddings the chunks are embedded by the vector store.
+        """
+        if not splits:
+            return
+        ids = [split.id for split in splits]
+        _stamp_ingest_time(splits)
+        with self._write_lock, self.instrumentation.stage("chunk_write"):
+            # Parents first, a child must never point to a missing passage.
+            self.docstore.put(_take_parents(splits))
+            if embeddings is None:
+                self.vector_store.add_documents(documents=splits, ids=ids)
+            else:
+                self.vector_store.upsert(
+                    ids=ids,
+                    embeddings=embeddings,
+                    documents=[split.page_content for split in splits],
+                    metadatas=[split.metadata for split in splits]
+                )
+            self.keyword_index.add(splits)
+        self.instrumentation.count("raggy_ingested_chunks_total", len(splits))
+
+    def _delete_chunks(self, ids: List[str]):
+        """Single delete path for chunks, keeps the vector store and the keyword index in sync."""
+        if not ids:
+            return
+        with self._write_lock:
+            self.vector_store.delete(ids=ids)
+            self.keyword_index.remove(ids)
+
+    def _delete_with_parents(self, chunk_ids: Iterable[str]):
+        """Deletes chunks together with their parent passages."""
+        stale_ids = list(chunk_ids)
+        if not stale_ids:
+            return
+        parent_ids = set()
+        for i in range(0, len(stale_ids), 500):
+            data = self.vector_store.get(ids=stale_ids[i:i + 500], include=['metadatas'])
+            parent_ids.update(metadata["parent_id"] for metadata in data["metadatas"]
+                              if metadata and metadata.get("parent_id"))
+        self._delete_chunks(stale_ids)
+        # A child ID covers the ID of its parent, so no chunk of the new version references these parents.
+        if parent_ids:
+            self.docstore.remove(parent_ids)
+
+    def _apply_diff(self, stale_ids: List[str], kept_splits: List[Document]):
+        self._delete_chunks(stale_ids)
+        # Parents of kept children are stored already.
+        _take_parents(kept_splits)
+        # Kept chunks still reference the previous file hash and ingest time.
+        if kept_splits:
+            _stamp_ingest_time(kept_splits)
+            ids = [split.id for split in kept_splits]
+            metadatas = [split.metadata for split in kept_splits]
+            with self._write_lock:
+                self.vector_store.update_metadatas(ids=ids, metadatas=metadatas)
+                self.keyword_index.update_metadatas(ids, metadatas)
+
+    def _embed_and_commit(self, splits: List[Document]):
+        """Embeds the chunks in concurrent batches and writes them to the vector store in one upsert."""
+        texts = [split.page_content for split in splits]
+        batch_size = Config.EMBEDDING_BATCH_SIZE
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        with ThreadPoolExecutor(max_workers=Config.EMBEDDING_MAX_CONCURRENCY) as executor:
+            results = executor.map(
+                lambda batch: retry_with_backoff(
+                    self.embeddings.embed_documents, batch, max_retries=Config.EMBEDDING_MAX_RETRIES
+                ),
+                batches
+            )
+            embeddings = [vector for batch in results for vector in batch]
+        self._write_chunks(splits, embeddings)
+
     def list_pdfs(self) -> List[str]:
         """
         Lists all unique PDF Filenames currently in the database.
+        Served from the document registry, so the cost grows with the number of documents, not chunks.
+        Files whose ingest was interrupted or failed are listed too, their written chunks are retrievable.
         :return: List of PDF names (Strings).
         """
         try:
-            data = self.vector_store.get(include=['metadatas'])
-            metadatas = data.get('metadatas', [])
-            files = set()
-            for meta in metadatas:
-                if meta and "source" in meta:
-                    files.add(meta["source"])
-            return list(files)
+            with self.instrumentation.stage("list_pdfs"):
+                return self.registry.list_sources()
         except Exception as e:
             print(f"Error listing files: {e}")
             return []
 
     def delete_pdf(self, file_name: str):
         """
-        Deletes all chunks associated with a specific filename.
+        Deletes all chunks associated with a specific filename, including the chunks an interrupted or failed
+        add_pdf has written according to its checkpoint.
         """
         try:
-            data = self.vector_store.get(where={"source": file_name})
-            ids_to_delete = data.get('ids', [])
-            if not ids_to_delete:
+            ids_to_delete = self.registry.get_chunk_ids(file_name)
+            checkpoint = self.registry.get_checkpoint(file_name)
+            if not ids_to_delete and checkpoint is None:
                 return -1, "File not found in database."
-            self.vector_store.delete(ids=ids_to_delete)
+            if checkpoint is not None:
+                ids_to_delete = list(dict.fromkeys(ids_to_delete + checkpoint[1]))
+            with self.instrumentation.stage("delete_pdf"):
+                self._delete_chunks(ids_to_delete)
+                self.docstore.prune(file_name)
+                self.registry.remove(file_name)
+                self.registry.clear_checkpoint(file_name)
             return 0, f"Deleted {file_name}."
         except Exception as e:
             return -1, str(e)
 
-    def get_retriever(self):
-        return self.vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 5}
-        )
+    async def aadd_pdf(self, file_path: Union[str, Path], original_filename: str,
+                       progress_callback: Optional[Callable[[int, int], None]] = None):
+        """
+        Async variant of add_pdf. Runs on the bounded ingest executor (Config.ASYNC_INGEST_WORKERS),
+        so concurrent uploads queue up instead of each taking a thread. The progress callback is called from that thread.
+        """
+        return await run_in_ingest_executor(self.add_pdf, file_path, original_filename, progress_callback)
+
+    async def aupsert_pdf(self, file_path: Union[str, Path], original_filename: str):
+        """Async variant of upsert_pdf."""
+        return await run_in_ingest_executor(self.upsert_pdf, file_path, original_filename)
+
+    async def alist_pdfs(self) -> List[str]:
+        """Async variant of list_pdfs."""
+        return await run_in_search_executor(self.list_pdfs)
+
+    async def adelete_pdf(self, file_name: str):
+        """Async variant of delete_pdf."""
+        return await run_in_ingest_executor(self.delete_pdf, file_name)
+
+    def search_by_vectors(self, embeddings: List[List[float]], k: int = 5,
+                          filter: Optional[dict] = None) -> List[List[Document]]:
+        """
+        Runs the similarity search for many query embeddings in a single backend query.
+        In parent-child mode the child hits are mapped to their parent passages.
+        :param filter: Optional where clause on the chunk metadata, see src/retrieval_filter.py.
+        :return: One list of documents per query embedding.
+        """
+        if not embeddings:
+            return []
+        if Config.CHUNKING_MODE != "parent_child":
+            return self.vector_store.query_by_vectors(embeddings, k, filter)
+        from src.parent_docstore import expand_to_parents
+        results = self.vector_store.query_by_vectors(embeddings, k * Config.CHILD_FETCH_MULTIPLIER, filter)
+        return [expand_to_parents(docs, self.docstore, k) for docs in results]
+
+    def corpus_version(self) -> int:
+        """
+        Returns a counter that changes with every add, update or delete of a document.
+        """
+        return self.registry.corpus_version()
+
+    def embedding_cache_stats(self) -> dict:
+        """
+        Returns hit/miss counters of the embedding cache.
+        """
+        return self.embeddings.stats()
+
+    def get_retriever(self, query_expander=None):
+        """
+        Returns the retriever selected by Config.RETRIEVAL_MODE:
+        "similarity" (vector search), "keyword" (local BM25) or "hybrid" (both, fused with RRF).
+        With a QueryExpander the first stage also runs for the rewrites of the query and fuses all rankings.
+        With Config.RERANK_ENABLED it fetches RERANK_FETCH_K candidates and wraps them in a RerankingRetriever.
+        In parent-child mode all stages work on child chunks, which are mapped to RETRIEVAL_K parent passages at the end.
+        The token budget is applied later by the context packer, which can merge overlapping chunks first.
+        Every stage forwards a per-request metadata filter, retriever.invoke(query, filter=where), down to the
+        vector and keyword search (see src/retrieval_filter.py).
+        """
+        from src.hybrid_retriever import HybridRetriever, KeywordRetriever
+        from src.parent_docstore import ParentExpandingRetriever
+        from src.reranker import RerankingRetriever, get_scorer
+        parent_child = Config.CHUNKING_MODE == "parent_child"
+        # Several child hits usually share a parent, so more children are needed for RETRIEVAL_K passages.
+        final_k = Config.RETRIEVAL_K * Config.CHILD_FETCH_MULTIPLIER if parent_child else Config.RETRIEVAL_K
+        k = max(Config.RERANK_FETCH_K, final_k) if Config.RERANK_ENABLED else final_k
+        if Config.RETRIEVAL_MODE == "hybrid":
+            retriever = HybridRetriever(
+                vector_store=self.vector_store,
+                keyword_index=self.keyword_index,
+                k=k,
+                fetch_k=max(Config.HYBRID_FETCH_K, k),
+                vector_weight=Config.HYBRID_VECTOR_WEIGHT,
+                keyword_weight=Config.HYBRID_KEYWORD_WEIGHT,
+                rrf_k=Config.RRF_K
+            )
+        elif Config.RETRIEVAL_MODE == "keyword":
+            retriever = KeywordRetriever(keyword_index=self.keyword_index, k=k)
+        else:
+            retriever = self.vector_store.as_retriever(
+                search_type="similarity",
+                search_kwargs={"k": k}
+            )
+        if query_expander is not None:
+            from src.query_expansion import QueryExpandingRetriever
+            retriever = QueryExpandingRetriever(
+                base_retriever=retriever,
+                expander=query_expander,
+                k=k,
+                rrf_k=Config.RRF_K,
+                original_weight=Config.QUERY_EXPANSION_ORIGINAL_WEIGHT,
+                timeout=Config.QUERY_EXPANSION_TIMEOUT_SECONDS
+            )
+        if Config.RERANK_ENABLED:
+            if self._scorer is None and Config.RERANKER:
+                self._scorer = get_scorer(Config.RERANKER)
+            retriever = RerankingRetriever(
+                base_retriever=retriever,
+                vector_store=self.vector_store,
+                # A keyword-only first stage has not embedded the query, MMR is skipped instead of embedding it.
+                embeddings=None if Config.RETRIEVAL_MODE == "keyword" else self.embeddings,
+                k=final_k,
+                mmr_lambda=Config.MMR_LAMBDA,
+                dedupe_threshold=Config.DEDUPE_THRESHOLD,
+                scorer=self._scorer
+            )
+        if parent_child:
+            retriever = ParentExpandingRetriever(base_retriever=retriever, docstore=self.docstore,
+                                                 k=Config.RETRIEVAL_K)
+        return retriever